@@ -50,6 +50,13 @@ if [ ! -f $category_templates ]; then
   exit 1
 fi
 
+# Compile the semantic templates once, so that they are not parsed again
+# every time that semparse.py is invoked.
+if [ ! -e "${category_templates}.bundle" ] || \
+   [ "$category_templates" -nt "${category_templates}.bundle" ]; then
+  python scripts/compile_templates.py $category_templates
+fi
+
 # This variable contains the name of the dataset (fracas or jsem).
 dataset=$2
 if [ ! -f $dataset ]; then
@@ -53,6 +53,13 @@ if [ ! -f $category_templates ]; then
   exit 1
 fi
 
+# Compile the semantic templates once, so that they are not parsed again
+# every time that semparse.py is invoked.
+if [ ! -e "${category_templates}.bundle" ] || \
+   [ "$category_templates" -nt "${category_templates}.bundle" ]; then
+  python scripts/compile_templates.py $category_templates
+fi
+
 # This variable contains the name of the dataset (fracas or jsem).
 sentences_fname=$1
 sentences_basename=${sentences_fname##*/}
@@ -104,10 +111,12 @@ if [ ! -e "${parsed_dir}/${sentences_basename}.xml" ]; then
     > ${parsed_dir}/${sentences_basename}.xml
 fi
 
-# Semantic parsing the CCG trees in XML.
+# Semantic parsing the CCG trees in XML. If the environment variable
+# SEMPARSE_SOCKET is set to the socket of a running semparse_server.py,
+# templates are not loaded again; otherwise, semparse.py is run.
 if [ ! -e "$parsed_dir/${sentences_basename}.sem.xml" ]; then
   echo "Semantic parsing $parsed_dir/${sentences_basename}.xml"
-  python scripts/semparse.py \
+  python scripts/semparse_client.py \
     $parsed_dir/${sentences_basename}.xml \
     $category_templates \
     $parsed_dir/${sentences_basename}.sem.xml \
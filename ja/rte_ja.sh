@@ -62,6 +62,13 @@ if [ ! -f $category_templates ]; then
   exit 1
 fi
 
+# Compile the semantic templates once, so that they are not parsed again
+# every time that semparse.py is invoked.
+if [ ! -e "${category_templates}.bundle" ] || \
+   [ "$category_templates" -nt "${category_templates}.bundle" ]; then
+  python scripts/compile_templates.py $category_templates
+fi
+
 # These variables contain the names of the directories where intermediate
 # results will be written.
 plain_dir="ja_plain" # tokenized sentences.
@@ -99,10 +106,12 @@ if [ ! -e "${parsed_dir}/${sentences_basename}.xml" ]; then
   cp ${parsed_dir}/${sentences_basename}.jigg.xml ${parsed_dir}/${sentences_basename}.xml
 fi
 
-# Semantic parsing the CCG trees in XML.
+# Semantic parsing the CCG trees in XML. If the environment variable
+# SEMPARSE_SOCKET is set to the socket of a running semparse_server.py,
+# templates are not loaded again; otherwise, semparse.py is run.
 if [ ! -e "$parsed_dir/${sentences_basename}.sem.xml" ]; then
   echo "Semantic parsing $parsed_dir/${sentences_basename}.xml"
-  python scripts/semparse.py \
+  python scripts/semparse_client.py \
     $parsed_dir/${sentences_basename}.xml \
     $category_templates \
     $parsed_dir/${sentences_basename}.sem.xml \
@@ -20,6 +20,7 @@ from coq_analyzer import get_predicate_arguments
 from knowledge import get_lexical_relations_from_preds
 from theorem import insert_axioms_in_coq_script
 from theorem import is_theorem_error
+from theorem import make_coq_script
 from theorem import run_coq_script
 
 def make_axioms_from_premises_and_conclusion(premises, conclusion, coq_output_lines=None):
@@ -98,10 +99,26 @@ def make_axioms_from_coq_analysis(failure_log):
         axioms.update(subgoal_axioms)
     return axioms
 
+def get_debug_result(theorem, axioms):
+    """
+    Returns the result of theorem.prove_debug(axioms). If prove_simple
+    already failed to prove the theorem with these axioms (the theorem or
+    one of its variations), the failure log of its debug tactics is used
+    instead of running them again.
+    """
+    coq_script = make_coq_script(
+        theorem.premises, theorem.conclusion, theorem.dynamic_library_str, axioms)
+    for proved_theorem in [theorem] + theorem.variations:
+        if proved_theorem.coq_script == coq_script \
+           and proved_theorem.inference_result is not None \
+           and proved_theorem.failure_log:
+            return False, proved_theorem.failure_log
+    return theorem.prove_debug(axioms)
+
 def try_abduction(theorem, previous_axioms=None, expected='yes'):
     if previous_axioms is None:
         previous_axioms = set()
-    inference_result, failure_log = theorem.prove_debug(previous_axioms)
+    inference_result, failure_log = get_debug_result(theorem, previous_axioms)
     if inference_result is True:
         abduction_theorem = theorem.copy(new_axioms=previous_axioms)
         return abduction_theorem
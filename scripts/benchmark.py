@@ -0,0 +1,482 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from __future__ import print_function
+
+import argparse
+import copy
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+from lxml import etree
+
+from category import get_category
+from ccg2lambda_tools import assign_semantics_to_ccg
+from ccg2lambda_tools import build_ccg_tree
+from ccg2lambda_tools import SubtreeMemo
+from lambda_reducer import get_reducer
+from lambda_reducer import kReducers
+from normalization import normalize_tokens
+from semantic_index import make_rule_pattern_from_ccg_node
+from semantic_index import SemanticIndex
+
+kScriptsDir = os.path.dirname(os.path.abspath(__file__))
+kRootDir = os.path.dirname(kScriptsDir)
+kDefaultEnTemplates = os.path.join(kRootDir, 'en', 'semantic_templates_en_event.yaml')
+kDefaultJaTemplates = os.path.join(kRootDir, 'ja', 'semantic_templates_ja_emnlp2016.yaml')
+kDefaultJsemDir = os.path.join(kRootDir, 'ja', 'jsem_parsed_gold')
+# Verb categories of the alternative trees of synthetic sentences. All trees
+# of a sentence share the subject, which is what n-best parsers produce
+# for ambiguous predicates.
+kSyntheticVerbFeatures = ('dcl', 'pss', 'ng', 'pt', 'b', 'to', 'adj', 'inv')
+# Metrics that are compared against a baseline (higher is better).
+kThroughputMetrics = ('nodes_per_second', 'sentences_per_second',
+                      'patterns_per_second', 'matches_per_second')
+# Interval (in seconds) between reads of the peak memory of child processes.
+kRssPollSeconds = 0.02
+
+class SyntheticSentenceBuilder(object):
+    """
+    Builds a <sentence> node, in the format of C&C trees converted by
+    ccg2jiggxml.py, whose n-best CCG trees are
+    "the N V", where the noun phrase N has the given depth. If branching is 1,
+    N is a chain of adjectives ("big big ... dog"); if it is 2, N is a
+    balanced coordination of nouns ("dog and dog and ..."), with
+    2 ** depth nouns.
+    """
+
+    def __init__(self, sentence_id, depth=4, branching=1, nbest=1):
+        assert branching in (1, 2), 'Branching should be 1 or 2'
+        self.sentence_id = sentence_id
+        self.depth = depth
+        self.branching = branching
+        self.nbest = nbest
+        self.tokens_node = etree.Element('tokens')
+
+    def build(self):
+        sentence = etree.Element('sentence', id=self.sentence_id)
+        sentence.append(self.tokens_node)
+        det = self.add_token('the', 'DT')
+        noun = self.add_noun_tokens(self.depth)
+        verb = self.add_token('walked', 'VBD')
+        for tree_index in range(self.nbest):
+            self.ccg = etree.SubElement(
+                sentence, 'ccg', id='{0}_ccg{1}'.format(self.sentence_id, tree_index))
+            feature = kSyntheticVerbFeatures[tree_index % len(kSyntheticVerbFeatures)]
+            np = self.add_node('NP', 'fa', [
+                self.add_terminal(det, 'NP[nb=true]/N'),
+                self.add_noun(noun, self.depth)])
+            vp = self.add_terminal(verb, 'S[{0}=true]\\NP'.format(feature))
+            root = self.add_node('S[{0}=true]'.format(feature), 'ba', [np, vp])
+            self.ccg.set('root', root)
+        return sentence
+
+    def add_token(self, surf, pos):
+        token_id = '{0}_{1}'.format(self.sentence_id, len(self.tokens_node))
+        etree.SubElement(
+            self.tokens_node, 'token', id=token_id, surf=surf, base=surf, pos=pos)
+        return token_id
+
+    def add_noun_tokens(self, depth):
+        """
+        Adds the tokens of a noun phrase of the given depth. It returns
+        a nested structure with their ids that mirrors the tree.
+        """
+        if depth == 0:
+            return self.add_token('dog', 'NN')
+        if self.branching == 1:
+            return (self.add_token('big', 'JJ'), self.add_noun_tokens(depth - 1))
+        return (self.add_noun_tokens(depth - 1),
+                self.add_token('and', 'CC'),
+                self.add_noun_tokens(depth - 1))
+
+    def add_noun(self, token_ids, depth):
+        if depth == 0:
+            return self.add_terminal(token_ids, 'N')
+        if self.branching == 1:
+            return self.add_node('N', 'fa', [
+                self.add_terminal(token_ids[0], 'N/N'),
+                self.add_noun(token_ids[1], depth - 1)])
+        conjunct = self.add_node('N\\N', 'conj', [
+            self.add_terminal(token_ids[1], 'conj'),
+            self.add_noun(token_ids[2], depth - 1)])
+        return self.add_node('N', 'ba', [
+            self.add_noun(token_ids[0], depth - 1), conjunct])
+
+    def add_terminal(self, token_id, category):
+        token = self.tokens_node.xpath('./token[@id=$id]', id=token_id)[0]
+        span = self.add_span(category)
+        span.set('terminal', token_id)
+        for name in ('surf', 'base', 'pos'):
+            span.set(name, token.get(name))
+        return span.get('id')
+
+    def add_node(self, category, rule, child_ids):
+        span = self.add_span(category)
+        span.set('rule', rule)
+        span.set('child', ' '.join(child_ids))
+        return span.get('id')
+
+    def add_span(self, category):
+        span_id = '{0}_sp{1}'.format(self.ccg.get('id'), len(self.ccg))
+        return etree.SubElement(self.ccg, 'span', id=span_id, category=category)
+
+def make_synthetic_root(num_sentences, depth=4, branching=1, nbest=1):
+    """
+    Returns a <root> node with one document of synthetic sentences.
+    """
+    root = etree.Element('root')
+    sentences_node = etree.SubElement(
+        etree.SubElement(root, 'document', id='d0'), 'sentences')
+    for i in range(num_sentences):
+        builder = SyntheticSentenceBuilder('s{0}'.format(i), depth, branching, nbest)
+        sentences_node.append(builder.build())
+    return root
+
+def load_documents(filenames):
+    """
+    Returns a <root> node with the documents of all XML files.
+    """
+    parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.Element('root')
+    for filename in filenames:
+        root.extend(etree.parse(filename, parser).getroot().iter('document'))
+    return root
+
+def get_peak_rss_kb():
+    """
+    Returns the peak resident set size of this process, in kilobytes.
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports it in bytes, Linux in kilobytes.
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    return peak_rss
+
+def get_process_peak_rss_kb(pid):
+    """
+    Returns the peak resident set size (in kilobytes) of a running process,
+    or None if it is not available (it is only on Linux).
+    """
+    try:
+        with open('/proc/{0}/status'.format(pid)) as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def wait_process(process):
+    """
+    Waits for a child process to finish, and returns its exit status and
+    peak resident set size in kilobytes. The peak is read while it runs,
+    since the one reported by the kernel on exit also counts the memory of
+    this process, which is copied by fork before the child runs exec.
+    """
+    peak_rss = None
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid != 0:
+            break
+        rss = get_process_peak_rss_kb(process.pid)
+        if rss is not None:
+            peak_rss = max(rss, peak_rss or 0)
+        time.sleep(kRssPollSeconds)
+    process.returncode = status
+    if peak_rss is None:
+        peak_rss = rusage.ru_maxrss
+    return status, peak_rss
+
+def time_runs(function, repeat):
+    """
+    Calls function repeat times, and returns the shortest running time
+    (in seconds) and the value returned by the last call.
+    """
+    best_seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        seconds = time.perf_counter() - start
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    return best_seconds, value
+
+def get_rate(count, seconds):
+    return count / seconds if seconds > 0 else 0.0
+
+def benchmark_assign_semantics(root, semantic_index, nbest=0, repeat=3):
+    """
+    Times assign_semantics_to_ccg on the n-best CCG trees of every sentence
+    (all of them if nbest < 1), sharing subtree semantics across the trees
+    of a sentence as semparse.py does.
+    """
+    sentences = root.findall('.//sentence')
+    def assign():
+        num_nodes, num_failures = 0, 0
+        for sentence in sentences:
+            num_trees = len(sentence.findall('./ccg'))
+            if nbest >= 1:
+                num_trees = min(nbest, num_trees)
+            subtree_memo = SubtreeMemo() if num_trees > 1 else None
+            for tree_index in range(1, num_trees + 1):
+                try:
+                    sem_tree = assign_semantics_to_ccg(
+                        sentence, semantic_index, tree_index, subtree_memo)
+                    num_nodes += len(sem_tree.xpath('.//descendant-or-self::span'))
+                except Exception:
+                    num_failures += 1
+        return num_nodes, num_failures
+    seconds, (num_nodes, num_failures) = time_runs(assign, repeat)
+    return {'seconds' : seconds,
+            'sentences' : len(sentences),
+            'nodes' : num_nodes,
+            'failures' : num_failures,
+            'nodes_per_second' : get_rate(num_nodes, seconds),
+            'sentences_per_second' : get_rate(len(sentences), seconds)}
+
+def get_rule_patterns(root):
+    """
+    Returns the rule patterns of all nodes of all CCG trees.
+    """
+    rule_patterns = []
+    for sentence in root.iter('sentence'):
+        tokens = normalize_tokens(copy.deepcopy(sentence.find('./tokens')))
+        for ccg in sentence.findall('./ccg'):
+            try:
+                ccg_tree = build_ccg_tree(ccg)
+            except Exception:
+                logging.debug('Skipping invalid CCG tree {0}'.format(ccg.get('id')))
+                continue
+            for node in ccg_tree.iter('span'):
+                rule_patterns.append(make_rule_pattern_from_ccg_node(node, tokens))
+    return rule_patterns
+
+def benchmark_get_relevant_rules(root, semantic_index, repeat=3):
+    rule_patterns = get_rule_patterns(root)
+    def match():
+        return sum(len(semantic_index.get_relevant_rules(rule_pattern))
+                   for rule_pattern in rule_patterns)
+    seconds, num_rules = time_runs(match, repeat)
+    return {'seconds' : seconds,
+            'patterns' : len(rule_patterns),
+            'relevant_rules' : num_rules,
+            'patterns_per_second' : get_rate(len(rule_patterns), seconds)}
+
+def benchmark_category_match(root, semantic_index, repeat=3):
+    """
+    Times Category.match (memoized) and Category.match_uncached between
+    the categories of the templates and those of the CCG trees.
+    """
+    template_categories = set(
+        rule.category for rule in semantic_index.rules if rule.category is not None)
+    tree_categories = set(
+        get_category(span.get('category'))
+        for span in root.iter('span') if span.get('category'))
+    pairs = [(template_category, tree_category)
+             for template_category in template_categories
+             for tree_category in tree_categories]
+    results = {'pairs' : len(pairs)}
+    for name in ('match', 'match_uncached'):
+        def match():
+            return sum(1 for c1, c2 in pairs if getattr(c1, name)(c2))
+        seconds, num_matches = time_runs(match, repeat)
+        results[name] = {'seconds' : seconds,
+                         'matches' : num_matches,
+                         'matches_per_second' : get_rate(len(pairs), seconds)}
+    return results
+
+def benchmark_semparse(ccg_fn, templates, ncores=1, nbest=0, reducer='nltk',
+                       repeat=1):
+    """
+    Times full runs of semparse.py in a child process, whose peak
+    resident set size is also reported.
+    """
+    sem_fn = ccg_fn + '.sem.xml'
+    command = [sys.executable, os.path.join(kScriptsDir, 'semparse.py'),
+               ccg_fn, templates, sem_fn, '--ncores', str(ncores),
+               '--nbest', str(nbest), '--reducer', reducer]
+    best_seconds, peak_rss = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(command, stdout=devnull, stderr=devnull)
+            status, rss = wait_process(process)
+        seconds = time.perf_counter() - start
+        if status != 0:
+            raise RuntimeError('Command failed: {0}'.format(' '.join(command)))
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+        peak_rss = max(peak_rss, rss)
+    num_sentences = len(etree.parse(sem_fn).findall('.//sentence'))
+    return {'seconds' : best_seconds,
+            'sentences' : num_sentences,
+            'sentences_per_second' : get_rate(num_sentences, best_seconds),
+            'peak_rss_kb' : peak_rss}
+
+def run_benchmarks(args, directory):
+    """
+    Runs every benchmark on the synthetic trees and on the JSeM trees,
+    and returns their results.
+    """
+    inputs = {}
+    inputs['synthetic_en'] = (
+        make_synthetic_root(
+            args.sentences, args.depth, args.branching, args.nbest),
+        args.en_templates)
+    jsem_filenames = sorted(glob.glob(os.path.join(args.jsem, '*.xml')))
+    if jsem_filenames:
+        inputs['jsem_ja'] = (load_documents(jsem_filenames), args.ja_templates)
+    else:
+        logging.warning('No JSeM files found in {0}'.format(args.jsem))
+
+    results = {}
+    for name, (root, templates) in sorted(inputs.items()):
+        logging.info('Running benchmarks on {0}'.format(name))
+        start = time.perf_counter()
+        semantic_index = SemanticIndex(templates)
+        load_seconds = time.perf_counter() - start
+        semantic_index.reducer = get_reducer(args.reducer)
+        input_results = {
+            'templates' : os.path.relpath(templates, kRootDir),
+            'load_templates_seconds' : load_seconds,
+            'assign_semantics_to_ccg' : benchmark_assign_semantics(
+                root, semantic_index, args.nbest, args.repeat),
+            'get_relevant_rules' : benchmark_get_relevant_rules(
+                root, semantic_index, args.repeat),
+            'category_match' : benchmark_category_match(
+                root, semantic_index, args.repeat)}
+        if not args.skip_semparse:
+            ccg_fn = os.path.join(directory, name + '.xml')
+            etree.ElementTree(root).write(ccg_fn, encoding='utf-8')
+            input_results['semparse'] = benchmark_semparse(
+                ccg_fn, templates, args.ncores, args.nbest, args.reducer)
+        input_results['peak_rss_kb'] = get_peak_rss_kb()
+        results[name] = input_results
+    return results
+
+def get_throughputs(results, prefix=''):
+    """
+    Yields pairs (path, value) for the throughput metrics in nested results,
+    where paths are keys joined by "/".
+    """
+    for key, value in sorted(results.items()):
+        path = prefix + key
+        if isinstance(value, dict):
+            for item in get_throughputs(value, path + '/'):
+                yield item
+        elif key in kThroughputMetrics:
+            yield path, value
+
+def compare_results(results, baseline, tolerance=0.1):
+    """
+    Returns a list of messages, one for every throughput metric in results
+    that is lower than that of baseline by more than tolerance (a ratio).
+    """
+    baseline_throughputs = dict(get_throughputs(baseline))
+    regressions = []
+    for path, value in get_throughputs(results):
+        baseline_value = baseline_throughputs.get(path)
+        if not baseline_value:
+            continue
+        if value < baseline_value * (1.0 - tolerance):
+            regressions.append('{0}: {1:.1f} vs {2:.1f} ({3:+.1%})'.format(
+                path, value, baseline_value, value / baseline_value - 1.0))
+    return regressions
+
+def main(args = None):
+    DESCRIPTION=textwrap.dedent("""\
+            Measures the throughput of semantic composition on synthetic CCG
+            trees and on the JSeM trees in ja/jsem_parsed_gold, and writes
+            the results to a JSON file. If a baseline JSON file is given,
+            throughputs that are lower than the baseline by more than the
+            tolerance are reported, and the exit status is 1.
+      """)
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=DESCRIPTION)
+    parser.add_argument("--output", nargs='?', type=str, default="benchmark.json",
+        help="JSON output filename.")
+    parser.add_argument("--baseline", nargs='?', type=str, default="",
+        help="JSON file of a previous run to compare with.")
+    parser.add_argument("--tolerance", nargs='?', type=float, default=0.1,
+        help="Relative decrease of throughput that is flagged as a regression.")
+    parser.add_argument("--sentences", nargs='?', type=int, default=200,
+        help="Number of synthetic sentences.")
+    parser.add_argument("--depth", nargs='?', type=int, default=4,
+        help="Depth of the noun phrases of synthetic sentences.")
+    parser.add_argument("--branching", nargs='?', type=int, default=1,
+        choices=[1, 2],
+        help="1 for chains of modifiers, 2 for balanced coordinations.")
+    parser.add_argument("--nbest", nargs='?', type=int, default=4,
+        help="Number of CCG trees per sentence (all of them if smaller than 1).")
+    parser.add_argument("--repeat", nargs='?', type=int, default=3,
+        help="Number of runs of each benchmark (the fastest one is reported).")
+    parser.add_argument("--ncores", nargs='?', type=int, default=1,
+        help="Number of cores of semparse.py runs.")
+    parser.add_argument("--reducer", default="nltk", choices=sorted(kReducers))
+    parser.add_argument("--en-templates", default=kDefaultEnTemplates)
+    parser.add_argument("--ja-templates", default=kDefaultJaTemplates)
+    parser.add_argument("--jsem", default=kDefaultJsemDir,
+        help="Directory with the JSeM XML files.")
+    parser.add_argument("--skip-semparse", action="store_true", default=False,
+        help="Do not time full runs of semparse.py.")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    directory = tempfile.mkdtemp()
+    try:
+        results = run_benchmarks(args, directory)
+    finally:
+        shutil.rmtree(directory)
+    report = {
+        'settings' : {
+            'sentences' : args.sentences, 'depth' : args.depth,
+            'branching' : args.branching, 'nbest' : args.nbest,
+            'repeat' : args.repeat, 'ncores' : args.ncores,
+            'reducer' : args.reducer},
+        'platform' : {
+            'python' : platform.python_version(), 'machine' : platform.machine()},
+        'results' : results}
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=2, sort_keys=True)
+    for path, value in get_throughputs(results):
+        print('{0:<60} {1:12.1f}'.format(path, value))
+
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        regressions = compare_results(
+            results, baseline['results'], args.tolerance)
+        for regression in regressions:
+            print('Regression: {0}'.format(regression), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from benchmark import benchmark_assign_semantics
+from benchmark import benchmark_get_relevant_rules
+from benchmark import compare_results
+from benchmark import make_synthetic_root
+from ccg2lambda_tools import build_ccg_tree
+from semantic_index import SemanticIndex
+from semantic_index import SemanticRule
+
+class SyntheticTreesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.semantic_index = SemanticIndex(None)
+        self.semantic_index.rules = [
+            SemanticRule(r'N', r'\x.E(x)'),
+            SemanticRule(r'N/N', r'\F x.(F(x) & E(x))'),
+            SemanticRule(r'N\N', r'\L F1 F2 x.(F1(x) & F2(x))', {'rule' : 'conj'}),
+            SemanticRule(r'NP/N', r'\F G.exists x.(F(x) & G(x))'),
+            SemanticRule(r'S\NP', r'\x.E(x)'),
+            SemanticRule(r'S', r'\Q V.Q(V)', {'rule' : 'ba'})]
+
+    def test_chain(self):
+        root = make_synthetic_root(3, depth=4, branching=1, nbest=2)
+        sentences = root.findall('.//sentence')
+        self.assertEqual(3, len(sentences))
+        for sentence in sentences:
+            ccgs = sentence.findall('./ccg')
+            self.assertEqual(2, len(ccgs))
+            ccg_tree = build_ccg_tree(ccgs[0])
+            self.assertEqual(2 * 4 + 5, len(list(ccg_tree.iter('span'))))
+            self.assertEqual(4 + 3, len(sentence.findall('./tokens/token')))
+
+    def test_coordination(self):
+        root = make_synthetic_root(1, depth=3, branching=2, nbest=1)
+        ccg_tree = build_ccg_tree(root.find('.//ccg'))
+        self.assertEqual(2 ** (3 + 2) - 3 + 4, len(list(ccg_tree.iter('span'))))
+        surfs = [t.get('surf') for t in root.iterfind('.//token')]
+        self.assertEqual(2 ** 3, surfs.count('dog'))
+
+    def test_assign_semantics(self):
+        root = make_synthetic_root(2, depth=2, branching=2, nbest=3)
+        results = benchmark_assign_semantics(
+            root, self.semantic_index, nbest=0, repeat=1)
+        self.assertEqual(0, results['failures'])
+        self.assertEqual(2, results['sentences'])
+        self.assertEqual(2 * 3 * (2 ** (2 + 2) - 3 + 4), results['nodes'])
+        self.assertGreater(results['nodes_per_second'], 0)
+
+    def test_get_relevant_rules(self):
+        root = make_synthetic_root(1, depth=2, branching=1, nbest=1)
+        results = benchmark_get_relevant_rules(root, self.semantic_index, repeat=1)
+        self.assertEqual(2 * 2 + 5, results['patterns'])
+        self.assertGreater(results['relevant_rules'], 0)
+
+class CompareResultsTestCase(unittest.TestCase):
+    def test_regressions(self):
+        baseline = {'en' : {'semparse' : {'sentences_per_second' : 100.0,
+                                          'seconds' : 1.0},
+                            'get_relevant_rules' : {'patterns_per_second' : 10.0}}}
+        results = {'en' : {'semparse' : {'sentences_per_second' : 80.0,
+                                         'seconds' : 2.0},
+                           'get_relevant_rules' : {'patterns_per_second' : 9.5}}}
+        regressions = compare_results(results, baseline, tolerance=0.1)
+        self.assertEqual(1, len(regressions))
+        self.assertTrue(regressions[0].startswith('en/semparse/sentences_per_second'))
+
+    def test_new_metrics(self):
+        results = {'ja' : {'semparse' : {'sentences_per_second' : 1.0}}}
+        self.assertEqual([], compare_results(results, {}, tolerance=0.1))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(SyntheticTreesTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(CompareResultsTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -14,49 +14,132 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from nltk import FeatStruct
+from functools import lru_cache
 import re
 
+# Maximum number of (template category, node category) pairs
+# whose match result is memoized.
+kMatchCacheSize = 65536
+# Interned categories, indexed by their string representation.
+kCategories = {}
+# Bit position of each (attribute, value) feature pair. Feature structures
+# are represented as bitmasks over this vocabulary, so that subsumption
+# becomes an integer operation.
+kFeatureVocabulary = {}
+
 class Category(object):
-    """ Implements a CCG syntactic category with features. """
+    """
+    Implements a CCG syntactic category with features.
+    Categories are immutable. Use get_category to obtain the instance
+    shared by all occurrences of the same category string.
+    """
+
+    __slots__ = ('category', 'types', 'type_features', 'types_regex')
 
     def __init__(self, category):
         if isinstance(category, self.__class__):
-            self.types = category.types
-            self.type_features = category.type_features
+            values = (category.category, category.types,
+                      category.type_features, category.types_regex)
         else:
-            self.types = remove_feats_from_category(category)
-            self.type_features = get_feats_from_category(category)
+            types = remove_feats_from_category(category)
+            type_features = tuple(get_feature_mask(feature)
+                                  for feature in get_feats_from_category(category))
+            # The regular expression is only compiled when it is first
+            # needed, since most categories of templates are never matched.
+            values = (category, types, type_features, None)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Category objects are immutable')
+
+    def __reduce__(self):
+        return (get_category, (self.category,))
 
     def __repr__(self):
-        return "Types: {0}\tFeats: {1}".format(self.types, self.type_features)
+        feats = [dict(get_features_from_mask(mask)) for mask in self.type_features]
+        return "Types: {0}\tFeats: {1}".format(self.types, feats)
 
     def match(self, other):
+        if not isinstance(other, self.__class__):
+            return False
+        return match_categories(self.category, other.category)
+
+    def match_uncached(self, other):
         if not isinstance(other, self.__class__):
             return False
         if len(self.type_features) != len(other.type_features):
             return False
-        # TODO: Ideally these substitutions should be precomputed for speed-up.
-        types = re.sub(r'\\', r'\\\\', self.types)
-        types = types.replace('|', '[/\\\]')
-        types = types.replace('(', '\\(').replace(')', '\\)')
-        if not re.fullmatch(types, other.types):
+        if not self.get_types_regex().fullmatch(other.types):
             return False
-        return all([a.subsumes(b)
+        # Features of self subsume features of other if they are a subset.
+        return all([a & b == a
                     for (a, b) in zip(self.type_features, other.type_features)])
 
-    def match_(self, other):
-        return isinstance(other, self.__class__) \
-          and len(self.type_features) == len(other.type_features) \
-          and re.fullmatch(re.sub(r'\\', r'\\\\', self.types), other.types) \
-          and all([a.subsumes(b) \
-                   for (a, b) in zip(self.type_features, other.type_features)])
+    def get_types_regex(self):
+        types_regex = self.types_regex
+        if types_regex is None:
+            types_regex = compile_types_regex(self.types)
+            object.__setattr__(self, 'types_regex', types_regex)
+        return types_regex
 
     def get_num_args(self):
         return len(self.type_features) - 1
 
+def get_category(category):
+    """
+    Returns the interned Category for the category string "category".
+    """
+    if isinstance(category, Category):
+        return category
+    interned = kCategories.get(category)
+    if interned is None:
+        interned = kCategories.setdefault(category, Category(category))
+    return interned
+
+@lru_cache(maxsize=kMatchCacheSize)
+def match_categories(src_category, trg_category):
+    """
+    Returns True if the category string src_category (e.g. from a semantic
+    template) matches the category string trg_category (e.g. from a CCG node).
+    Results are memoized, since the same categories are compared over and over.
+    """
+    return get_category(src_category).match_uncached(get_category(trg_category))
+
+def get_feature_mask(feature):
+    """
+    Returns the bitmask of a set of (attribute, value) feature pairs.
+    """
+    mask = 0
+    for attribute_value in feature:
+        bit = kFeatureVocabulary.get(attribute_value)
+        if bit is None:
+            bit = kFeatureVocabulary.setdefault(
+                attribute_value, len(kFeatureVocabulary))
+        mask |= 1 << bit
+    return mask
+
+def get_features_from_mask(mask):
+    """
+    Returns the sorted (attribute, value) feature pairs of a bitmask.
+    """
+    return sorted(attribute_value
+                  for attribute_value, bit in kFeatureVocabulary.items()
+                  if mask >> bit & 1)
+
+def compile_types_regex(types):
+    r""" Returns the regular expression that matches the feature-less category
+    "types", where the vertical bar is a wildcard for any slash direction.
+    types="(NP/NP)|NP" --> regex="\(NP/NP\)[/\\]NP"
+    """
+    types_regex = types.replace('\\', '\\\\')
+    types_regex = types_regex.replace('|', r'[/\\]')
+    types_regex = types_regex.replace('(', r'\(').replace(')', r'\)')
+    return re.compile(types_regex)
+
 def get_feats_from_category(category):
-    r""" Returns the features of the syntactic category.
+    r""" Returns the features of the syntactic category, as frozen sets
+    of (attribute, value) pairs.
     category="S[mod=nm,form=base]" --> feats=['[mod=nm,form=base]']
     category="(S/S)\NP[mod=nm,case=nc]" --> feats=['', '', '[mod=nm,case=nc]']
     category="S[mod=nm,form=base]\NP[mod=nm,case=nc]" -->
@@ -65,15 +148,12 @@ def get_feats_from_category(category):
     feature_strings = re.findall(r'\w+(\[.+?\])*', category)
     features = []
     for feature_str in feature_strings:
-        if feature_str == '':
-            feature = FeatStruct({})
-        else:
-            attribute_value_dict = {}
+        attribute_value_dict = {}
+        if feature_str != '':
             for attribute_value in feature_str.strip('[]').split(','):
                 [attribute, value] = attribute_value.split('=')
                 attribute_value_dict[attribute] = value
-            feature = FeatStruct(attribute_value_dict)
-        features.append(feature)
+        features.append(frozenset(attribute_value_dict.items()))
     return features
 
 def remove_feats_from_category(category):
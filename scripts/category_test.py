@@ -17,7 +17,11 @@
 
 import unittest
 
+import pickle
+
 from category import Category
+from category import get_category
+from category import match_categories
 
 class CategoryTestCase(unittest.TestCase):
     def test_category_matches(self):
@@ -104,6 +108,45 @@ class CategoryTestCase(unittest.TestCase):
         cat2 =  Category('(NP/NP)\\NP')
         self.assertTrue(cat1.match(cat2))
 
+    def test_copy_matches(self):
+        cat1 =  Category('(NP/NP)|NP')
+        cat2 =  Category(Category('(NP/NP)\\NP[case=ga]'))
+        self.assertTrue(cat1.match(cat2))
+
+    def test_match_category_strings(self):
+        self.assertTrue(match_categories('NP|NP', 'NP\\NP[case=ga]'))
+        self.assertFalse(match_categories('NP|NP[case=ga]', 'NP\\NP'))
+
+    def test_match_cached(self):
+        match_categories.cache_clear()
+        cat1 =  Category('S[dcl=true]\\NP')
+        cat2 =  Category('S[dcl=true]\\NP')
+        self.assertTrue(cat1.match(cat2))
+        self.assertTrue(cat1.match(cat2))
+        self.assertEqual(1, match_categories.cache_info().hits)
+        self.assertEqual(1, match_categories.cache_info().misses)
+
+    def test_interned(self):
+        cat1 = get_category('S[dcl=true]\\NP')
+        cat2 = get_category('S[dcl=true]\\NP')
+        self.assertIs(cat1, cat2)
+        self.assertIs(cat1, get_category(cat1))
+
+    def test_interned_pickle(self):
+        cat1 = get_category('S[dcl=true]\\NP')
+        self.assertIs(cat1, pickle.loads(pickle.dumps(cat1)))
+
+    def test_immutable(self):
+        cat1 = get_category('NP')
+        with self.assertRaises(AttributeError):
+            cat1.types = 'S'
+
+    def test_multiple_feat_subsume(self):
+        cat1 =  Category('N[dcl=true,pss=false]')
+        cat2 =  Category('N[pss=false,adj=true,dcl=true]')
+        self.assertTrue(cat1.match_uncached(cat2))
+        self.assertFalse(cat2.match_uncached(cat1))
+
 
 if __name__ == '__main__':
     suite1 = unittest.TestLoader().loadTestsFromTestCase(CategoryTestCase)
@@ -19,61 +19,104 @@ import re
 import simplejson
 
 from lxml import etree
+from nltk.sem.logic import ApplicationExpression
+from nltk.sem.logic import BinaryExpression
 from nltk.sem.logic import ConstantExpression
+from nltk.sem.logic import FunctionVariableExpression
+from nltk.sem.logic import LambdaExpression
+from nltk.sem.logic import NegatedExpression
+from nltk.sem.logic import VariableBinderExpression
 
+from lambda_reducer import compose_functions
+from lambda_reducer import type_raise
 from logic_parser import lexpr
-from normalization import normalize_token
-import semantic_index
+from normalization import normalize_tokens
+from profiling import span
+from semantic_index import get_nodes_by_id
 
 def build_ccg_tree(ccg_xml, root_id=None):
     """
     This function re-arranges the nodes of the XML CCG tree to have
     a tree structure. It will be useful to traverse the tree.
+    Spans of ccg_xml are copied, so that ccg_xml is not modified.
     """
     if ccg_xml == None or len(ccg_xml) == 0:
         return None
     if root_id == None:
         root_id = ccg_xml.get('root')
-    root_span = copy.deepcopy(semantic_index.find_node_by_id(root_id, ccg_xml))
+    spans_by_id = get_nodes_by_id(ccg_xml)
+    return build_ccg_subtree(spans_by_id, root_id)
+
+def build_ccg_subtree(spans_by_id, root_id):
+    if root_id not in spans_by_id:
+        raise(ValueError('It should have found a span for id {0}'.format(root_id)))
+    root_span = copy.deepcopy(spans_by_id[root_id])
     if 'child' not in root_span.attrib:
         return root_span
     children_id = root_span.get('child').split()
     for child_id in children_id:
-        child_node = build_ccg_tree(ccg_xml, child_id)
-        if child_node != None:
-            root_span.append(child_node)
+        root_span.append(build_ccg_subtree(spans_by_id, child_id))
     return root_span
 
-def normalize_tokens(tokens):
-    """
-    In our format of XML trees, tokens have their own tree,
-    which is separated from the syntactic structure. These
-    tokens may need some processing for normalization, such
-    as prefixing them with an underscore "_", or copying
-    into their base form the surface form when the base form
-    is absent (base="*"). For now, only the copy to base forms
-    from surface forms is implemented:
-    """
-    for token in tokens:
-        if token.get('base', None) == '*':
-            token.set('base', token.get('surf', '*'))
-        if 'base' in token.attrib and not token.get('base', '').startswith('_'):
-            base = token.get('base', '')
-            base_normalized = normalize_token(base)
-            token.set('base', base_normalized)
-        if 'surf' in token.attrib and not token.get('surf', '').startswith('_'):
-            surf = token.get('surf', '')
-            surf_normalized = normalize_token(surf)
-            token.set('surf', surf_normalized)
-    return tokens
-
-def assign_semantics_to_ccg(ccg_xml, semantic_index, tree_index=1):
+# Span attributes that do not take part in the signature of a subtree,
+# since they differ between the n-best CCG trees of a sentence.
+kUnsignedAttributes = ('id', 'child', 'coq_type', 'sem')
+
+class SubtreeMemo(object):
+    """
+    Semantics and coq types of the CCG subtrees of a sentence, so that
+    subtrees that are shared by several (e.g. n-best) CCG trees of that
+    sentence are composed only once. Subtrees are identified by their
+    signature, made of the attributes of their root span (token span,
+    category, rule, etc.) and the signatures of their children.
+    A memo must only be shared by trees of the same sentence (tokens)
+    that are composed with the same semantic index.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        # String representations of semantics, keyed by the id of the
+        # semantics (that are kept alive by self.entries).
+        self.strings = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'SubtreeMemo(hits={0}, misses={1})'.format(self.hits, self.misses)
+
+    def get(self, signature):
+        entry = self.entries.get(signature)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, signature, semantics, coq_type):
+        self.entries[signature] = (semantics, coq_type)
+
+    def to_string(self, semantics, reducer):
+        semantics_string = self.strings.get(id(semantics))
+        if semantics_string is None:
+            semantics_string = reducer.to_string(semantics)
+            self.strings[id(semantics)] = semantics_string
+        return semantics_string
+
+def get_subtree_signature(ccg_tree, child_signatures):
+    attributes = tuple(sorted(
+        (name, value) for name, value in ccg_tree.attrib.items()
+        if name not in kUnsignedAttributes))
+    return (attributes, child_signatures)
+
+def assign_semantics_to_ccg(ccg_xml, semantic_index, tree_index=1,
+                            subtree_memo=None):
     """
     This is the key function. It builds first an XML tree structure with
     the CCG tree, and then assigns semantics (lambda expressions) to each node
     in post-order (first assigns semantics to children, and then to node).
     It returns a CCG lxml tree structure with a new 'sem' field that
     contains the semantics at each node.
+    If given, subtree_memo is a SubtreeMemo shared by the CCG trees of ccg_xml.
     """
     # If the use of gold trees is requested, we get the gold tree index
     # from the XML attribute 'gold_tree'. Note that in xpath, lists are
@@ -87,12 +130,13 @@ def assign_semantics_to_ccg(ccg_xml, semantic_index, tree_index=1):
                 ccg_xml,
                 encoding='utf-8',
                 pretty_print=True).decode('utf-8')))
-    ccg_flat_tree = copy.deepcopy(ccg_flat_trees[0])
-    #   ccg_xml.xpath('./ccg[{0}]'.format(tree_index))[0])
-    ccg_tree = build_ccg_tree(ccg_flat_tree)
-    tokens = copy.deepcopy(ccg_xml.find('.//tokens'))
-    tokens = normalize_tokens(tokens)
-    assign_semantics(ccg_tree, semantic_index, tokens)
+    with span('tree_building'):
+        # build_ccg_tree copies the spans, so the flat tree is not modified.
+        ccg_tree = build_ccg_tree(ccg_flat_trees[0])
+        tokens = copy.deepcopy(ccg_xml.find('.//tokens'))
+        tokens = normalize_tokens(tokens)
+    with span('composition'):
+        assign_semantics(ccg_tree, semantic_index, tokens, subtree_memo)
     return ccg_tree
 
 def is_forward_operation(ccg_tree):
@@ -121,28 +165,8 @@ def get_num_args(ccg_tree):
         num_args = 3
     return num_args
 
-def type_raise(function, order = 1):
-    """
-    Produce a higher order function based on "function". The argument "order"
-    indicates the number of desired arguments of the new function.
-    """
-    assert order >= 0, 'The order of the type-raising should be >= 0'
-    if isinstance(function, ConstantExpression):
-        type_raiser = lexpr(r'\P X.P(X)')
-        type_raised_function = type_raiser(function).simplify()
-    else:
-        if order == 1:
-            type_raiser = lexpr(r'\P0 P1 X0.P0(P1(X0))')
-        elif order == 2:
-            type_raiser = lexpr(r'\P0 P1 X0 X1.P0(P1(X0, X1))')
-        elif order == 3:
-            type_raiser = lexpr(r'\P0 P1 X0 X1 X2.P0(P1(X0, X1, X2))')
-        else:
-            assert False, 'Type-raising at order > 3 is not supported'
-        type_raised_function = type_raiser(function).simplify()
-    return type_raised_function
-
-def combine_children_exprs(ccg_tree, tokens, semantic_index):
+def combine_children_exprs(ccg_tree, tokens, semantic_index, node_semantics,
+                           node_attributes=None):
     """
     Perform forward/backward function application/combination.
     """
@@ -159,46 +183,179 @@ def combine_children_exprs(ccg_tree, tokens, semantic_index):
     else:
         coq_types = coq_types_right
     ccg_tree.set('coq_type', coq_types)
-    semantics = semantic_index.get_semantic_representation(ccg_tree, tokens)
-    if semantics:
-        ccg_tree.set('sem', str(semantics))
+    semantics = semantic_index.get_semantic_representation(
+        ccg_tree, tokens, node_semantics, node_attributes)
+    if semantics is not None:
+        node_semantics[ccg_tree] = semantics
         return None
     # Back-off mechanism in case no semantic templates are available:
     if is_forward_operation(ccg_tree):
         function_index, argument_index = 0, 1
     else:
         function_index, argument_index = 1, 0
-    function = lexpr(ccg_tree[function_index].attrib['sem'])
-    argument = lexpr(ccg_tree[argument_index].attrib['sem'])
+    function = node_semantics[ccg_tree[function_index]]
+    argument = node_semantics[ccg_tree[argument_index]]
+    reducer = semantic_index.reducer
     combination_operation = get_combination_op(ccg_tree)
     if combination_operation == 'function_application':
-        evaluation = function(argument).simplify()
+        with span('beta_reduction'):
+            evaluation = reducer.apply(function, argument)
     elif combination_operation == 'function_combination':
         num_arguments = get_num_args(ccg_tree)
-        type_raised_function = type_raise(function, num_arguments)
-        evaluation = type_raised_function(argument).simplify()
+        with span('beta_reduction'):
+            evaluation = reducer.compose(function, argument, num_arguments)
     else:
         assert False, 'This node should be a function application or combination'\
                       .format(etree.tostring(ccg_tree, pretty_print=True))
-    ccg_tree.set('sem', str(evaluation))
+    node_semantics[ccg_tree] = evaluation
     return None
 
-def assign_semantics(ccg_tree, semantic_index, tokens):
+def assign_semantics(ccg_tree, semantic_index, tokens, subtree_memo=None):
     """
     Visit recursively the CCG tree in depth-first order, assigning lambda expressions
     (semantics) to each node.
+    Expressions are kept in a side table while they are composed, and they
+    are only converted into strings (the 'sem' attribute) at the end.
+    They are terms of the reducer of semantic_index (see lambda_reducer.py).
+    ccg_tree is an lxml tree or a tree of CCGNode objects (see ccg_tree.py),
+    and tokens the <tokens> node or a dictionary that maps IDs to tokens.
+    If the semantics of a node other than the root cannot be read back by
+    nltk (see is_readable), the tree is composed again by parsing the 'sem'
+    string of each child (see ParsedSemantics), which might fail or produce
+    a different formula.
+    """
+    node_semantics = {}
+    node_attributes = {}
+    if isinstance(tokens, dict):
+        tokens_by_id = tokens
+    else:
+        tokens_by_id = get_nodes_by_id(tokens)
+    compose_semantics(
+        ccg_tree, semantic_index, tokens_by_id, node_semantics, node_attributes,
+        subtree_memo)
+    reducer = semantic_index.reducer
+    with span('formula_check'):
+        checked = set()
+        readable = all(is_readable(reducer.to_expression(semantics), checked)
+                       for node, semantics in node_semantics.items()
+                       if node is not ccg_tree)
+    if not readable:
+        node_semantics = ParsedSemantics(reducer)
+        subtree_memo = None
+        with span('parsed_composition'):
+            compose_semantics(
+                ccg_tree, semantic_index, tokens_by_id, node_semantics, {})
+    with span('to_string'):
+        for node, semantics in node_semantics.items():
+            if subtree_memo is None:
+                node.set('sem', reducer.to_string(semantics))
+            else:
+                node.set('sem', subtree_memo.to_string(semantics, reducer))
+    return
+
+def is_readable(expression, checked=None):
+    """
+    Returns False if nltk would not parse the string of the nltk expression
+    back into the same expression, because it applies a function that is not
+    a lambda expression, an application, a function variable or a constant
+    (e.g. a conjunction). Such strings cannot be parsed, or are parsed with
+    a different structure. checked is the set of ids of the subexpressions
+    that are known to be readable.
+    """
+    if checked is None:
+        checked = set()
+    if id(expression) in checked:
+        return True
+    if isinstance(expression, ApplicationExpression):
+        function = expression.function
+        readable = isinstance(function, (
+            LambdaExpression, ApplicationExpression, FunctionVariableExpression,
+            ConstantExpression)) \
+            and is_readable(function, checked) \
+            and is_readable(expression.argument, checked)
+    elif isinstance(expression, (VariableBinderExpression, NegatedExpression)):
+        readable = is_readable(expression.term, checked)
+    elif isinstance(expression, BinaryExpression):
+        readable = is_readable(expression.first, checked) \
+            and is_readable(expression.second, checked)
+    else:
+        readable = True
+    if readable:
+        checked.add(id(expression))
+    return readable
+
+class ParsedSemantics(dict):
+    """
+    Side table of semantics of CCG nodes, whose values are printed and parsed
+    back with lexpr when they are read, as if each parent parsed the 'sem'
+    attribute of its children. It is slower than a plain dictionary, and it
+    is only used for trees with semantics that nltk does not read back as
+    they were composed (see is_readable).
+    """
+
+    def __init__(self, reducer):
+        super(ParsedSemantics, self).__init__()
+        self.reducer = reducer
+
+    def __getitem__(self, node):
+        semantics = super(ParsedSemantics, self).__getitem__(node)
+        return self.reducer.from_expression(
+            lexpr(self.reducer.to_string(semantics)))
+
+def compose_semantics(ccg_tree, semantic_index, tokens, node_semantics,
+                      node_attributes=None, subtree_memo=None):
+    """
+    Visit recursively the CCG tree in depth-first order, storing in
+    node_semantics the lambda expression of each node.
+    If subtree_memo is given, it returns the signature of ccg_tree, and
+    subtrees whose semantics are in subtree_memo are not composed again.
+    """
+    if subtree_memo is None:
+        compose_node_semantics(
+            ccg_tree, semantic_index, tokens, node_semantics, node_attributes)
+        return None
+    child_signatures = tuple(
+        compose_semantics(child, semantic_index, tokens, node_semantics,
+                          node_attributes, subtree_memo)
+        for child in ccg_tree)
+    signature = get_subtree_signature(ccg_tree, child_signatures)
+    entry = subtree_memo.get(signature)
+    if entry is None:
+        compose_node_semantics(
+            ccg_tree, semantic_index, tokens, node_semantics, node_attributes,
+            compose_children=False)
+        subtree_memo.put(
+            signature, node_semantics[ccg_tree], ccg_tree.get('coq_type'))
+    else:
+        semantics, coq_type = entry
+        node_semantics[ccg_tree] = semantics
+        if coq_type is not None:
+            ccg_tree.set('coq_type', coq_type)
+    return signature
+
+def compose_node_semantics(ccg_tree, semantic_index, tokens, node_semantics,
+                           node_attributes=None, compose_children=True):
+    """
+    Stores in node_semantics the lambda expression of ccg_tree, after those
+    of its children, unless compose_children is False (they are already
+    composed).
     """
-    category = ccg_tree.attrib['category']
     if len(ccg_tree) == 0:
-        semantics = semantic_index.get_semantic_representation(ccg_tree, tokens)
-        ccg_tree.set('sem', str(semantics))
+        node_semantics[ccg_tree] = semantic_index.get_semantic_representation(
+            ccg_tree, tokens, node_semantics, node_attributes)
         return
     if len(ccg_tree) == 1:
-        assign_semantics(ccg_tree[0], semantic_index, tokens)
-        semantics = semantic_index.get_semantic_representation(ccg_tree, tokens)
-        ccg_tree.set('sem', str(semantics))
+        if compose_children:
+            compose_node_semantics(
+                ccg_tree[0], semantic_index, tokens, node_semantics,
+                node_attributes)
+        node_semantics[ccg_tree] = semantic_index.get_semantic_representation(
+            ccg_tree, tokens, node_semantics, node_attributes)
         return
-    for child in ccg_tree:
-        assign_semantics(child, semantic_index, tokens)
-    combine_children_exprs(ccg_tree, tokens, semantic_index)
+    if compose_children:
+        for child in ccg_tree:
+            compose_node_semantics(
+                child, semantic_index, tokens, node_semantics, node_attributes)
+    combine_children_exprs(
+        ccg_tree, tokens, semantic_index, node_semantics, node_attributes)
     return
@@ -19,11 +19,15 @@ import unittest
 
 from lxml import etree
 from nltk.sem.logic import Expression
+from nltk.sem.logic import LogicalExpressionException
 
-from ccg2lambda_tools import (assign_semantics_to_ccg, type_raise, build_ccg_tree)
+from ccg2lambda_tools import (assign_semantics_to_ccg, type_raise, build_ccg_tree,
+                              compose_functions, SubtreeMemo)
+from lambda_reducer import FastReducer
 from logic_parser import lexpr
 from semantic_index import (SemanticRule, SemanticIndex,
-                            get_attributes_from_ccg_node_recursively, find_node_by_id)
+                            get_attributes_from_ccg_node_recursively, find_node_by_id,
+                            get_nodes_by_id)
 
 class TypeRaiseTestCase(unittest.TestCase):
     def test_const_expr_raised1(self):
@@ -47,6 +51,37 @@ class TypeRaiseTestCase(unittest.TestCase):
         expected_raised_expr = lexpr(r'\P Q x.nice(P(Q, x))')
         self.assertEqual(expected_raised_expr, raised_expr)
 
+    def test_type_raise_unsupported_order(self):
+        expr = lexpr(r'\x.nice(x)')
+        with self.assertRaises(AssertionError):
+            type_raise(expr, 4)
+
+class ComposeFunctionsTestCase(unittest.TestCase):
+    def assert_composition(self, function_str, argument_str, order, expected_str):
+        function, argument = lexpr(function_str), lexpr(argument_str)
+        composition = compose_functions(function, argument, order)
+        expected = type_raise(function, order)(argument).simplify()
+        self.assertEqual(expected, composition)
+        self.assertEqual(lexpr(expected_str), composition)
+        return composition
+
+    def test_compose1(self):
+        composition = self.assert_composition(
+            r'\x.nice(x)', r'\y.dog(y)', 1, r'\X0.nice(dog(X0))')
+        self.assertEqual(r'\X0.nice(dog(X0))', str(composition))
+
+    def test_compose2(self):
+        self.assert_composition(
+            r'\x.nice(x)', r'\y z.see(y, z)', 2, r'\X0 X1.nice(see(X0, X1))')
+
+    def test_compose_constant(self):
+        self.assert_composition(
+            r'nice', r'\y.dog(y)', 1, r'nice(\y.dog(y))')
+
+    def test_compose_free_variable(self):
+        self.assert_composition(
+            r'\x.nice(x, X0)', r'\y.dog(y)', 1, r'\X1.nice(dog(X1), X0)')
+
 class AssignSemanticsToCCGTestCase(unittest.TestCase):
     def setUp(self):
         self.semantic_index = SemanticIndex(None)
@@ -168,6 +203,32 @@ class AssignSemanticsToCCGTestCase(unittest.TestCase):
         expected_semantics = lexpr(r'\x.(_言語(x) & _良い(x))')
         self.assertEqual(expected_semantics, lexpr(semantics))
 
+    def test_sem_assigned_to_all_nodes(self):
+        sentence_str = r"""
+      <sentence id="s0">
+        <tokens>
+          <token base="良い" katsuyou="基本形" pos="形容詞-自立" surf="良い" id="t0_2"/>
+          <token base="言語" pos="名詞-一般" surf="言語" id="t0_3"/>
+        </tokens>
+        <ccg root="sp0-6">
+          <span child="sp0-7 sp0-9" rule="&gt;" category="NP[mod=nm,case=nc]" end="4" begin="2" id="sp0-6"/>
+          <span child="sp0-8" rule="ADN" category="NP[case=nc]/NP[case=nc]" end="3" begin="2" id="sp0-7"/>
+          <span terminal="t0_2" category="S[mod=adn,form=base]" end="3" begin="2" id="sp0-8"/>
+          <span terminal="t0_3" category="NP[mod=nm,case=nc]" end="4" begin="3" id="sp0-9"/>
+        </ccg>
+      </sentence>
+    """
+        sentence = etree.fromstring(sentence_str)
+        ccg_tree = assign_semantics_to_ccg(sentence, self.semantic_index)
+        expected_semantics = {
+            'sp0-6' : lexpr(r'\x.(_言語(x) & _良い(x))'),
+            'sp0-7' : lexpr(r'\Q x.(Q(x) & _良い(x))'),
+            'sp0-8' : lexpr(r'_良い'),
+            'sp0-9' : lexpr(r'_言語')}
+        for node in ccg_tree.iter('span'):
+            self.assertEqual(expected_semantics[node.get('id')],
+                             lexpr(node.get('sem')))
+
     def test_func_application_backward(self):
         # 'は' has category (S/S)\NP[mod=nm,case=nc] which is not in the
         # unittest semantic templates. Thus, it is assigned the default
@@ -943,6 +1004,79 @@ class get_attributes_from_ccg_node_recursivelyTestCase(unittest.TestCase):
         for k in expected_attributes:
             self.assertEqual(expected_attributes.get(k, None), attributes.get(k, None))
 
+    def test_side_table_and_tokens_by_id(self):
+        sentence_str = r"""
+      <sentence id="s1">
+        <tokens>
+          <token surf="surf1" id="t1_1"/>
+          <token surf="surf2" id="t1_2"/>
+        </tokens>
+        <ccg root="sp1-5">
+          <span terminal="t1_1" category="cat1" id="sp1-1"/>
+          <span terminal="t1_2" category="cat2" id="sp1-2"/>
+          <span child="sp1-1" rule="lex1" category="NP1" id="sp1-3"/>
+          <span child="sp1-2" rule="lex2" category="NP2" id="sp1-4"/>
+          <span child="sp1-3 sp1-4" rule="rr" category="NPP" id="sp1-5"/>
+        </ccg>
+      </sentence>
+    """
+        sentence = etree.fromstring(sentence_str)
+        ccg_root = build_ccg_tree(sentence.find("ccg"))
+        tokens = get_nodes_by_id(sentence.find("tokens"))
+        node_attributes = {}
+        get_attributes_from_ccg_node_recursively(
+            ccg_root[1], tokens, node_attributes)
+        # Attributes set after a node was visited are still visible.
+        ccg_root[1].set('coq_type', 'Entity')
+        attributes = get_attributes_from_ccg_node_recursively(
+            ccg_root, tokens, node_attributes)
+        self.assertEqual('surf2', attributes['child1_child0_surf'])
+        self.assertEqual('sp1-2', attributes['child1_child0_id'])
+        self.assertEqual('Entity', attributes['child1_coq_type'])
+        self.assertEqual('surf1', attributes['child0_child0_surf'])
+        self.assertEqual(4, len(node_attributes[ccg_root[1]]))
+        # CCG nodes are not modified.
+        self.assertNotIn('surf', ccg_root[1][0].attrib)
+        self.assertNotIn('child0_id', ccg_root.attrib)
+
+class BuildCCGTreeTestCase(unittest.TestCase):
+    def setUp(self):
+        sentence_str = r"""
+      <sentence id="s1">
+        <ccg root="sp1-5" id="s1_ccg0">
+          <span terminal="t1_1" category="cat1" id="sp1-1"/>
+          <span terminal="t1_2" category="cat2" id="sp1-2"/>
+          <span child="sp1-1" rule="lex1" category="NP1" id="sp1-3"/>
+          <span child="sp1-2" rule="lex2" category="NP2" id="sp1-4"/>
+          <span child="sp1-3 sp1-4" rule="rr" category="NPP" id="sp1-5"/>
+        </ccg>
+      </sentence>
+    """
+        self.ccg = etree.fromstring(sentence_str).find('ccg')
+
+    def test_nested(self):
+        ccg_root = build_ccg_tree(self.ccg)
+        self.assertEqual('sp1-5', ccg_root.get('id'))
+        self.assertEqual(['sp1-3', 'sp1-4'], [c.get('id') for c in ccg_root])
+        self.assertEqual('sp1-1', ccg_root[0][0].get('id'))
+        self.assertEqual('sp1-2', ccg_root[1][0].get('id'))
+        self.assertEqual(0, len(ccg_root[1][0]))
+
+    def test_flat_tree_unmodified(self):
+        ccg_str = etree.tostring(self.ccg)
+        build_ccg_tree(self.ccg)
+        self.assertEqual(ccg_str, etree.tostring(self.ccg))
+
+    def test_subtree(self):
+        ccg_root = build_ccg_tree(self.ccg, 'sp1-4')
+        self.assertEqual('sp1-4', ccg_root.get('id'))
+        self.assertEqual(['sp1-2'], [c.get('id') for c in ccg_root])
+
+    def test_fragmented_tree(self):
+        self.ccg.set('root', 'sp1-3 sp1-4')
+        with self.assertRaises(ValueError):
+            build_ccg_tree(self.ccg)
+
 class AssignSemanticsToCCGWithFeatsTestCase(unittest.TestCase):
     def test_np_feature_no(self):
         semantic_index = SemanticIndex(None)
@@ -1090,11 +1224,131 @@ class AssignSemanticsToCCGWithFeatsTestCase(unittest.TestCase):
         expected_semantics = lexpr(r'_basepred')
         self.assertEqual(expected_semantics, lexpr(semantics))
 
+class SubtreeMemoTestCase(unittest.TestCase):
+    def setUp(self):
+        self.semantic_index = SemanticIndex(None)
+        self.semantic_index.rules = [
+            SemanticRule(r'NP', r'\P.P', {'coq_type' : 'Entity'}),
+            SemanticRule(r'NP/NP', r'\P Q x.(Q(x) & P(x))', {'rule' : 'ADN'}),
+            SemanticRule(r'NP/NP', r'\P Q x.(Q(x) | P(x))', {'rule' : 'ADV'}),
+            SemanticRule(r'S', r'\P.P', {'coq_type' : 'Prop'})]
+        # Both trees share the subtree spanning the first two tokens, but
+        # their last unary rules differ.
+        sentence_str = r"""
+      <sentence id="s0">
+        <tokens>
+          <token base="良い" pos="形容詞-自立" surf="良い" id="t0_0"/>
+          <token base="言語" pos="名詞-一般" surf="言語" id="t0_1"/>
+          <token base="だ" pos="助動詞" surf="だ" id="t0_2"/>
+        </tokens>
+        <ccg root="sp0-1" id="s0_ccg0">
+          <span child="sp0-2 sp0-6" rule="&lt;" category="NP" end="3" begin="0" id="sp0-1"/>
+          <span child="sp0-3 sp0-5" rule="&gt;" category="NP" end="2" begin="0" id="sp0-2"/>
+          <span child="sp0-4" rule="ADN" category="NP/NP" end="1" begin="0" id="sp0-3"/>
+          <span terminal="t0_0" category="S" end="1" begin="0" id="sp0-4"/>
+          <span terminal="t0_1" category="NP" end="2" begin="1" id="sp0-5"/>
+          <span child="sp0-7" rule="ADN" category="NP/NP" end="3" begin="2" id="sp0-6"/>
+          <span terminal="t0_2" category="S" end="3" begin="2" id="sp0-7"/>
+        </ccg>
+        <ccg root="sp1-1" id="s0_ccg1">
+          <span child="sp1-2 sp1-6" rule="&lt;" category="NP" end="3" begin="0" id="sp1-1"/>
+          <span child="sp1-3 sp1-5" rule="&gt;" category="NP" end="2" begin="0" id="sp1-2"/>
+          <span child="sp1-4" rule="ADN" category="NP/NP" end="1" begin="0" id="sp1-3"/>
+          <span terminal="t0_0" category="S" end="1" begin="0" id="sp1-4"/>
+          <span terminal="t0_1" category="NP" end="2" begin="1" id="sp1-5"/>
+          <span child="sp1-7" rule="ADV" category="NP/NP" end="3" begin="2" id="sp1-6"/>
+          <span terminal="t0_2" category="S" end="3" begin="2" id="sp1-7"/>
+        </ccg>
+      </sentence>
+    """
+        self.sentence = etree.fromstring(sentence_str)
+
+    def assign_semantics(self, subtree_memo):
+        ccg_trees = [
+            assign_semantics_to_ccg(self.sentence, self.semantic_index, i, subtree_memo)
+            for i in [1, 2]]
+        return [[(node.get('sem'), node.get('coq_type')) for node in ccg_tree.iter('span')]
+                for ccg_tree in ccg_trees]
+
+    def test_shared_subtrees_are_composed_once(self):
+        subtree_memo = SubtreeMemo()
+        self.assign_semantics(subtree_memo)
+        self.assertEqual(5, subtree_memo.hits)
+        self.assertEqual(9, len(subtree_memo.entries))
+
+    def test_same_semantics_as_without_memo(self):
+        expected = self.assign_semantics(None)
+        semantics = self.assign_semantics(SubtreeMemo())
+        self.assertEqual(expected, semantics)
+        self.assertEqual(lexpr(r'\x.((_言語(x) & _良い(x)) | _だ(x))'),
+                         lexpr(semantics[1][0][0]))
+        self.assertEqual('Parameter _言語 : Entity.', semantics[1][4][1])
+
+class UnreadableSemanticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.semantic_index = SemanticIndex(None)
+        self.semantic_index.rules = [
+            SemanticRule(r'N', r'\P.(P & P)'),
+            SemanticRule(r'NP', r'\P.P(_c)', {'rule' : 'UN'}),
+            SemanticRule(r'S\NP', r'\P x.P(x)'),
+            SemanticRule(r'S', r'\L R.R', {'rule' : '<'})]
+        # The first tree is the NP subtree of the second one.
+        sentence_str = r"""
+      <sentence id="s0">
+        <tokens>
+          <token base="言語" pos="名詞-一般" surf="言語" id="t0_0"/>
+          <token base="走る" pos="動詞-自立" surf="走る" id="t0_1"/>
+        </tokens>
+        <ccg root="sp0-2" id="s0_ccg0">
+          <span child="sp0-3" rule="UN" category="NP" end="1" begin="0" id="sp0-2"/>
+          <span terminal="t0_0" category="N" end="1" begin="0" id="sp0-3"/>
+        </ccg>
+        <ccg root="sp1-1" id="s0_ccg1">
+          <span child="sp1-2 sp1-4" rule="&lt;" category="S" end="2" begin="0" id="sp1-1"/>
+          <span child="sp1-3" rule="UN" category="NP" end="1" begin="0" id="sp1-2"/>
+          <span terminal="t0_0" category="N" end="1" begin="0" id="sp1-3"/>
+          <span terminal="t0_1" category="S\NP" end="2" begin="1" id="sp1-4"/>
+        </ccg>
+      </sentence>
+    """
+        self.sentence = etree.fromstring(sentence_str)
+
+    def test_unreadable_root(self):
+        ccg_tree = assign_semantics_to_ccg(self.sentence, self.semantic_index, 1)
+        self.assertEqual('(_言語 & _言語)(_c)', ccg_tree.get('sem'))
+
+    def test_unreadable_child(self):
+        with self.assertRaises(LogicalExpressionException):
+            assign_semantics_to_ccg(self.sentence, self.semantic_index, 2)
+
+    def test_child_read_with_different_structure(self):
+        # nltk reads \K.(_言語 & _言語)(K) as (\K.(_言語 & _言語))(K).
+        self.semantic_index.rules = [
+            SemanticRule(r'N', r'\P.(P & P)'),
+            SemanticRule(r'NP', r'\P K.P(K)', {'rule' : 'UN'}),
+            SemanticRule(r'S\NP', r'\P x.P(x)'),
+            SemanticRule(r'S', r'\L R.L', {'rule' : '<'})]
+        ccg_tree = assign_semantics_to_ccg(self.sentence, self.semantic_index, 2)
+        self.assertEqual(r'\K.(_言語 & _言語)(K)', ccg_tree[0].get('sem'))
+        self.assertEqual(lexpr(r'(_言語 & _言語)'), lexpr(ccg_tree.get('sem')))
+
+    def test_fast_reducer(self):
+        self.semantic_index.reducer = FastReducer()
+        ccg_tree = assign_semantics_to_ccg(self.sentence, self.semantic_index, 1)
+        self.assertEqual('(_言語 & _言語)(_c)', ccg_tree.get('sem'))
+        with self.assertRaises(LogicalExpressionException):
+            assign_semantics_to_ccg(self.sentence, self.semantic_index, 2)
+
 if __name__ == '__main__':
     suite1 = unittest.TestLoader().loadTestsFromTestCase(TypeRaiseTestCase)
     suite2 = unittest.TestLoader().loadTestsFromTestCase(AssignSemanticsToCCGTestCase)
     suite3 = unittest.TestLoader().loadTestsFromTestCase(AssignSemanticsToCCGWithFeatsTestCase)
     suite4 = unittest.TestLoader().loadTestsFromTestCase(
         get_attributes_from_ccg_node_recursivelyTestCase)
-    suites = unittest.TestSuite([suite1, suite2, suite3, suite4])
+    suite5 = unittest.TestLoader().loadTestsFromTestCase(BuildCCGTreeTestCase)
+    suite6 = unittest.TestLoader().loadTestsFromTestCase(ComposeFunctionsTestCase)
+    suite7 = unittest.TestLoader().loadTestsFromTestCase(SubtreeMemoTestCase)
+    suite8 = unittest.TestLoader().loadTestsFromTestCase(UnreadableSemanticsTestCase)
+    suites = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6,
+                                 suite7, suite8])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from lxml import etree
+
+from ccg2lambda_tools import assign_semantics
+from ccg2lambda_tools import SubtreeMemo
+from lambda_reducer import get_reducer
+from normalization import normalize_tokens
+from semantic_index import SemanticIndex
+
+# Attributes of the spans of <semantics> nodes.
+kSemanticsAttributes = ('id', 'child', 'sem', 'type')
+
+class Token(object):
+    """
+    Token of a sentence. Its attributes (e.g. id, surf, base, pos) are those
+    of <token> nodes in XML.
+    """
+    __slots__ = ('attrib',)
+
+    def __init__(self, surf=None, base=None, pos=None, attrib=None, **attributes):
+        self.attrib = {} if attrib is None else dict(attrib)
+        for name, value in (('surf', surf), ('base', base or surf), ('pos', pos)):
+            if value is not None:
+                self.attrib[name] = value
+        self.attrib.update(attributes)
+
+    def __repr__(self):
+        return 'Token({0})'.format(self.attrib)
+
+    def get(self, name, default=None):
+        return self.attrib.get(name, default)
+
+class CCGNode(object):
+    """
+    Node of a CCG tree, with its category, the rule that combines its
+    children (if any) and the token it spans (if it is terminal).
+    Other attributes (e.g. id, and sem and coq_type once semantics are
+    assigned) are those of <span> nodes in XML. Nodes support the part of
+    the interface of lxml elements that semantic composition uses (get, set,
+    attrib, len and access to children), so that assign_semantics runs on
+    them directly.
+    """
+    __slots__ = ('attrib', 'children', 'token')
+
+    def __init__(self, category, rule=None, children=(), token=None,
+                 attrib=None, **attributes):
+        self.attrib = {} if attrib is None else dict(attrib)
+        if category is not None:
+            self.attrib['category'] = category
+        if rule is not None:
+            self.attrib['rule'] = rule
+        self.attrib.update(attributes)
+        self.children = list(children)
+        self.token = token
+
+    def __repr__(self):
+        return 'CCGNode({0}, {1} children)'.format(self.attrib, len(self.children))
+
+    @property
+    def category(self):
+        return self.attrib.get('category')
+
+    @property
+    def rule(self):
+        return self.attrib.get('rule')
+
+    def get(self, name, default=None):
+        return self.attrib.get(name, default)
+
+    def set(self, name, value):
+        self.attrib[name] = value
+
+    def __len__(self):
+        return len(self.children)
+
+    def __getitem__(self, index):
+        return self.children[index]
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def iter(self):
+        """
+        Yields this node and its descendants in pre-order (the order of
+        spans in XML).
+        """
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            yield node
+            nodes.extend(reversed(node.children))
+
+    def copy(self):
+        """
+        Returns a copy of the subtree of this node, which shares its tokens.
+        """
+        return CCGNode(None, children=[child.copy() for child in self.children],
+                       token=self.token, attrib=self.attrib)
+
+class CCGTree(object):
+    """
+    CCG tree of a sentence. attrib has the attributes of the <ccg> node
+    (e.g. id and root).
+    """
+    __slots__ = ('attrib', 'root')
+
+    def __init__(self, root, attrib=None, **attributes):
+        self.root = root
+        self.attrib = {} if attrib is None else dict(attrib)
+        self.attrib.update(attributes)
+
+    def get(self, name, default=None):
+        return self.attrib.get(name, default)
+
+class Sentence(object):
+    """
+    Sentence with its tokens and (n-best) CCG trees, whose terminal nodes
+    refer to tokens. Trees are CCGTree objects or root CCGNode objects.
+    Missing IDs of tokens and nodes are assigned, together with the
+    "terminal" and "child" attributes that refer to them.
+    """
+    __slots__ = ('attrib', 'tokens', 'trees')
+
+    def __init__(self, tokens, trees, attrib=None, **attributes):
+        self.attrib = {} if attrib is None else dict(attrib)
+        self.attrib.update(attributes)
+        self.tokens = list(tokens)
+        self.trees = [tree if isinstance(tree, CCGTree) else CCGTree(tree)
+                      for tree in trees]
+        sentence_id = self.attrib.get('id', 's')
+        for i, token in enumerate(self.tokens):
+            token.attrib.setdefault('id', '{0}_{1}'.format(sentence_id, i))
+        for i, tree in enumerate(self.trees):
+            tree.attrib.setdefault('id', '{0}_ccg{1}'.format(sentence_id, i))
+            for j, node in enumerate(tree.root.iter()):
+                node.attrib.setdefault('id', '{0}_sp{1}'.format(tree.get('id'), j))
+            for node in tree.root.iter():
+                if node.children:
+                    node.attrib['child'] = ' '.join(c.get('id') for c in node.children)
+                elif node.token is not None:
+                    node.attrib['terminal'] = node.token.get('id')
+            tree.attrib['root'] = tree.root.get('id')
+
+    def get(self, name, default=None):
+        return self.attrib.get(name, default)
+
+    def to_xml(self, semantics=None):
+        """
+        Returns a <sentence> lxml node with the tokens and CCG trees of this
+        sentence, in the format read by semparse.py, and semantics
+        (a list of Semantics objects), if given.
+        """
+        sentence = etree.Element('sentence', self.attrib)
+        tokens = etree.SubElement(sentence, 'tokens')
+        for token in self.tokens:
+            etree.SubElement(tokens, 'token', token.attrib)
+        for tree in self.trees:
+            ccg = etree.SubElement(sentence, 'ccg', tree.attrib)
+            for node in tree.root.iter():
+                etree.SubElement(ccg, 'span', get_span_attributes(node.attrib))
+        for sem in semantics or []:
+            sentence.append(sem.to_xml())
+        return sentence
+
+def get_span_attributes(attrib):
+    return dict((name, value) for name, value in attrib.items()
+                if name not in ('sem', 'coq_type'))
+
+class Semantics(object):
+    """
+    Result of the semantic parsing of a CCG tree. If status is "success",
+    root is a copy of the CCG tree whose nodes have "sem" (and "coq_type")
+    attributes. Otherwise, error describes the failure.
+    """
+    __slots__ = ('status', 'ccg_id', 'root', 'error')
+
+    def __init__(self, status, ccg_id=None, root=None, error=None):
+        self.status = status
+        self.ccg_id = ccg_id
+        self.root = root
+        self.error = error
+
+    def __repr__(self):
+        return 'Semantics({0}, {1})'.format(self.status, self.formula)
+
+    @property
+    def formula(self):
+        """
+        String representation of the semantics of the whole sentence.
+        """
+        return None if self.root is None else self.root.get('sem')
+
+    def to_xml(self):
+        """
+        Returns a <semantics> lxml node as produced by semparse.py.
+        """
+        sem_node = etree.Element('semantics', status=self.status)
+        if self.status != 'success':
+            return sem_node
+        for node in self.root.iter():
+            span = etree.SubElement(sem_node, 'span')
+            for name, value in node.attrib.items():
+                if name in kSemanticsAttributes:
+                    span.set(name, value)
+            if 'coq_type' in node.attrib and 'child' not in node.attrib:
+                sem_type = get_sem_type(node.get('coq_type'))
+                if sem_type:
+                    span.set('type', sem_type)
+        sem_node.set('ccg_id', self.ccg_id)
+        sem_node.set('root', self.root.get('id'))
+        return sem_node
+
+def get_sem_type(coq_type):
+    """
+    Returns the type of a predicate from its coq_type attribute,
+    e.g. 'Parameter _dog : Entity -> Prop.' --> '_dog : Entity -> Prop'.
+    """
+    return coq_type.lstrip('["Parameter ').rstrip('."]')
+
+class SemanticParser(object):
+    """
+    Assigns semantics to Sentence objects without going through XML,
+    with the same options as semparse.py:
+
+        parser = SemanticParser('en/semantic_templates_en_event.yaml')
+        dogs = Token('dogs', 'dog', 'NNS')
+        walk = Token('walk', 'walk', 'VBP')
+        tree = CCGNode('S[dcl=true]', 'ba', [
+            CCGNode('NP', 'lex', [CCGNode('N', token=dogs)]),
+            CCGNode('S[dcl=true]\\NP', token=walk)])
+        for semantics in parser.parse(Sentence([dogs, walk], [tree])):
+            print(semantics.formula)
+    """
+
+    def __init__(self, templates, reducer='nltk', nbest=0, gold_trees=True):
+        if isinstance(templates, SemanticIndex):
+            self.semantic_index = templates
+        else:
+            self.semantic_index = SemanticIndex(templates)
+            self.semantic_index.reducer = get_reducer(reducer)
+        self.nbest = nbest
+        self.gold_trees = gold_trees
+
+    def get_tree_indices(self, sentence):
+        num_trees = len(sentence.trees)
+        if self.nbest == 1:
+            if self.gold_trees:
+                return [int(sentence.get('gold_tree', '0'))]
+            return [0]
+        nbest = num_trees if self.nbest < 1 else self.nbest
+        return list(range(min(nbest, num_trees)))
+
+    def parse(self, sentence):
+        """
+        Returns a list of Semantics objects, one per (n-best) CCG tree
+        of sentence, which is not modified.
+        """
+        tokens = [Token(attrib=token.attrib) for token in sentence.tokens]
+        tokens_by_id = dict(
+            (token.get('id'), token) for token in normalize_tokens(tokens))
+        tree_indices = self.get_tree_indices(sentence)
+        subtree_memo = SubtreeMemo() if len(tree_indices) > 1 else None
+        semantics = []
+        for tree_index in tree_indices:
+            tree = sentence.trees[tree_index]
+            try:
+                root = tree.root.copy()
+                assign_semantics(
+                    root, self.semantic_index, tokens_by_id, subtree_memo)
+                semantics.append(Semantics('success', tree.get('id'), root))
+            except Exception as e:
+                semantics.append(Semantics('failed', tree.get('id'), error=str(e)))
+        return semantics
+
+def sentence_from_xml(sentence_node):
+    """
+    Returns a Sentence from a <sentence> lxml node with tokens and CCG
+    trees, as read by semparse.py.
+    """
+    tokens = [Token(attrib=token.attrib)
+              for token in sentence_node.iterfind('./tokens/token')]
+    tokens_by_id = dict((token.get('id'), token) for token in tokens)
+    trees = []
+    for ccg in sentence_node.iterfind('./ccg'):
+        spans_by_id = dict((span.get('id'), span) for span in ccg.iterfind('./span'))
+        root = build_node(spans_by_id, ccg.get('root'), tokens_by_id)
+        trees.append(CCGTree(root, ccg.attrib))
+    return Sentence(tokens, trees, sentence_node.attrib)
+
+def build_node(spans_by_id, span_id, tokens_by_id):
+    span = spans_by_id.get(span_id)
+    if span is None:
+        raise ValueError('It should have found a span for id {0}'.format(span_id))
+    children = [build_node(spans_by_id, child_id, tokens_by_id)
+                for child_id in span.get('child', '').split()]
+    token = tokens_by_id.get(span.get('terminal'))
+    return CCGNode(None, children=children, token=token, attrib=span.attrib)
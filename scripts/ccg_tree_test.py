@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from lxml import etree
+
+from ccg2lambda_tools import assign_semantics_to_ccg
+from ccg_tree import CCGNode
+from ccg_tree import SemanticParser
+from ccg_tree import Sentence
+from ccg_tree import sentence_from_xml
+from ccg_tree import Token
+from logic_parser import lexpr
+from semantic_index import SemanticIndex
+from semantic_index import SemanticRule
+
+class SemanticParserTestCase(unittest.TestCase):
+    def setUp(self):
+        semantic_index = SemanticIndex(None)
+        semantic_index.rules = [
+            SemanticRule(r'N', r'\E x.E(x)'),
+            SemanticRule(r'NP', r'\F G.exists x.(F(x) & G(x))', {'rule' : 'lex'}),
+            SemanticRule(r'S\NP', r'\E Q.Q(E)'),
+            SemanticRule(r'S\NP', r'\E Q.Q(\x.-E(x))', {'surf' : 'sleep'})]
+        self.parser = SemanticParser(semantic_index)
+        self.sentence_str = r"""
+      <sentence id="s0">
+        <tokens>
+          <token base="dog" pos="NNS" surf="Dogs" id="t0_0"/>
+          <token base="walk" pos="VBP" surf="walk" id="t0_1"/>
+        </tokens>
+        <ccg root="sp0" id="s0_ccg0">
+          <span category="S" rule="ba" child="sp1 sp3" id="sp0"/>
+          <span category="NP" rule="lex" child="sp2" id="sp1"/>
+          <span terminal="t0_0" category="N" id="sp2"/>
+          <span terminal="t0_1" category="S\NP" id="sp3"/>
+        </ccg>
+      </sentence>
+    """
+
+    def make_sentence(self, verb='walk'):
+        dogs = Token('Dogs', 'dog', 'NNS')
+        verb = Token(verb, pos='VBP')
+        tree = CCGNode('S', 'ba', [
+            CCGNode('NP', 'lex', [CCGNode('N', token=dogs)]),
+            CCGNode('S\\NP', token=verb)])
+        return Sentence([dogs, verb], [tree], id='s0')
+
+    def test_ids(self):
+        sentence = self.make_sentence()
+        self.assertEqual(['s0_0', 's0_1'], [t.get('id') for t in sentence.tokens])
+        root = sentence.trees[0].root
+        self.assertEqual('s0_ccg0_sp0', sentence.trees[0].get('root'))
+        self.assertEqual('s0_ccg0_sp1 s0_ccg0_sp3', root.get('child'))
+        self.assertEqual('s0_1', root[1].get('terminal'))
+        self.assertEqual('S\\NP', root[1].category)
+        self.assertEqual('lex', root[0].rule)
+
+    def test_parse(self):
+        sentence = self.make_sentence()
+        semantics = self.parser.parse(sentence)
+        self.assertEqual(1, len(semantics))
+        self.assertEqual('success', semantics[0].status)
+        self.assertEqual(
+            lexpr(r'exists x.(_dog(x) & _walk(x))'), lexpr(semantics[0].formula))
+        # The sentence is not modified.
+        self.assertIsNone(sentence.trees[0].root.get('sem'))
+        self.assertEqual('Dogs', sentence.tokens[0].get('surf'))
+
+    def test_parse_nbest(self):
+        sentence = self.make_sentence()
+        walk, sleep = sentence.tokens[1], Token('sleep', pos='VBP', id='s0_2')
+        sentence = Sentence(sentence.tokens + [sleep], [
+            sentence.trees[0],
+            CCGNode('S', 'ba', [sentence.trees[0].root[0].copy(),
+                                CCGNode('S\\NP', token=sleep)])], id='s0')
+        semantics = self.parser.parse(sentence)
+        self.assertEqual(['s0_ccg0', 's0_ccg1'], [s.ccg_id for s in semantics])
+        self.assertEqual(
+            lexpr(r'exists x.(_dog(x) & -_sleep(x))'), lexpr(semantics[1].formula))
+        self.parser.nbest = 1
+        self.assertEqual(['s0_ccg0'], [s.ccg_id for s in self.parser.parse(sentence)])
+
+    def test_failure(self):
+        sentence = self.make_sentence()
+        sentence.trees[0].root[1].token = None
+        del sentence.trees[0].root[1].attrib['terminal']
+        semantics = self.parser.parse(sentence)
+        self.assertEqual('failed', semantics[0].status)
+        self.assertIsNotNone(semantics[0].error)
+        self.assertEqual('failed', semantics[0].to_xml().get('status'))
+
+    def test_unreadable_semantics(self):
+        # The semantics of the NP node, (_dog & _dog)(x), cannot be parsed.
+        self.parser.semantic_index.rules = [
+            SemanticRule(r'N', r'\E.(E & E)'),
+            SemanticRule(r'NP', r'\F G.exists x.(F(x) & G(x))', {'rule' : 'lex'}),
+            SemanticRule(r'S\NP', r'\E Q.Q(E)')]
+        semantics = self.parser.parse(self.make_sentence())
+        self.assertEqual('failed', semantics[0].status)
+
+    def test_same_as_xml(self):
+        sentence_node = etree.fromstring(self.sentence_str)
+        sem_tree = assign_semantics_to_ccg(sentence_node, self.parser.semantic_index)
+        semantics = self.parser.parse(sentence_from_xml(sentence_node))
+        sem_node = semantics[0].to_xml()
+        self.assertEqual('sp0', sem_node.get('root'))
+        self.assertEqual('s0_ccg0', sem_node.get('ccg_id'))
+        self.assertEqual(
+            [(span.get('id'), lexpr(span.get('sem')))
+             for span in sem_tree.iter('span')],
+            [(span.get('id'), lexpr(span.get('sem'))) for span in sem_node])
+        self.assertIsNone(sem_node[0].get('category'))
+
+    def test_to_xml(self):
+        sentence_node = etree.fromstring(
+            self.sentence_str, etree.XMLParser(remove_blank_text=True))
+        sentence = sentence_from_xml(sentence_node)
+        sentence_xml = sentence.to_xml()
+        self.assertEqual(
+            [dict(span.attrib) for span in sentence_node.iter('span')],
+            [dict(span.attrib) for span in sentence_xml.iter('span')])
+        self.assertEqual(
+            [dict(token.attrib) for token in sentence_node.iter('token')],
+            [dict(token.attrib) for token in sentence_xml.iter('token')])
+        semantics = self.parser.parse(sentence)
+        sentence_xml = sentence.to_xml(semantics)
+        self.assertEqual(1, len(sentence_xml.findall('./semantics')))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(SemanticParserTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
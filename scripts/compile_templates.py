@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import os
+import sys
+import textwrap
+
+from semantic_index import compile_semantic_rules
+
+def main(args = None):
+    DESCRIPTION=textwrap.dedent("""\
+            Compiles semantic templates (in YAML format) into bundles with
+            pre-parsed lambda expressions, categories and the rule index.
+            semparse.py loads the bundle templates.yaml.bundle instead of
+            templates.yaml, as long as templates.yaml has not changed since
+            the bundle was compiled. Otherwise, templates.yaml is parsed.
+      """)
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=DESCRIPTION)
+    parser.add_argument("templates", nargs='+')
+    args = parser.parse_args()
+
+    for templates_fn in args.templates:
+        if not os.path.exists(templates_fn):
+            print('File does not exist: {0}'.format(templates_fn))
+            sys.exit(1)
+        compile_semantic_rules(templates_fn)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+# Commands that load coqlib when a session starts, and that define the state
+# to which sessions go back after each script.
+kInitialState = 'ccg2lambda_initial_state'
+kStartScript = 'Require Export coqlib.\nDefinition {0} := True.\n'.format(
+    kInitialState)
+kResetScript = 'Abort All.\nReset {0}.\nDefinition {0} := True.\n'.format(
+    kInitialState)
+# Maximum time (in seconds) to start a session or to reset it.
+kSessionTimeout = 60
+kEndMarker = 'ccg2lambda_end_of_script_'
+kFailMessage = 'The command has indeed failed'
+# Interval (in seconds) at which running scripts check if they are cancelled.
+kCancelInterval = 0.1
+
+class CoqtopError(Exception):
+    """
+    The coqtop process of a session exited while running a script.
+    """
+    pass
+
+class CoqtopCancelled(Exception):
+    """
+    A script was cancelled (and its coqtop process killed) before finishing.
+    """
+    pass
+
+class CoqtopSession(object):
+    """
+    Long-lived coqtop process with coqlib loaded. Scripts are written to its
+    standard input followed by a command that fails with a unique marker,
+    and their output is read until the marker appears. After each script,
+    open proofs are aborted and the environment is reset to the state just
+    after coqlib was loaded, so that every script runs as in a fresh coqtop.
+    """
+
+    def __init__(self, command=('coqtop',)):
+        self.markers = itertools.count()
+        # coqtop runs in its own process group so that it can be killed
+        # together with any process it starts.
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, start_new_session=True)
+        try:
+            self.send(kStartScript, kSessionTimeout)
+        except:
+            self.kill()
+            raise
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.is_alive():
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+    def run(self, coq_script, timeout=100, cancel=None):
+        """
+        Returns the output lines of coq_script, as run_coq_script in
+        theorem.py. It raises subprocess.TimeoutExpired if the script does
+        not finish within timeout seconds, CoqtopCancelled if cancel (a
+        threading.Event) is set before, and CoqtopError if coqtop exits.
+        The session cannot be used after any of these errors.
+        """
+        output = self.send(coq_script, timeout, cancel)
+        self.send(kResetScript, kSessionTimeout)
+        return [line.strip() for line in output.split('\n')]
+
+    def send(self, script, timeout, cancel=None):
+        """
+        Writes script to coqtop and returns its output.
+        """
+        marker = '{0}{1}'.format(kEndMarker, next(self.markers))
+        script = '{0}\nFail Check {1}.\n'.format(script, marker)
+        try:
+            self.process.stdin.write(script.encode('utf-8'))
+            self.process.stdin.flush()
+        except (IOError, OSError) as e:
+            raise CoqtopError('coqtop exited: {0}'.format(e))
+        output = self.read_until(marker, timeout, script, cancel)
+        # Remove the output of the command that prints the marker.
+        index = output.rfind(kFailMessage, 0, output.find(marker))
+        return output[:index] if index >= 0 else output
+
+    def read_until(self, marker, timeout, script, cancel=None):
+        """
+        Reads the output of coqtop until the line where marker appears.
+        """
+        deadline = time.time() + timeout
+        fd = self.process.stdout.fileno()
+        output = b''
+        marker = marker.encode('utf-8')
+        while True:
+            index = output.find(marker)
+            if index >= 0 and output.find(b'\n', index) >= 0:
+                return output.decode('utf-8', 'replace')
+            if cancel is not None and cancel.is_set():
+                raise CoqtopCancelled()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(('coqtop',), timeout, output)
+            if cancel is not None:
+                remaining = min(remaining, kCancelInterval)
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise CoqtopError(
+                    'coqtop exited with code {0} when running the script:\n{1}'\
+                    .format(self.process.wait(), script))
+            output += chunk
+
+class CoqtopPool(object):
+    """
+    Keeps up to size idle coqtop sessions. Sessions are started on demand
+    (thus, more than size scripts can run at the same time), and are killed
+    and replaced when a script times out or coqtop exits.
+    """
+
+    def __init__(self, size=1, command=('coqtop',)):
+        self.size = size
+        self.command = command
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            session.kill()
+
+    def acquire(self):
+        with self.lock:
+            while self.sessions:
+                session = self.sessions.pop()
+                if session.is_alive():
+                    return session
+                session.kill()
+        return CoqtopSession(self.command)
+
+    def release(self, session):
+        with self.lock:
+            if len(self.sessions) < self.size:
+                self.sessions.append(session)
+                return
+        session.kill()
+
+    def run(self, coq_script, timeout=100, cancel=None):
+        """
+        Returns the output lines of coq_script, run in an idle session.
+        """
+        session = self.acquire()
+        try:
+            output_lines = session.run(coq_script, timeout, cancel)
+        except:
+            session.kill()
+            raise
+        self.release(session)
+        return output_lines
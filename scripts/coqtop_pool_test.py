@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import shutil
+from subprocess import TimeoutExpired
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from coqtop_pool import CoqtopCancelled
+from coqtop_pool import CoqtopError
+from coqtop_pool import CoqtopPool
+
+# Imitates the commands of coqtop that the sessions use.
+kFakeCoqtop = r"""
+import sys
+import time
+parameters = set()
+for line in sys.stdin:
+    line = line.strip()
+    if line.startswith('Fail Check '):
+        print('The command has indeed failed with message:')
+        print('=> Error: The reference {0} was not found'.format(line[11:-1]))
+    elif line.startswith('Reset '):
+        parameters = set()
+    elif line.startswith('Parameter '):
+        name = line.split()[1]
+        if name in parameters:
+            print('Error: {0} already exists.'.format(name))
+        parameters.add(name)
+    elif line == 'Theorem t1: slow.':
+        time.sleep(10)
+    elif line == 'Theorem t1: crash.':
+        sys.exit(1)
+    elif line.startswith('Theorem '):
+        print('t1 is defined')
+    sys.stdout.flush()
+"""
+
+class CoqtopPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        coqtop = os.path.join(self.directory, 'coqtop.py')
+        with open(coqtop, 'w') as fout:
+            fout.write(kFakeCoqtop)
+        self.pool = CoqtopPool(1, (sys.executable, coqtop))
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        script = 'Require Export coqlib.\nParameter _dog : Prop.\nTheorem t1: _dog.'
+        output_lines = self.pool.run(script)
+        self.assertIn('t1 is defined', output_lines)
+        self.assertFalse(any('failed' in line for line in output_lines))
+        # The same session runs the script again after being reset.
+        session = self.pool.sessions[0]
+        output_lines = self.pool.run(script)
+        self.assertIs(session, self.pool.sessions[0])
+        self.assertIn('t1 is defined', output_lines)
+        self.assertFalse(any('already exists' in line for line in output_lines))
+
+    def test_timeout(self):
+        self.pool.run('Theorem t1: ok.')
+        session = self.pool.sessions[0]
+        with self.assertRaises(TimeoutExpired):
+            self.pool.run('Theorem t1: slow.', timeout=0.5)
+        self.assertFalse(session.is_alive())
+        self.assertEqual([], self.pool.sessions)
+        self.assertIn('t1 is defined', self.pool.run('Theorem t1: ok.'))
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        timer = threading.Timer(0.2, cancel.set)
+        timer.start()
+        start = time.time()
+        with self.assertRaises(CoqtopCancelled):
+            self.pool.run('Theorem t1: slow.', timeout=5, cancel=cancel)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual([], self.pool.sessions)
+        self.assertIn('t1 is defined', self.pool.run('Theorem t1: ok.'))
+
+    def test_crash(self):
+        with self.assertRaises(CoqtopError):
+            self.pool.run('Theorem t1: crash.')
+        self.assertIn('t1 is defined', self.pool.run('Theorem t1: ok.'))
+
+    def test_size(self):
+        sessions = [self.pool.acquire(), self.pool.acquire()]
+        self.assertIsNot(sessions[0], sessions[1])
+        for session in sessions:
+            self.pool.release(session)
+        self.assertEqual(1, len(self.pool.sessions))
+        self.assertFalse(sessions[1].is_alive())
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(CoqtopPoolTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
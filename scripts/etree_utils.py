@@ -34,3 +34,89 @@ def get_node_at_path(tree, path):
             raise(IndexError, 'Attempted to index subtree {0} with path {1}'\
                   .format(tree.get('id'), path))
     return node
+
+class IncrementalTreeWriter(object):
+    """
+    Writes into an etree.xmlfile a tree that is read incrementally (e.g. with
+    etree.iterparse), one complete element at a time. Ancestors of written
+    elements are opened and closed as needed. Written elements are removed
+    from the tree, so that memory can be released.
+    """
+
+    def __init__(self, xml_file, space='  '):
+        self.xml_file = xml_file
+        self.space = space
+        # Pairs (element, context) of ancestors whose start tag is written.
+        self.opened = []
+        self.started = False
+
+    def write(self, element):
+        """
+        Writes element, which must be complete, together with the content
+        of its ancestors that precedes it.
+        """
+        ancestors = list(element.iterancestors())
+        ancestors.reverse()
+        self.open_ancestors(ancestors)
+        self.write_preceding_siblings(element)
+        self.write_element(element, len(ancestors))
+        self.remove_element(element)
+
+    def close(self, root):
+        """
+        Writes the content that follows the last written element and closes
+        all ancestors. root is written entirely if no element was written.
+        """
+        if not self.started:
+            self.write_element(root, 0)
+        while self.opened:
+            self.close_last()
+
+    def open_ancestors(self, ancestors):
+        common = 0
+        while common < len(self.opened) and common < len(ancestors) \
+              and self.opened[common][0] is ancestors[common]:
+            common += 1
+        while len(self.opened) > common:
+            self.close_last()
+        for ancestor in ancestors[common:]:
+            self.write_preceding_siblings(ancestor)
+            self.write_indentation(len(self.opened))
+            context = self.xml_file.element(ancestor.tag, dict(ancestor.attrib))
+            context.__enter__()
+            self.started = True
+            if ancestor.text and ancestor.text.strip():
+                self.xml_file.write(ancestor.text)
+            self.opened.append((ancestor, context))
+
+    def close_last(self):
+        element, context = self.opened.pop()
+        for child in list(element):
+            self.write_element(child, len(self.opened) + 1)
+            element.remove(child)
+        self.write_indentation(len(self.opened))
+        context.__exit__(None, None, None)
+        self.remove_element(element)
+
+    def write_preceding_siblings(self, element):
+        # Preceding siblings that are still in the tree were not written yet.
+        for sibling in list(element.itersiblings(preceding=True))[::-1]:
+            self.write_element(sibling, len(self.opened))
+            self.remove_element(sibling)
+
+    def write_element(self, element, level):
+        if level > 0:
+            self.write_indentation(level)
+        element.tail = None
+        etree.indent(element, space=self.space, level=level)
+        self.xml_file.write(element)
+        self.started = True
+
+    def write_indentation(self, level):
+        if self.started:
+            self.xml_file.write('\n' + self.space * level)
+
+    def remove_element(self, element):
+        parent = element.getparent()
+        if parent is not None:
+            parent.remove(element)
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from io import BytesIO
+import unittest
+
+from lxml import etree
+
+from etree_utils import IncrementalTreeWriter
+
+class IncrementalTreeWriterTestCase(unittest.TestCase):
+    def write_incrementally(self, xml_str, tag='sentence'):
+        parser = etree.XMLParser(remove_blank_text=True)
+        expected = etree.tostring(
+            etree.fromstring(xml_str, parser), pretty_print=True)
+        elements = etree.iterparse(
+            BytesIO(xml_str), events=('end',), tag=tag, remove_blank_text=True)
+        output = BytesIO()
+        with etree.xmlfile(output, encoding='utf-8') as xml_file:
+            writer = IncrementalTreeWriter(xml_file)
+            for _, element in elements:
+                writer.write(element)
+                self.assertIsNone(element.getparent())
+            writer.close(elements.root)
+        return expected, output.getvalue() + b'\n'
+
+    def test_nested(self):
+        xml_str = b"""
+      <root>
+        <document id="d0">
+          <sentences>
+            <sentence id="s0"><tokens><token id="t0_0"/></tokens></sentence>
+            <sentence id="s1"><tokens><token id="t1_0"/></tokens></sentence>
+          </sentences>
+        </document>
+      </root>
+    """
+        expected, output = self.write_incrementally(xml_str)
+        self.assertEqual(expected, output)
+
+    def test_several_containers(self):
+        xml_str = b"""
+      <root>
+        <document id="d0">
+          <meta><author/></meta>
+          <sentences>
+            <sentence id="s0"/>
+          </sentences>
+        </document>
+        <document id="d1">
+          <sentences>
+            <sentence id="s1"/>
+          </sentences>
+          <meta><author/></meta>
+        </document>
+        <document id="d2"/>
+      </root>
+    """
+        expected, output = self.write_incrementally(xml_str)
+        self.assertEqual(expected, output)
+
+    def test_no_elements(self):
+        xml_str = b"""
+      <root>
+        <document id="d0"><meta/></document>
+      </root>
+    """
+        expected, output = self.write_incrementally(xml_str)
+        self.assertEqual(expected, output)
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(IncrementalTreeWriterTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
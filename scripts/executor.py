@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import deque
+from multiprocessing import Pool
+import time
+import traceback
+
+# Chunks of items sent to a worker should take about this time (in seconds),
+# so that the cost of inter-process communication is amortized while
+# results are still returned often.
+kTargetChunkSeconds = 0.5
+kMaxChunkSize = 64
+# Default maximum number of items per core that are sent to workers
+# (or are waiting to be yielded) at any time.
+kMaxInFlightPerCore = 16
+
+class TaskError(object):
+    """
+    Result of a task whose function raised an exception. It is produced in
+    the worker, so that the exception does not stop the other tasks.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __repr__(self):
+        return 'TaskError({0})'.format(self.message)
+
+class Completed(object):
+    """
+    Wraps an item whose result is already known (e.g. it was cached).
+    Executor.imap yields its value in order without sending it to a worker.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+class Executor(object):
+    """
+    Applies a function to a stream of items, in ncores worker processes, and
+    yields results in the same order as items:
+
+        with Executor(ncores, initializer, (args,)) as executor:
+            for result in executor.imap(function, items):
+                ...
+
+    Workers are started with the initializer, which should load the state
+    they need (e.g. semantic templates), instead of relying on globals
+    inherited by fork. Functions and items should be picklable.
+    Items are read lazily and sent in chunks whose size adapts to the time
+    that tasks take. At most max_in_flight items are sent to workers or
+    waiting to be yielded. If ncores <= 1, functions are applied in this
+    process and the initializer is not called.
+    """
+
+    def __init__(self, ncores=1, initializer=None, initargs=(),
+                 max_in_flight=None, maxtasksperchild=None):
+        self.ncores = ncores
+        if max_in_flight is None:
+            max_in_flight = kMaxInFlightPerCore * max(1, ncores)
+        self.max_in_flight = max_in_flight
+        self.chunksize = 1
+        self.pool = None
+        if ncores > 1:
+            self.pool = Pool(
+                processes=ncores, initializer=initializer, initargs=initargs,
+                maxtasksperchild=maxtasksperchild)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def imap(self, function, items):
+        """
+        Yields function(item) for every item, or item.value if it is an
+        instance of Completed, in order. Exceptions raised by function
+        are returned as instances of TaskError.
+        """
+        if self.pool is None:
+            for item in items:
+                if isinstance(item, Completed):
+                    yield item.value
+                else:
+                    yield run_task(function, item)
+            return
+        # Queue of chunks in input order. Each chunk is a pair (number of
+        # items, AsyncResult) or (number of items, list of results).
+        chunks = deque()
+        num_in_flight = 0
+        chunk = []
+        for item in items:
+            if isinstance(item, Completed):
+                if chunk:
+                    chunks.append(self.submit(function, chunk))
+                    chunk = []
+                chunks.append((1, [item.value]))
+                num_in_flight += 1
+            else:
+                chunk.append(item)
+                num_in_flight += 1
+                if len(chunk) >= self.chunksize:
+                    chunks.append(self.submit(function, chunk))
+                    chunk = []
+            # Yield results that are ready, or wait for them if there are
+            # too many items in flight.
+            while chunks and (num_in_flight >= self.max_in_flight or \
+                              self.is_ready(chunks[0])):
+                num_items, results = chunks.popleft()
+                num_in_flight -= num_items
+                for result in self.get_results(results):
+                    yield result
+        if chunk:
+            chunks.append(self.submit(function, chunk))
+        while chunks:
+            num_items, results = chunks.popleft()
+            for result in self.get_results(results):
+                yield result
+
+    def submit(self, function, chunk):
+        return (len(chunk), self.pool.apply_async(run_chunk, (function, chunk)))
+
+    def is_ready(self, chunk):
+        results = chunk[1]
+        return isinstance(results, list) or results.ready()
+
+    def get_results(self, results):
+        if isinstance(results, list):
+            return results
+        results, seconds = results.get()
+        self.adapt_chunksize(seconds / len(results))
+        return results
+
+    def adapt_chunksize(self, seconds_per_item):
+        if seconds_per_item <= 0:
+            chunksize = kMaxChunkSize
+        else:
+            chunksize = int(kTargetChunkSeconds / seconds_per_item)
+        # Chunks should not be so large that some cores stay idle.
+        max_chunksize = max(1, self.max_in_flight // (2 * self.ncores))
+        self.chunksize = max(1, min(chunksize, kMaxChunkSize, max_chunksize))
+
+def run_chunk(function, items):
+    start = time.time()
+    results = [run_task(function, item) for item in items]
+    return results, time.time() - start
+
+def run_task(function, item):
+    try:
+        return function(item)
+    except Exception:
+        return TaskError(traceback.format_exc())
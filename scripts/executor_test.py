@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from executor import Completed
+from executor import Executor
+from executor import TaskError
+
+kOffset = 0
+
+def initialize(offset):
+    global kOffset
+    kOffset = offset
+
+def add_offset(x):
+    return x + kOffset
+
+def invert(x):
+    return 1 / x
+
+class ExecutorTestCase(unittest.TestCase):
+    def test_sequential(self):
+        with Executor(1) as executor:
+            results = list(executor.imap(add_offset, range(5)))
+        self.assertEqual([0, 1, 2, 3, 4], results)
+
+    def test_completed_items(self):
+        items = [1, Completed('a'), 2, Completed('b')]
+        with Executor(1) as executor:
+            results = list(executor.imap(add_offset, items))
+        self.assertEqual([1, 'a', 2, 'b'], results)
+
+    def test_task_error(self):
+        with Executor(1) as executor:
+            results = list(executor.imap(invert, [1, 0, 2]))
+        self.assertEqual(1, results[0])
+        self.assertIsInstance(results[1], TaskError)
+        self.assertIn('ZeroDivisionError', results[1].message)
+        self.assertEqual(0.5, results[2])
+
+    def test_parallel_ordered(self):
+        items = [Completed(-1)] + list(range(200)) + [Completed(-2)]
+        with Executor(2, initialize, (10,), max_in_flight=8) as executor:
+            results = list(executor.imap(add_offset, items))
+        self.assertEqual([-1] + list(range(10, 210)) + [-2], results)
+
+    def test_parallel_task_error(self):
+        with Executor(2) as executor:
+            results = list(executor.imap(invert, [1, 0, 2]))
+        self.assertEqual(1, results[0])
+        self.assertIsInstance(results[1], TaskError)
+        self.assertEqual(0.5, results[2])
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ExecutorTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+
+from nltk.sem.logic import AbstractVariableExpression
+from nltk.sem.logic import ApplicationExpression
+from nltk.sem.logic import BinaryExpression
+from nltk.sem.logic import ConstantExpression
+from nltk.sem.logic import is_eventvar
+from nltk.sem.logic import is_funcvar
+from nltk.sem.logic import is_indvar
+from nltk.sem.logic import LambdaExpression
+from nltk.sem.logic import NegatedExpression
+from nltk.sem.logic import unique_variable
+from nltk.sem.logic import Variable
+from nltk.sem.logic import VariableBinderExpression
+from nltk.sem.logic import VariableExpression
+
+from logic_parser import lexpr
+
+# Combinators are parsed only once, when this module is loaded.
+kConstantTypeRaiser = lexpr(r'\P X.P(X)')
+kTypeRaisers = {
+    1 : lexpr(r'\P0 P1 X0.P0(P1(X0))'),
+    2 : lexpr(r'\P0 P1 X0 X1.P0(P1(X0, X1))'),
+    3 : lexpr(r'\P0 P1 X0 X1 X2.P0(P1(X0, X1, X2))')}
+# Variables bound by the function composition of order 1, 2 and 3.
+kCompositionVariables = {
+    order : [Variable('X' + str(i)) for i in range(order)] for order in kTypeRaisers}
+
+def type_raise(function, order = 1):
+    """
+    Produce a higher order function based on "function". The argument "order"
+    indicates the number of desired arguments of the new function.
+    """
+    assert order >= 0, 'The order of the type-raising should be >= 0'
+    if isinstance(function, ConstantExpression):
+        type_raiser = kConstantTypeRaiser
+    else:
+        assert order in kTypeRaisers, 'Type-raising at order > 3 is not supported'
+        type_raiser = kTypeRaisers[order]
+    type_raised_function = type_raiser(function).simplify()
+    return type_raised_function
+
+def compose_functions(function, argument, order = 1):
+    r"""
+    Function combination of order "order" of "function" and "argument", i.e.
+    \X0 .. Xn.function(argument(X0, .., Xn)). It returns the same expression as
+    type_raise(function, order)(argument).simplify(), but builds the composed
+    term directly and simplifies it only once.
+    """
+    variables = kCompositionVariables.get(order)
+    if isinstance(function, ConstantExpression) or variables is None:
+        return type_raise(function, order)(argument).simplify()
+    # Variables of the composition would capture free variables of the
+    # function or the argument. Let nltk rename them.
+    free_variables = function.free() | argument.free()
+    if any(variable in free_variables for variable in variables):
+        return type_raise(function, order)(argument).simplify()
+    composition = argument
+    for variable in variables:
+        composition = ApplicationExpression(
+            composition, VariableExpression(variable))
+    composition = ApplicationExpression(function, composition)
+    for variable in reversed(variables):
+        composition = LambdaExpression(variable, composition)
+    return composition.simplify()
+
+class NLTKReducer(object):
+    """
+    Composes semantics directly as nltk expressions, using
+    Expression.simplify() for beta-reduction. Terms are nltk expressions.
+    All reducers expose the same methods: from_expression and to_expression
+    convert between nltk expressions and the terms of the reducer, apply and
+    compose perform function application and combination, and to_string
+    produces the string stored in the 'sem' attribute of CCG nodes.
+    """
+
+    name = 'nltk'
+
+    def from_expression(self, expression):
+        return expression
+
+    def to_expression(self, term):
+        return term
+
+    def to_string(self, term):
+        return str(term)
+
+    def apply(self, function, argument):
+        return function(argument).simplify()
+
+    def compose(self, function, argument, order=1):
+        return compose_functions(function, argument, order)
+
+# Maximum number of terms in the hash-consing table of FastReducer.
+# When it is exceeded, the table and all memoized results are discarded.
+kMaxTerms = 1000000
+
+# Terms of FastReducer are tuples (tag, loose, first, second, third), where
+# loose is one plus the largest de Bruijn index that is free in the term
+# (zero for closed terms). Depending on the tag, the tuple is:
+#   (kVar, index + 1, index, None, None): a bound variable.
+#   (kAtom, 0, expression_class, variable, None): a free variable or constant.
+#   (kApp, loose, function, argument, None)
+#   (kBind, loose, binder_class, variable, body): a lambda or a quantifier.
+#     The variable is only used as a hint to name the binder back in nltk.
+#   (kBin, loose, binary_class, first, second): e.g. conjunctions, equalities.
+#   (kNeg, loose, term, None, None)
+kVar, kAtom, kApp, kBind, kBin, kNeg = range(6)
+
+class FastReducer(object):
+    """
+    Composes semantics as de Bruijn-indexed lambda terms. Terms are
+    hash-consed, so that structurally equal terms are the same object, and
+    their normal forms are memoized. Beta-reduction follows the normal order
+    (leftmost-outermost redex first) and does not visit subterms that have
+    no variable bound outside of them, which are shared instead of copied.
+    Terms are converted from and to nltk expressions only at the boundaries
+    (semantic templates and the final 'sem' strings).
+    """
+
+    name = 'fast'
+
+    def __init__(self, max_terms=kMaxTerms):
+        self.max_terms = max_terms
+        self.clear()
+
+    def clear(self):
+        """
+        Discards the hash-consing table and memoized results. Memoized results
+        are keyed by id() and keep a reference to their key object, so that
+        stale entries are never returned.
+        """
+        self.terms = {}
+        self.normal_forms = {}
+        self.terms_from_expressions = {}
+        self.expressions_from_terms = {}
+        self.strings = {}
+        self.atom_variables = {}
+        self.loose_indices = {}
+
+    def intern(self, key, term):
+        interned = self.terms.get(key)
+        if interned is None:
+            if len(self.terms) >= self.max_terms:
+                self.clear()
+            self.terms[key] = interned = term
+        return interned
+
+    def var(self, index):
+        return self.intern((kVar, index), (kVar, index + 1, index, None, None))
+
+    def atom(self, expression_class, variable):
+        return self.intern((kAtom, expression_class, variable),
+                           (kAtom, 0, expression_class, variable, None))
+
+    def app(self, function, argument):
+        return self.intern(
+            (kApp, id(function), id(argument)),
+            (kApp, max(function[1], argument[1]), function, argument, None))
+
+    def bind(self, binder_class, variable, body):
+        return self.intern(
+            (kBind, binder_class, variable, id(body)),
+            (kBind, max(body[1] - 1, 0), binder_class, variable, body))
+
+    def bin(self, binary_class, first, second):
+        return self.intern(
+            (kBin, binary_class, id(first), id(second)),
+            (kBin, max(first[1], second[1]), binary_class, first, second))
+
+    def neg(self, term):
+        return self.intern((kNeg, id(term)), (kNeg, term[1], term, None, None))
+
+    def from_expression(self, expression):
+        cached = self.terms_from_expressions.get(id(expression))
+        if cached is not None and cached[0] is expression:
+            return cached[1]
+        term = self.convert_expression(expression, [])
+        if len(self.terms_from_expressions) >= self.max_terms:
+            self.terms_from_expressions = {}
+        self.terms_from_expressions[id(expression)] = (expression, term)
+        return term
+
+    def convert_expression(self, expression, binders):
+        """
+        binders is the list of variables of the enclosing binders,
+        the innermost last.
+        """
+        if isinstance(expression, AbstractVariableExpression):
+            variable = expression.variable
+            for index in range(len(binders)):
+                if binders[-1 - index] == variable:
+                    return self.var(index)
+            return self.atom(type(expression), variable)
+        if isinstance(expression, ApplicationExpression):
+            return self.app(
+                self.convert_expression(expression.function, binders),
+                self.convert_expression(expression.argument, binders))
+        if isinstance(expression, VariableBinderExpression):
+            binders.append(expression.variable)
+            body = self.convert_expression(expression.term, binders)
+            binders.pop()
+            return self.bind(type(expression), expression.variable, body)
+        if isinstance(expression, BinaryExpression):
+            return self.bin(
+                type(expression),
+                self.convert_expression(expression.first, binders),
+                self.convert_expression(expression.second, binders))
+        if isinstance(expression, NegatedExpression):
+            return self.neg(self.convert_expression(expression.term, binders))
+        raise ValueError('Unsupported expression {0} of type {1}'.format(
+            expression, type(expression)))
+
+    def to_expression(self, term):
+        return self.convert_term(term, [])
+
+    def convert_term(self, term, names):
+        """
+        names is the list of variables chosen for the enclosing binders,
+        the innermost last.
+        """
+        # Closed terms are converted in the same way wherever they appear.
+        if term[1] == 0:
+            cached = self.expressions_from_terms.get(id(term))
+            if cached is not None and cached[0] is term:
+                return cached[1]
+        tag = term[0]
+        if tag == kVar:
+            expression = VariableExpression(names[-1 - term[2]])
+        elif tag == kAtom:
+            expression = term[2](term[3])
+        elif tag == kApp:
+            expression = ApplicationExpression(
+                self.convert_term(term[2], names),
+                self.convert_term(term[3], names))
+        elif tag == kBind:
+            variable = self.get_binder_variable(term, names)
+            names.append(variable)
+            body = self.convert_term(term[4], names)
+            names.pop()
+            expression = term[2](variable, body)
+        elif tag == kBin:
+            expression = term[2](
+                self.convert_term(term[3], names),
+                self.convert_term(term[4], names))
+        else:
+            expression = NegatedExpression(self.convert_term(term[2], names))
+        if term[1] == 0:
+            self.expressions_from_terms[id(term)] = (term, expression)
+        return expression
+
+    def get_binder_variable(self, term, names):
+        """
+        Returns the variable of a binder when converting it back to nltk.
+        The variable of the original expression is kept unless it would
+        capture a free variable or shadow an enclosing binder that is
+        referenced in the body. Then, a fresh variable is generated by nltk.
+        """
+        variable, body = term[3], term[4]
+        avoid = set(self.get_atom_variables(body))
+        for index in self.get_loose_indices(body):
+            if index > 0:
+                avoid.add(names[-index])
+        if variable not in avoid:
+            return variable
+        name = variable.name
+        if is_indvar(name) or is_funcvar(name) or is_eventvar(name):
+            return unique_variable(variable, avoid)
+        return unique_variable(None, avoid)
+
+    def get_atom_variables(self, term):
+        """
+        Returns the set of variables of free variables and constants in term.
+        """
+        cached = self.atom_variables.get(id(term))
+        if cached is not None and cached[0] is term:
+            return cached[1]
+        tag = term[0]
+        if tag == kVar:
+            variables = frozenset()
+        elif tag == kAtom:
+            variables = frozenset([term[3]])
+        elif tag == kApp:
+            variables = self.get_atom_variables(term[2]) \
+                      | self.get_atom_variables(term[3])
+        elif tag == kBind:
+            variables = self.get_atom_variables(term[4])
+        elif tag == kBin:
+            variables = self.get_atom_variables(term[3]) \
+                      | self.get_atom_variables(term[4])
+        else:
+            variables = self.get_atom_variables(term[2])
+        self.atom_variables[id(term)] = (term, variables)
+        return variables
+
+    def get_loose_indices(self, term):
+        """
+        Returns the set of de Bruijn indices that are free in term.
+        """
+        if term[1] == 0:
+            return frozenset()
+        cached = self.loose_indices.get(id(term))
+        if cached is not None and cached[0] is term:
+            return cached[1]
+        tag = term[0]
+        if tag == kVar:
+            indices = frozenset([term[2]])
+        elif tag == kApp:
+            indices = self.get_loose_indices(term[2]) \
+                    | self.get_loose_indices(term[3])
+        elif tag == kBind:
+            indices = frozenset(
+                i - 1 for i in self.get_loose_indices(term[4]) if i > 0)
+        elif tag == kBin:
+            indices = self.get_loose_indices(term[3]) \
+                    | self.get_loose_indices(term[4])
+        else:
+            indices = self.get_loose_indices(term[2])
+        self.loose_indices[id(term)] = (term, indices)
+        return indices
+
+    def to_string(self, term):
+        if term[1] != 0:
+            return str(self.to_expression(term))
+        cached = self.strings.get(id(term))
+        if cached is not None and cached[0] is term:
+            return cached[1]
+        string = str(self.to_expression(term))
+        self.strings[id(term)] = (term, string)
+        return string
+
+    def shift(self, term, amount, cutoff=0):
+        """
+        Adds amount to the de Bruijn indices of term that are >= cutoff.
+        """
+        if term[1] <= cutoff:
+            return term
+        tag = term[0]
+        if tag == kVar:
+            return self.var(term[2] + amount)
+        if tag == kApp:
+            return self.app(self.shift(term[2], amount, cutoff),
+                            self.shift(term[3], amount, cutoff))
+        if tag == kBind:
+            return self.bind(term[2], term[3],
+                             self.shift(term[4], amount, cutoff + 1))
+        if tag == kBin:
+            return self.bin(term[2], self.shift(term[3], amount, cutoff),
+                            self.shift(term[4], amount, cutoff))
+        return self.neg(self.shift(term[2], amount, cutoff))
+
+    def instantiate(self, body, argument):
+        """
+        Substitutes argument for the variable bound by the binder of body.
+        """
+        return self.substitute(body, argument, 0, {})
+
+    def substitute(self, term, argument, depth, memo):
+        if term[1] <= depth:
+            return term
+        key = (id(term), depth)
+        result = memo.get(key)
+        if result is not None:
+            return result
+        tag = term[0]
+        if tag == kVar:
+            if term[2] == depth:
+                result = self.shift(argument, depth)
+            else:
+                result = self.var(term[2] - 1)
+        elif tag == kApp:
+            result = self.app(
+                self.substitute(term[2], argument, depth, memo),
+                self.substitute(term[3], argument, depth, memo))
+        elif tag == kBind:
+            result = self.bind(term[2], term[3],
+                self.substitute(term[4], argument, depth + 1, memo))
+        elif tag == kBin:
+            result = self.bin(term[2],
+                self.substitute(term[3], argument, depth, memo),
+                self.substitute(term[4], argument, depth, memo))
+        else:
+            result = self.neg(self.substitute(term[2], argument, depth, memo))
+        memo[key] = result
+        return result
+
+    def reduce_head(self, term):
+        """
+        Returns the weak head normal form of term.
+        """
+        while term[0] == kApp:
+            function = self.reduce_head(term[2])
+            if function[0] == kBind and function[2] is LambdaExpression:
+                term = self.instantiate(function[4], term[3])
+            elif function is term[2]:
+                return term
+            else:
+                return self.app(function, term[3])
+        return term
+
+    def normalize(self, term):
+        """
+        Returns the beta-normal form of term.
+        """
+        cached = self.normal_forms.get(id(term))
+        if cached is not None and cached[0] is term:
+            return cached[1]
+        tag = term[0]
+        if tag == kApp:
+            head = self.reduce_head(term)
+            if head[0] == kApp:
+                normal_form = self.app(
+                    self.normalize(head[2]), self.normalize(head[3]))
+            else:
+                normal_form = self.normalize(head)
+        elif tag == kBind:
+            normal_form = self.bind(term[2], term[3], self.normalize(term[4]))
+        elif tag == kBin:
+            normal_form = self.bin(
+                term[2], self.normalize(term[3]), self.normalize(term[4]))
+        elif tag == kNeg:
+            normal_form = self.neg(self.normalize(term[2]))
+        else:
+            normal_form = term
+        self.normal_forms[id(term)] = (term, normal_form)
+        self.normal_forms[id(normal_form)] = (normal_form, normal_form)
+        return normal_form
+
+    def apply(self, function, argument):
+        return self.normalize(self.app(function, argument))
+
+    def compose(self, function, argument, order=1):
+        r"""
+        Builds \X0 .. Xn.function(argument(X0, .., Xn)) and normalizes it,
+        as compose_functions does with nltk expressions.
+        """
+        assert order >= 0, 'The order of the type-raising should be >= 0'
+        if function[0] == kAtom and function[2] is ConstantExpression:
+            return self.apply(function, argument)
+        assert order in kTypeRaisers, 'Type-raising at order > 3 is not supported'
+        composition = self.shift(argument, order)
+        for index in reversed(range(order)):
+            composition = self.app(composition, self.var(index))
+        composition = self.app(self.shift(function, order), composition)
+        for variable in reversed(kCompositionVariables[order]):
+            composition = self.bind(LambdaExpression, variable, composition)
+        return self.normalize(composition)
+
+class CheckingReducer(object):
+    """
+    Differential testing of reducers. Every operation is performed by a
+    reference and a candidate reducer, and an error is logged whenever their
+    results are not alpha-equivalent. Terms are pairs of terms of both
+    reducers, and results of the reference reducer are the ones returned.
+    """
+
+    name = 'check'
+
+    def __init__(self, reference=None, candidate=None):
+        self.reference = reference if reference is not None else NLTKReducer()
+        self.candidate = candidate if candidate is not None else FastReducer()
+        self.num_checks = 0
+        self.num_mismatches = 0
+
+    def from_expression(self, expression):
+        return (self.reference.from_expression(expression),
+                self.candidate.from_expression(expression))
+
+    def to_expression(self, term):
+        return self.reference.to_expression(term[0])
+
+    def to_string(self, term):
+        return self.reference.to_string(term[0])
+
+    def apply(self, function, argument):
+        return self.check(
+            (self.reference.apply(function[0], argument[0]),
+             self.candidate.apply(function[1], argument[1])))
+
+    def compose(self, function, argument, order=1):
+        return self.check(
+            (self.reference.compose(function[0], argument[0], order),
+             self.candidate.compose(function[1], argument[1], order)))
+
+    def check(self, term):
+        self.num_checks += 1
+        expected = self.reference.to_expression(term[0])
+        actual = self.candidate.to_expression(term[1])
+        if not alpha_equivalent(expected, actual):
+            self.num_mismatches += 1
+            logging.error(
+                'Reducers disagree.\n{0}: {1}\n{2}: {3}'.format(
+                self.reference.name, expected, self.candidate.name, actual))
+        return term
+
+kReducers = {
+    'nltk' : NLTKReducer,
+    'fast' : FastReducer,
+    'check' : CheckingReducer}
+
+def get_reducer(name):
+    if name not in kReducers:
+        raise ValueError('Unknown reducer {0}. Choose one of {1}'.format(
+            name, ', '.join(sorted(kReducers))))
+    return kReducers[name]()
+
+def alpha_equivalent(expression1, expression2):
+    """
+    Returns True if both nltk expressions are equal up to the renaming
+    of bound variables.
+    """
+    return get_nameless_term(expression1) == get_nameless_term(expression2)
+
+def get_nameless_term(expression, binders=None):
+    """
+    Returns a nested tuple representing expression, where bound variables
+    are replaced by their de Bruijn indices.
+    """
+    if binders is None:
+        binders = []
+    if isinstance(expression, AbstractVariableExpression):
+        variable = expression.variable
+        for index in range(len(binders)):
+            if binders[-1 - index] == variable:
+                return (kVar, index)
+        return (kAtom, variable)
+    if isinstance(expression, ApplicationExpression):
+        return (kApp, get_nameless_term(expression.function, binders),
+                get_nameless_term(expression.argument, binders))
+    if isinstance(expression, VariableBinderExpression):
+        binders.append(expression.variable)
+        body = get_nameless_term(expression.term, binders)
+        binders.pop()
+        return (kBind, type(expression), body)
+    if isinstance(expression, BinaryExpression):
+        return (kBin, type(expression),
+                get_nameless_term(expression.first, binders),
+                get_nameless_term(expression.second, binders))
+    if isinstance(expression, NegatedExpression):
+        return (kNeg, get_nameless_term(expression.term, binders))
+    raise ValueError('Unsupported expression {0} of type {1}'.format(
+        expression, type(expression)))
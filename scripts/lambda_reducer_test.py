@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import glob
+import os
+import unittest
+
+from lxml import etree
+
+from ccg2lambda_tools import assign_semantics_to_ccg
+from lambda_reducer import alpha_equivalent
+from lambda_reducer import CheckingReducer
+from lambda_reducer import FastReducer
+from lambda_reducer import get_reducer
+from lambda_reducer import NLTKReducer
+from logic_parser import lexpr
+from semantic_index import load_semantic_rules
+from semantic_index import SemanticIndex
+from semantic_rule import SemanticRule
+
+kTemplatesPatterns = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', lang,
+                 'semantic_templates_*.yaml') for lang in ['en', 'ja']]
+
+class FastReducerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reducer = FastReducer()
+
+    def apply(self, function_str, argument_str):
+        function = self.reducer.from_expression(lexpr(function_str))
+        argument = self.reducer.from_expression(lexpr(argument_str))
+        return self.reducer.to_expression(self.reducer.apply(function, argument))
+
+    def compose(self, function_str, argument_str, order=1):
+        function = self.reducer.from_expression(lexpr(function_str))
+        argument = self.reducer.from_expression(lexpr(argument_str))
+        return self.reducer.to_expression(
+            self.reducer.compose(function, argument, order))
+
+    def test_apply(self):
+        semantics = self.apply(r'\P x.(P(x) & _dog(x))', r'\y._big(y)')
+        self.assertEqual(r'\x.(_big(x) & _dog(x))', str(semantics))
+
+    def test_apply_keeps_variable_names(self):
+        semantics = self.apply(r'\F x.exists e.F(x, e)', r'\y e1._run(y, e1)')
+        self.assertEqual(r'\x.exists e._run(x,e)', str(semantics))
+
+    def test_apply_avoids_capture(self):
+        semantics = self.apply(r'\x y._love(x, y)', r'y')
+        self.assertTrue(alpha_equivalent(lexpr(r'\z._love(y, z)'), semantics))
+        self.assertNotEqual(r'\y._love(y,y)', str(semantics))
+
+    def test_apply_shadowed_variable(self):
+        semantics = self.apply(r'\x.(_a(x) & \x._b(x))', r'_c')
+        self.assertTrue(alpha_equivalent(lexpr(r'_a(_c) & \x._b(x)'), semantics))
+
+    def test_apply_nested_redexes(self):
+        semantics = self.apply(r'\Q R.R(Q(_a))', r'\x.x')
+        self.assertEqual(lexpr(r'\R.R(_a)'), semantics)
+
+    def test_apply_non_lambda(self):
+        semantics = self.apply(r'exists x.(_a(x))', r'_b')
+        self.assertEqual(r'exists x._a(x)(_b)', str(semantics))
+
+    def test_compose(self):
+        semantics = self.compose(r'\x._walk(x)', r'\y._dog(y)')
+        self.assertEqual(r'\X0._walk(_dog(X0))', str(semantics))
+
+    def test_compose_order2(self):
+        semantics = self.compose(r'\P.P', r'\x y._love(x, y)', 2)
+        self.assertTrue(alpha_equivalent(lexpr(r'\X0 X1._love(X0, X1)'), semantics))
+
+    def test_compose_constant(self):
+        semantics = self.compose(r'_not', r'\x._dog(x)')
+        self.assertEqual(lexpr(r'_not(\x._dog(x))'), semantics)
+
+    def test_compose_free_variable(self):
+        semantics = self.compose(r'\x._walk(x, X0)', r'\y._dog(y)')
+        self.assertTrue(
+            alpha_equivalent(lexpr(r'\F._walk(_dog(F), X0)'), semantics))
+
+    def test_compose_unsupported_order(self):
+        function = self.reducer.from_expression(lexpr(r'\x._walk(x)'))
+        argument = self.reducer.from_expression(lexpr(r'\y._dog(y)'))
+        with self.assertRaises(AssertionError):
+            self.reducer.compose(function, argument, 4)
+
+    def test_hash_consing(self):
+        term1 = self.reducer.from_expression(lexpr(r'\x.(_a(x) & _b(x))'))
+        term2 = self.reducer.from_expression(lexpr(r'\y.(_a(y) & _b(y))'))
+        self.assertIs(term1[4], term2[4])
+
+    def test_clear_table(self):
+        self.reducer = FastReducer(max_terms=4)
+        semantics = self.apply(r'\P x.(P(x) & _dog(x))', r'\y._big(y)')
+        self.assertEqual(r'\x.(_big(x) & _dog(x))', str(semantics))
+
+    def test_round_trip(self):
+        expression = lexpr(r'\x.(all y.(_a(y) -> -_b(x, y)) | (x = _c))')
+        term = self.reducer.from_expression(expression)
+        self.assertEqual(str(expression), str(self.reducer.to_expression(term)))
+
+class DifferentialReducerTestCase(unittest.TestCase):
+    def assert_same_application(self, function, argument):
+        nltk_reducer = NLTKReducer()
+        fast_reducer = FastReducer()
+        expected = nltk_reducer.apply(function, argument)
+        actual = fast_reducer.to_expression(fast_reducer.apply(
+            fast_reducer.from_expression(function),
+            fast_reducer.from_expression(argument)))
+        self.assertTrue(alpha_equivalent(expected, actual),
+                        msg='{0} vs. {1}'.format(expected, actual))
+
+    def test_shipped_templates(self):
+        arguments = [lexpr(r'_pred'), lexpr(r'\x._pred(x)'),
+                     lexpr(r'\x y._pred(x, y)'), lexpr(r'\F x.F(x)')]
+        filenames = sorted(
+            fn for pattern in kTemplatesPatterns for fn in glob.glob(pattern))
+        self.assertTrue(filenames)
+        for filename in filenames:
+            for rule in load_semantic_rules(filename):
+                for argument in arguments:
+                    self.assert_same_application(rule.semantics, argument)
+
+    def test_assign_semantics(self):
+        sentence_str = r"""
+      <sentence id="s0">
+        <tokens>
+          <token base="a" pos="DT" surf="a" id="t0_0"/>
+          <token base="dog" pos="NN" surf="dog" id="t0_1"/>
+          <token base="walk" pos="VBZ" surf="walks" id="t0_2"/>
+        </tokens>
+        <ccg root="sp0-1">
+          <span child="sp0-2 sp0-5" rule="&lt;" category="S" end="3" begin="0" id="sp0-1"/>
+          <span child="sp0-3 sp0-4" rule="&gt;" category="NP" end="2" begin="0" id="sp0-2"/>
+          <span terminal="t0_0" category="NP/N" end="1" begin="0" id="sp0-3"/>
+          <span terminal="t0_1" category="N" end="2" begin="1" id="sp0-4"/>
+          <span terminal="t0_2" category="S\NP" end="3" begin="2" id="sp0-5"/>
+        </ccg>
+      </sentence>
+    """
+        sentence = etree.fromstring(sentence_str)
+        semantic_index = SemanticIndex(None)
+        semantic_index.rules = [
+            SemanticRule(r'N', r'\E x.E(x)', {}),
+            SemanticRule(r'NP/N', r'\E F1 F2.exists x.(F1(x) & F2(x))', {}),
+            SemanticRule(r'S\NP', r'\E Q.Q(\x.exists e.(E(e) & (Subj(e) = x)))', {}),
+            SemanticRule(r'S', r'\L R.R(L)', {'rule' : '<'})]
+        semantic_index.reducer = get_reducer('check')
+        ccg_tree = assign_semantics_to_ccg(sentence, semantic_index)
+        self.assertTrue(semantic_index.reducer.num_checks > 0)
+        self.assertEqual(0, semantic_index.reducer.num_mismatches)
+        expected_semantics = lexpr(
+            r'exists x.(_dog(x) & exists e.(_walk(e) & (Subj(e) = x)))')
+        self.assertEqual(expected_semantics, lexpr(ccg_tree.get('sem')))
+
+    def test_check_reports_mismatch(self):
+        class WrongReducer(NLTKReducer):
+            def apply(self, function, argument):
+                return function
+        reducer = CheckingReducer(candidate=WrongReducer())
+        function = reducer.from_expression(lexpr(r'\x._dog(x)'))
+        argument = reducer.from_expression(lexpr(r'_a'))
+        with self.assertLogs(level='ERROR'):
+            semantics = reducer.apply(function, argument)
+        self.assertEqual(1, reducer.num_mismatches)
+        self.assertEqual(lexpr(r'_dog(_a)'), reducer.to_expression(semantics))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(FastReducerTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(DifferentialReducerTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -17,6 +17,41 @@
 import re
 import codecs
 
+# Symbols that are replaced in a single pass over the token.
+kNormalizationTable = str.maketrans({
+    '.' : '_DOT',
+    ',' : '_COMMA',
+    '(' : '_LEFTB',
+    ')' : '_RIGHTB',
+    '!' : '_EXCLAMATION',
+    '-' : '_dash_'})
+# Symbols that are only replaced when they are the whole token
+# (a trailing newline is allowed, as in the regular expression "^-$").
+kWholeTokenNormalization = {
+    '-' : '_HYPHEN',
+    '-\n' : '_HYPHEN\n',
+    '&' : '_AMPERSAND',
+    '&\n' : '_AMPERSAND\n'}
+# Names of normalized symbols, and the strings they are denormalized into.
+# Note that "_HYPHEN" and "_AMPERSAND" are denormalized into "^-$" and "^&$",
+# and "_DOT", "_LEFTB" and "_RIGHTB" keep a backslash.
+kDenormalizationTable = {
+    '_DOT' : r'\.',
+    '_COMMA' : ',',
+    '_LEFTB' : r'\(',
+    '_RIGHTB' : r'\)',
+    '_HYPHEN' : '^-$',
+    '_AMPERSAND' : '^&$',
+    '_EXCLAMATION' : '!',
+    '_dash_' : '-'}
+# "_dash_" does not match if its last underscore starts another symbol,
+# which takes precedence.
+kDenormalizationRegex = re.compile('{0}|_dash_(?!{1})'.format(
+    '|'.join(re.escape(s) for s in kDenormalizationTable if s != '_dash_'),
+    '|'.join(re.escape(s[1:]) for s in kDenormalizationTable if s != '_dash_')))
+# Suffix that might be introduced to avoid type clashes.
+kTypeSuffixRegex = re.compile(r'_[a-z][0-9]$')
+
 def normalize_token(token):
     """
     Convert symbols to avoid collisions with reserved punctuation
@@ -24,15 +59,9 @@ def normalize_token(token):
     To avoid collisions with reserved words, we prefix each token
     with an underscore '_'.
     """
-    normalized = token
-    normalized = re.sub(r'\.', '_DOT', normalized)
-    normalized = re.sub(r',', '_COMMA', normalized)
-    normalized = re.sub(r'\(', '_LEFTB', normalized)
-    normalized = re.sub(r'\)', '_RIGHTB', normalized)
-    normalized = re.sub(r'^-$', '_HYPHEN', normalized)
-    normalized = re.sub(r'^&$', '_AMPERSAND', normalized)
-    normalized = re.sub(r'!', '_EXCLAMATION', normalized)
-    normalized = re.sub(r'-', '_dash_', normalized)
+    normalized = kWholeTokenNormalization.get(token)
+    if normalized is None:
+        normalized = token.translate(kNormalizationTable)
     if not normalized.startswith('_'):
         normalized = '_' + normalized
     return normalized
@@ -42,19 +71,40 @@ def denormalize_token(token):
     Unconvert symbols. This is the reverse operation as above.
     """
     denormalized = token
-    denormalized = re.sub('_DOT', r'\.', denormalized)
-    denormalized = re.sub('_COMMA', r',', denormalized)
-    denormalized = re.sub('_LEFTB', r'\(', denormalized)
-    denormalized = re.sub('_RIGHTB', r'\)', denormalized)
-    denormalized = re.sub('_HYPHEN', r'^-$', denormalized)
-    denormalized = re.sub('_AMPERSAND', r'^&$', denormalized)
-    denormalized = re.sub('_EXCLAMATION', r'!', denormalized)
-    denormalized = re.sub('_dash_', r'-', denormalized)
-    # Remove possible suffix that was introduced to avoid type clashes.
-    denormalized = re.sub(r'_[a-z][0-9]$', '', denormalized)
-    denormalized = denormalized.lstrip('_')
+    if '_' in denormalized:
+        denormalized = kDenormalizationRegex.sub(
+            lambda match: kDenormalizationTable[match.group(0)], denormalized)
+        # Remove possible suffix that was introduced to avoid type clashes.
+        denormalized = kTypeSuffixRegex.sub('', denormalized)
+        denormalized = denormalized.lstrip('_')
     return denormalized
 
+def normalize_tokens(tokens):
+    """
+    In our format of XML trees, tokens have their own tree,
+    which is separated from the syntactic structure. These
+    tokens may need some processing for normalization, such
+    as prefixing them with an underscore "_", or copying
+    into their base form the surface form when the base form
+    is absent (base="*"). The <tokens> node is normalized in place
+    and returned. Tokens that appear several times are normalized once.
+    """
+    normalized_tokens = {}
+    for token in tokens:
+        attrib = token.attrib
+        if attrib.get('base', None) == '*':
+            attrib['base'] = attrib.get('surf', '*')
+        for name in ('base', 'surf'):
+            value = attrib.get(name)
+            if value is None or value.startswith('_'):
+                continue
+            normalized = normalized_tokens.get(value)
+            if normalized is None:
+                normalized = normalize_token(value)
+                normalized_tokens[value] = normalized
+            attrib[name] = normalized
+    return tokens
+
 def substitute_invalid_chars(script, replacement_filename):
     with codecs.open(replacement_filename, 'r', 'utf-8') as finput:
         repl = dict(line.strip().split() for line in finput)
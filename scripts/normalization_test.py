@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from lxml import etree
+
+from normalization import denormalize_token
+from normalization import normalize_token
+from normalization import normalize_tokens
+
+class NormalizeTokenTestCase(unittest.TestCase):
+    def test_symbols(self):
+        self.assertEqual('_U_DOTS_DOT', normalize_token('U.S.'))
+        self.assertEqual('_well_dash_known', normalize_token('well-known'))
+        self.assertEqual('_LEFTB', normalize_token('('))
+        self.assertEqual('_a_COMMAb_RIGHTB_EXCLAMATION', normalize_token('a,b)!'))
+
+    def test_whole_token_symbols(self):
+        self.assertEqual('_HYPHEN', normalize_token('-'))
+        self.assertEqual('_AMPERSAND', normalize_token('&'))
+        self.assertEqual('_AT_and_T', normalize_token('AT_and_T'))
+        self.assertEqual('_AT&T', normalize_token('AT&T'))
+        self.assertEqual('_dash__dash_', normalize_token('--'))
+
+    def test_prefix(self):
+        self.assertEqual('_dog', normalize_token('dog'))
+        self.assertEqual('_dog', normalize_token('_dog'))
+        self.assertEqual('_犬', normalize_token('犬'))
+
+    def test_denormalize(self):
+        self.assertEqual('well-known', denormalize_token('_well_dash_known'))
+        self.assertEqual('a,b!', denormalize_token('_a_COMMAb_EXCLAMATION'))
+        self.assertEqual(r'U\.S\.', denormalize_token('_U_DOTS_DOT'))
+        self.assertEqual('^-$', denormalize_token('_HYPHEN'))
+        self.assertEqual('dog', denormalize_token('dog'))
+
+    def test_denormalize_type_suffix(self):
+        self.assertEqual('run', denormalize_token('_run_e2'))
+        self.assertEqual('run_e2x', denormalize_token('_run_e2x'))
+
+    def test_denormalize_overlapping_symbols(self):
+        self.assertEqual(r'dash\.', denormalize_token('_dash_DOT'))
+        self.assertEqual('-dash,', denormalize_token('_dash_dash_COMMA'))
+        self.assertEqual('-a1', denormalize_token('_dash_a1'))
+
+class NormalizeTokensTestCase(unittest.TestCase):
+    def test_tokens(self):
+        tokens_str = r"""
+        <tokens>
+          <token base="*" surf="U.S." id="t0_0"/>
+          <token base="be" surf="is" id="t0_1"/>
+          <token base="_done" surf="-" id="t0_2"/>
+          <token surf="is" id="t0_3"/>
+        </tokens>
+    """
+        tokens = normalize_tokens(etree.fromstring(tokens_str))
+        expected = [
+            {'base' : '_U_DOTS_DOT', 'surf' : '_U_DOTS_DOT', 'id' : 't0_0'},
+            {'base' : '_be', 'surf' : '_is', 'id' : 't0_1'},
+            {'base' : '_done', 'surf' : '_HYPHEN', 'id' : 't0_2'},
+            {'surf' : '_is', 'id' : 't0_3'}]
+        self.assertEqual(expected, [dict(token.attrib) for token in tokens])
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(NormalizeTokenTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(NormalizeTokensTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import functools
+import json
+import math
+import threading
+import time
+
+kPercentiles = (50, 90, 99)
+
+class Profiler(object):
+    """
+    Measures the time spent in nested spans of code:
+
+        with span('composition'):
+            with span('beta_reduction'):
+                ...
+
+    Durations are recorded under the path of the span, i.e. the names of
+    the enclosing spans and its own name joined by "/" (e.g.
+    "sentence/composition/beta_reduction"). The profiler is disabled by
+    default, in which case spans do nothing. Each thread has its own path
+    (see in_current_path). Besides durations, the profiler keeps named
+    counters (see count), e.g. the hits of a cache.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.local = threading.local()
+        # Maps span paths to lists of durations (in seconds).
+        self.records = {}
+        # Maps counter names to their values.
+        self.counters = {}
+        self.start_time = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        if enabled and self.start_time is None:
+            self.start_time = time.perf_counter()
+
+    @property
+    def path(self):
+        path = getattr(self.local, 'path', None)
+        if path is None:
+            path = self.local.path = []
+        return path
+
+    @path.setter
+    def path(self, path):
+        self.local.path = path
+
+    def in_current_path(self, function):
+        """
+        Returns a function that runs function with the span path of the
+        current thread, so that spans in other threads (e.g. the target of
+        a threading.Thread) are recorded as nested in the current span.
+        """
+        path = list(self.path)
+        @functools.wraps(function)
+        def _wrapper(*args, **kwargs):
+            self.path = list(path)
+            return function(*args, **kwargs)
+        return _wrapper
+
+    def span(self, name):
+        if not self.enabled:
+            return kNullSpan
+        return Span(self, name)
+
+    def count(self, name, value=1):
+        """
+        Adds value to the counter name, if the profiler is enabled.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def task(self):
+        """
+        Returns a context manager whose spans are recorded separately from
+        the current ones (and without their path), in its attribute
+        records, and whose counters are in its attribute counters. Tasks
+        are used to profile each document, possibly in worker processes,
+        and records are merged later into the main profiler.
+        """
+        return ProfilerTask(self)
+
+    def merge(self, records, counters=None):
+        for path, durations in records.items():
+            self.records.setdefault(path, []).extend(durations)
+        if counters is not None:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_report(self):
+        """
+        Returns a dictionary with the count, total, mean, maximum and
+        percentiles of the durations of every span path, and the counters.
+        """
+        spans = {}
+        for path, durations in sorted(self.records.items()):
+            durations = sorted(durations)
+            total = sum(durations)
+            stats = {'count' : len(durations),
+                     'total' : total,
+                     'mean' : total / len(durations),
+                     'max' : durations[-1]}
+            for percentile in kPercentiles:
+                stats['p{0}'.format(percentile)] = \
+                    get_percentile(durations, percentile)
+            spans[path] = stats
+        report = {'spans' : spans, 'counters' : dict(self.counters)}
+        if self.start_time is not None:
+            report['wall_time'] = time.perf_counter() - self.start_time
+        return report
+
+    def write_report(self, filename):
+        with open(filename, 'w') as outfile:
+            json.dump(self.get_report(), outfile, indent=2, sort_keys=True)
+
+class Span(object):
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.path.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        duration = time.perf_counter() - self.start
+        path = self.profiler.path
+        key = '/'.join(path)
+        path.pop()
+        self.profiler.records.setdefault(key, []).append(duration)
+        return False
+
+class NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+kNullSpan = NullSpan()
+
+class ProfilerTask(object):
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.records = None
+        self.counters = None
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.enabled:
+            self.saved = (profiler.path, profiler.records, profiler.counters)
+            profiler.path, profiler.records, profiler.counters = [], {}, {}
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        profiler = self.profiler
+        if profiler.enabled:
+            self.records, self.counters = profiler.records, profiler.counters
+            profiler.path, profiler.records, profiler.counters = self.saved
+        return False
+
+def get_percentile(sorted_values, percentile):
+    """
+    Returns the percentile of a non-empty sorted list (nearest-rank method).
+    """
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+def summarize_records(records):
+    """
+    Returns a one-line summary of span records, with the total time
+    of each span path, e.g. "sentence=0.0123 sentence/tree_building=0.0010".
+    """
+    return ' '.join('{0}={1:.4f}'.format(path, sum(durations))
+                    for path, durations in sorted(records.items()))
+
+# Profiler of this process.
+PROFILER = Profiler()
+
+def span(name):
+    return PROFILER.span(name)
+
+def profiled(name):
+    """
+    Decorator that records every call to a function in a span.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def _wrapper(*args, **kwargs):
+            with PROFILER.span(name):
+                return fn(*args, **kwargs)
+        return _wrapper
+    return decorator
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import threading
+import unittest
+
+from profiling import get_percentile
+from profiling import Profiler
+from profiling import summarize_records
+
+class ProfilerTestCase(unittest.TestCase):
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.span('sentence'):
+            with profiler.span('composition'):
+                pass
+        with profiler.task() as task:
+            with profiler.span('sentence'):
+                pass
+        self.assertEqual({}, profiler.records)
+        self.assertIsNone(task.records)
+
+    def test_nested_spans(self):
+        profiler = Profiler()
+        profiler.enable()
+        with profiler.span('sentence'):
+            with profiler.span('composition'):
+                with profiler.span('beta_reduction'):
+                    pass
+                with profiler.span('beta_reduction'):
+                    pass
+        self.assertEqual(
+            ['sentence', 'sentence/composition',
+             'sentence/composition/beta_reduction'],
+            sorted(profiler.records))
+        self.assertEqual(
+            2, len(profiler.records['sentence/composition/beta_reduction']))
+        self.assertEqual([], profiler.path)
+
+    def test_span_with_exception(self):
+        profiler = Profiler()
+        profiler.enable()
+        with self.assertRaises(ValueError):
+            with profiler.span('sentence'):
+                raise ValueError
+        self.assertEqual(['sentence'], list(profiler.records))
+        self.assertEqual([], profiler.path)
+
+    def test_task_and_merge(self):
+        profiler = Profiler()
+        profiler.enable()
+        with profiler.span('prove_docs'):
+            with profiler.task() as task:
+                with profiler.span('document'):
+                    with profiler.span('coqtop'):
+                        pass
+        self.assertEqual(['document', 'document/coqtop'], sorted(task.records))
+        self.assertEqual(['prove_docs'], list(profiler.records))
+        profiler.merge(task.records)
+        profiler.merge(task.records)
+        self.assertEqual(2, len(profiler.records['document/coqtop']))
+
+    def test_counters(self):
+        profiler = Profiler()
+        profiler.count('lexical_cache/hits')
+        self.assertEqual({}, profiler.counters)
+        profiler.enable()
+        profiler.count('lexical_cache/hits', 2)
+        with profiler.task() as task:
+            profiler.count('lexical_cache/hits', 3)
+            profiler.count('lexical_cache/misses')
+        self.assertEqual({'lexical_cache/hits' : 3, 'lexical_cache/misses' : 1},
+                         task.counters)
+        self.assertEqual({'lexical_cache/hits' : 2}, profiler.counters)
+        profiler.merge(task.records, task.counters)
+        self.assertEqual({'lexical_cache/hits' : 5, 'lexical_cache/misses' : 1},
+                         profiler.get_report()['counters'])
+
+    def test_threads(self):
+        profiler = Profiler()
+        profiler.enable()
+        def prove():
+            with profiler.span('coqtop'):
+                pass
+        with profiler.span('document'):
+            threads = [threading.Thread(target=profiler.in_current_path(prove))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(['document', 'document/coqtop'], sorted(profiler.records))
+        self.assertEqual(2, len(profiler.records['document/coqtop']))
+        self.assertEqual([], profiler.path)
+
+    def test_report(self):
+        profiler = Profiler()
+        profiler.enable()
+        profiler.merge({'sentence' : [float(i) for i in range(1, 101)]})
+        report = profiler.get_report()
+        stats = report['spans']['sentence']
+        self.assertEqual(100, stats['count'])
+        self.assertEqual(5050.0, stats['total'])
+        self.assertEqual(50.5, stats['mean'])
+        self.assertEqual(100.0, stats['max'])
+        self.assertEqual(50.0, stats['p50'])
+        self.assertEqual(90.0, stats['p90'])
+        self.assertEqual(99.0, stats['p99'])
+        self.assertIn('wall_time', report)
+
+class ProfilingFunctionsTestCase(unittest.TestCase):
+    def test_percentile(self):
+        self.assertEqual(3, get_percentile([3], 50))
+        self.assertEqual(1, get_percentile([1, 2, 3, 4], 1))
+        self.assertEqual(2, get_percentile([1, 2, 3, 4], 50))
+        self.assertEqual(4, get_percentile([1, 2, 3, 4], 99))
+
+    def test_summarize_records(self):
+        records = {'sentence/composition' : [0.25, 0.5],
+                   'sentence' : [1.0]}
+        self.assertEqual(
+            'sentence=1.0000 sentence/composition=0.7500',
+            summarize_records(records))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProfilerTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(ProfilingFunctionsTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
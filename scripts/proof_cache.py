@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import simplejson
+
+# Increase it when changes in the code change how Coq outputs are used,
+# so that results cached by previous versions are not used.
+kCacheVersion = 3
+kCacheFilename = 'proofs.sqlite'
+# Default maximum size (in bytes) of the cached results.
+kDefaultCacheSize = 1024 * 1024 * 1024
+# Time (in seconds) that a process waits for others that write to the cache.
+kLockTimeout = 60
+
+class ProofResult(object):
+    """
+    Result of running a Coq script: whether the theorem was defined, the
+    output lines and the running time in seconds. If the script timed out,
+    timeout is the time limit that was exceeded and output_lines are the
+    lines printed before it.
+    """
+
+    def __init__(self, verdict, output_lines, elapsed, timeout=None):
+        self.verdict = verdict
+        self.output_lines = output_lines
+        self.elapsed = elapsed
+        self.timeout = timeout
+
+    def __repr__(self):
+        return 'ProofResult(verdict={0}, elapsed={1}, timeout={2})'.format(
+            self.verdict, self.elapsed, self.timeout)
+
+    @property
+    def timed_out(self):
+        return self.timeout is not None
+
+    def is_valid_for(self, timeout):
+        """
+        Returns True if the result is the one of a run with this timeout:
+        it finished within timeout seconds, or it timed out with a time
+        limit at least as large. Results that timed out with a smaller
+        time limit should be computed again.
+        """
+        if self.timed_out:
+            return self.timeout >= timeout
+        return self.elapsed <= timeout
+
+class ProofCache(object):
+    """
+    Persistent store of the results of Coq scripts, in a sqlite database
+    inside a directory. Results are keyed on a hash of the script and of
+    the settings (e.g. tactics and compiled coqlib). The same directory
+    can be used by several processes at the same time, and the same cache
+    by several threads.
+    When the total size of the results exceeds max_size bytes, the least
+    recently used entries are evicted (see evict).
+    """
+
+    def __init__(self, directory, settings, max_size=kDefaultCacheSize):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.max_size = max_size
+        settings_hash = hashlib.sha1(str(kCacheVersion).encode('utf-8'))
+        settings_hash.update(settings)
+        self.settings_digest = settings_hash.digest()
+        self.connection = sqlite3.connect(
+            os.path.join(directory, kCacheFilename), timeout=kLockTimeout,
+            check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS proofs ('
+            'key TEXT PRIMARY KEY, verdict INTEGER NOT NULL, output TEXT, '
+            'elapsed REAL NOT NULL, timeout REAL, '
+            'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS proofs_last_used ON proofs (last_used)')
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'ProofCache(hits={0}, misses={1})'.format(self.hits, self.misses)
+
+    def get_key(self, coq_script):
+        key = hashlib.sha1(self.settings_digest)
+        key.update(coq_script.encode('utf-8'))
+        return key.hexdigest()
+
+    def get(self, coq_script, timeout):
+        """
+        Returns the ProofResult of coq_script that is valid for timeout,
+        or None if there is no such result.
+        """
+        key = self.get_key(coq_script)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT verdict, output, elapsed, timeout FROM proofs WHERE key = ?',
+                (key,)).fetchone()
+            result = None if row is None else load_result(row)
+            if result is None or not result.is_valid_for(timeout):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Changes are committed immediately, so that other processes
+            # are not blocked.
+            self.connection.execute(
+                'UPDATE proofs SET last_used = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+        return result
+
+    def put(self, coq_script, result):
+        """
+        Stores the ProofResult of coq_script.
+        """
+        output = None
+        if result.output_lines is not None:
+            output = simplejson.dumps(result.output_lines)
+        size = len(coq_script) + (0 if output is None else len(output))
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO proofs '
+                '(key, verdict, output, elapsed, timeout, size, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.get_key(coq_script), int(result.verdict), output,
+                 result.elapsed, result.timeout, size, time.time()))
+            self.connection.commit()
+
+    def evict(self):
+        """
+        Evicts the least recently used entries if the cache is too large.
+        """
+        with self.lock:
+            total_size = self.connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM proofs').fetchone()[0]
+            if total_size <= self.max_size:
+                return
+            evicted_keys = []
+            for key, size in self.connection.execute(
+                'SELECT key, size FROM proofs ORDER BY last_used'):
+                if total_size <= self.max_size:
+                    break
+                evicted_keys.append((key,))
+                total_size -= size
+            self.connection.executemany(
+                'DELETE FROM proofs WHERE key = ?', evicted_keys)
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def load_result(row):
+    verdict, output, elapsed, timeout = row
+    output_lines = None if output is None else simplejson.loads(output)
+    return ProofResult(bool(verdict), output_lines, elapsed, timeout)
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import shutil
+import tempfile
+import unittest
+
+from proof_cache import ProofCache
+from proof_cache import ProofResult
+
+class ProofCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.coq_script = 'Require Export coqlib.\nTheorem t1: True. nltac. Qed.'
+        self.output_lines = ['Coq < t1 is defined', '']
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        cache = ProofCache(self.directory, b'settings')
+        self.assertIsNone(cache.get(self.coq_script, 100))
+        cache.put(self.coq_script, ProofResult(True, self.output_lines, 1.5))
+        result = cache.get(self.coq_script, 100)
+        self.assertTrue(result.verdict)
+        self.assertEqual(self.output_lines, result.output_lines)
+        self.assertEqual(1.5, result.elapsed)
+        self.assertFalse(result.timed_out)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+        cache.close()
+
+    def test_persistent(self):
+        cache = ProofCache(self.directory, b'settings')
+        cache.put(self.coq_script, ProofResult(True, self.output_lines, 1.5))
+        cache.close()
+        cache = ProofCache(self.directory, b'settings')
+        self.assertIsNotNone(cache.get(self.coq_script, 100))
+        cache.close()
+
+    def test_key_depends_on_settings(self):
+        cache = ProofCache(self.directory, b'settings1')
+        cache.put(self.coq_script, ProofResult(True, self.output_lines, 1.5))
+        cache.close()
+        cache = ProofCache(self.directory, b'settings2')
+        self.assertIsNone(cache.get(self.coq_script, 100))
+        cache.close()
+
+    def test_timeouts(self):
+        cache = ProofCache(self.directory, b'settings')
+        cache.put(self.coq_script, ProofResult(False, ['Welcome to Coq'], 10.2, 10))
+        result = cache.get(self.coq_script, 5)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(['Welcome to Coq'], result.output_lines)
+        self.assertIsNotNone(cache.get(self.coq_script, 10))
+        # Scripts that timed out are run again with larger time limits.
+        self.assertIsNone(cache.get(self.coq_script, 100))
+        cache.put(self.coq_script, ProofResult(True, self.output_lines, 20))
+        self.assertIsNotNone(cache.get(self.coq_script, 100))
+        # Results that took longer than the time limit are not valid for it.
+        self.assertIsNone(cache.get(self.coq_script, 10))
+        cache.close()
+
+    def test_evict(self):
+        cache = ProofCache(self.directory, b'settings', max_size=200)
+        scripts = [self.coq_script + str(i) for i in range(3)]
+        for script in scripts:
+            cache.put(script, ProofResult(True, self.output_lines, 1.5))
+        cache.get(scripts[0], 100)
+        cache.evict()
+        self.assertIsNotNone(cache.get(scripts[0], 100))
+        self.assertIsNone(cache.get(scripts[1], 100))
+        self.assertIsNotNone(cache.get(scripts[2], 100))
+        cache.close()
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProofCacheTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
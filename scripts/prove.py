@@ -19,31 +19,39 @@ from __future__ import print_function
 
 import argparse
 import codecs
+import hashlib
 import logging
 from lxml import etree
-from multiprocessing import Pool
-from multiprocessing import Lock
 import os
 from subprocess import CalledProcessError
 from subprocess import TimeoutExpired
 import sys
 import textwrap
 
+from coqtop_pool import CoqtopPool
+from executor import Executor
+from executor import TaskError
+from profiling import PROFILER
+from profiling import span
+from profiling import summarize_records
+from proof_cache import ProofCache
 from semantic_tools import prove_doc
 from semparse import serialize_tree
+from tactics import get_tactics
+import theorem
+from theorem import use_coqtop_pool
+from theorem import use_proof_cache
 from utils import time_count
 from visualization_tools import convert_root_to_mathml
 
 ARGS=None
-DOCS=None
 ABDUCTION=None
 kMaxTasksPerChild=None
-lock = Lock()
+# Compiled library loaded by the Coq scripts.
+kCoqlibFilename = 'coqlib.vo'
 
 def main(args = None):
     global ARGS
-    global DOCS
-    global ABDUCTION
     DESCRIPTION=textwrap.dedent("""\
             The input file sem should contain the parsed sentences. All CCG trees correspond
             to the premises, except the last one, which is the hypothesis.
@@ -71,6 +79,31 @@ def main(args = None):
         help="Maximum running time for each possible theorem.")
     parser.add_argument("--ncores", nargs='?', type=int, default="1",
         help="Number of cores for multiprocessing.")
+    parser.add_argument("--concurrent-negation", action="store_true", default=False,
+        help="Run Coq for each theorem and its negation at the same time, " +
+             "and stop as soon as one of them is proved.")
+    parser.add_argument("--theorems-in-flight", nargs='?', type=int, default="1",
+        help="Number of theorems (from different semantic interpretations " +
+             "of the sentences) that are proved at the same time for each " +
+             "document. Proving stops as soon as one of them is proved.")
+    parser.add_argument("--doc-timeout", nargs='?', type=int, default="0",
+        help="Maximum running time for all the theorems of a document " +
+             "(default: 0, no limit).")
+    parser.add_argument("--coqtop-sessions", nargs='?', type=int, default="0",
+        help="Number of long-lived coqtop sessions (with coqlib loaded) per " +
+             "process that run the theorems. If 0 (default), a coqtop process " +
+             "is started for each theorem.")
+    parser.add_argument("--proof-cache", nargs='?', type=str, default="",
+        help="Directory where results of Coq scripts are cached, so that " +
+             "Coq only runs for scripts (or tactics, or coqlib) that changed.")
+    parser.add_argument("--proof-cache-size", nargs='?', type=int, default="1024",
+        help="Maximum size of the proof cache in MB (default: 1024).")
+    parser.add_argument("--profile", nargs='?', type=str, default="",
+        help="JSON file where the time spent in each stage (count, total, " +
+             "mean and percentiles) is written.")
+    parser.add_argument("--profile-attributes", action="store_true", default=False,
+        help="Add to each <proof> a \"profile\" attribute with the time " +
+             "spent in each stage.")
     ARGS = parser.parse_args()
 
     logging.basicConfig(level=logging.WARNING)
@@ -80,22 +113,18 @@ def main(args = None):
         parser.print_help(file=sys.stderr)
         sys.exit(1)
     
-    if ARGS.abduction == "spsa":
-        from abduction_spsa import AxiomsWordnet
-        ABDUCTION = AxiomsWordnet()
-    elif ARGS.abduction == "naive":
-        from abduction_naive import AxiomsWordnet
-        ABDUCTION = AxiomsWordnet()
+    PROFILER.enable(bool(ARGS.profile or ARGS.profile_attributes))
+    if ARGS.ncores <= 1:
+        initialize(ARGS)
 
     parser = etree.XMLParser(remove_blank_text=True)
     root = etree.parse(ARGS.sem, parser)
 
-    DOCS = root.findall('.//document')
-    document_inds = range(len(DOCS))
-    proof_nodes = prove_docs(document_inds, ARGS.ncores)
-    assert len(proof_nodes) == len(DOCS), \
-        'Num. elements mismatch: {0} vs {1}'.format(len(proof_nodes), len(DOCS))
-    for doc, proof_node in zip(DOCS, proof_nodes):
+    docs = root.findall('.//document')
+    proof_nodes = prove_docs(docs, ARGS.ncores)
+    assert len(proof_nodes) == len(docs), \
+        'Num. elements mismatch: {0} vs {1}'.format(len(proof_nodes), len(docs))
+    for doc, proof_node in zip(docs, proof_nodes):
         doc.append(proof_node)
 
     if ARGS.proof:
@@ -106,6 +135,13 @@ def main(args = None):
         with codecs.open(ARGS.graph_out, 'w', 'utf-8') as fout:
             fout.write(html_str)
 
+    if ARGS.profile:
+        PROFILER.write_report(ARGS.profile)
+
+    # Stop the coqtop sessions of this process, if any.
+    use_coqtop_pool(None)
+    close_proof_cache()
+
 @time_count
 def serialize_tree_to_file(tree_xml, fname):
     root_xml_str = serialize_tree(tree_xml)
@@ -113,72 +149,141 @@ def serialize_tree_to_file(tree_xml, fname):
         fout.write(root_xml_str)
     return
 
+def initialize(args):
+    """
+    Loads the command line arguments and the abduction mechanism.
+    It is called once in each worker process.
+    """
+    global ARGS
+    global ABDUCTION
+    ARGS = args
+    PROFILER.enable(bool(args.profile or args.profile_attributes))
+    ABDUCTION = None
+    use_coqtop_pool(
+        CoqtopPool(args.coqtop_sessions) if args.coqtop_sessions > 0 else None)
+    use_proof_cache(open_proof_cache(args) if args.proof_cache else None)
+    if args.abduction == "spsa":
+        from abduction_spsa import AxiomsWordnet
+        ABDUCTION = AxiomsWordnet()
+    elif args.abduction == "naive":
+        from abduction_naive import AxiomsWordnet
+        ABDUCTION = AxiomsWordnet()
+
+def open_proof_cache(args):
+    return ProofCache(args.proof_cache, get_proof_cache_settings(),
+                      args.proof_cache_size * 1024 * 1024)
+
+def close_proof_cache():
+    """
+    Evicts old results if the proof cache is too large (results are
+    stored by every process as soon as they are available).
+    """
+    if not ARGS.proof_cache:
+        return
+    if theorem.PROOF_CACHE is None:
+        use_proof_cache(open_proof_cache(ARGS))
+    logging.info(theorem.PROOF_CACHE)
+    theorem.PROOF_CACHE.evict()
+    use_proof_cache(None)
+
+def get_proof_cache_settings():
+    """
+    Returns the settings (as bytes) that results of Coq scripts depend on,
+    other than the scripts themselves: the tactics and the compiled coqlib
+    (which also changes with the version of Coq).
+    """
+    settings = get_tactics().encode('utf-8') + b'\n'
+    if os.path.exists(kCoqlibFilename):
+        with open(kCoqlibFilename, 'rb') as fin:
+            settings += hashlib.sha1(fin.read()).digest()
+    return settings
+
 @time_count
-def prove_docs(document_inds, ncores=1):
+def prove_docs(docs, ncores=1):
+    """
+    Performs RTE inference for every lxml <document> node in docs, and
+    returns their proof nodes. Inference results are printed as soon as
+    they are available, in the same order as docs.
+    """
     if ncores <= 1:
-        proof_nodes = prove_docs_seq(document_inds)
+        prove_function, tasks = prove_doc_node, docs
     else:
-        proof_nodes = prove_docs_par(document_inds, ncores)
+        prove_function = prove_doc_str
+        tasks = (etree.tostring(doc) for doc in docs)
+    proof_nodes = []
+    with Executor(ncores, initialize, (ARGS,),
+                  maxtasksperchild=kMaxTasksPerChild) as executor:
+        for doc, result in zip(docs, executor.imap(prove_function, tasks)):
+            if isinstance(result, TaskError):
+                errors = [result.message]
+                proof_node = etree.Element('proof', status='failed')
+                proof_node.set('inference_result', 'unknown')
+            else:
+                proof_node_str, errors, records = result
+                proof_node = etree.fromstring(proof_node_str)
+                if records is not None:
+                    PROFILER.merge(records)
+                    if ARGS.profile_attributes:
+                        proof_node.set('profile', summarize_records(records))
+            for error in errors:
+                logging.error(error)
+            print_proof_result(doc, proof_node)
+            proof_nodes.append(proof_node)
     print('', file=sys.stdout)
-    proof_nodes = [etree.fromstring(p) for p in proof_nodes]
-    return proof_nodes
-
-def prove_docs_par(document_inds, ncores=3):
-    pool = Pool(processes=ncores, maxtasksperchild=kMaxTasksPerChild)
-    proof_nodes = pool.map(prove_doc_ind, document_inds)
-    pool.close()
-    pool.join()
     return proof_nodes
 
-def prove_docs_seq(document_inds):
-    proof_nodes = []
-    for document_ind in document_inds:
-        proof_node = prove_doc_ind(document_ind)
-        proof_nodes.append(proof_node)
-    return proof_nodes
+def prove_doc_str(doc_str):
+    return prove_doc_node(etree.fromstring(doc_str))
 
-def prove_doc_ind(document_ind):
+def prove_doc_node(doc):
     """
-    Perform RTE inference for the document ID document_ind.
-    It returns an XML node with proof information.
+    Perform RTE inference for the lxml <document> node doc.
+    It returns an XML node with proof information (serialized),
+    a list of error messages, which are logged by the caller, and the
+    profiling records of the document (None if profiling is disabled).
     """
-    global lock
-    doc = DOCS[document_ind]
+    with PROFILER.task() as task:
+        with span('document'):
+            proof_node_str, errors = make_proof_node(doc)
+    return proof_node_str, errors, task.records
+
+def make_proof_node(doc):
     proof_node = etree.Element('proof')
-    inference_result = 'unknown'
+    errors = []
     try:
         theorem = prove_doc(doc, ABDUCTION, ARGS)
         proof_node.set('status', 'success')
         inference_result = theorem.result
         proof_node.set('inference_result', inference_result)
-        theorems_node = theorem.to_xml()
+        with span('to_xml'):
+            theorems_node = theorem.to_xml()
         proof_node.append(theorems_node)
     except TimeoutExpired as e:
         proof_node.set('status', 'timedout')
         proof_node.set('inference_result', 'unknown')
     except Exception as e:
         doc_id = doc.get('id', '(unspecified)')
-        lock.acquire()
-        logging.error('An error occurred: {0}\nDoc ID: {1}\nTree XML:\n{2}'.format(
+        errors.append('An error occurred: {0}\nDoc ID: {1}\nTree XML:\n{2}'.format(
             e, doc_id,
             etree.tostring(doc, encoding='utf-8', pretty_print=True).decode('utf-8')))
-        lock.release()
         proof_node.set('status', 'failed')
         proof_node.set('inference_result', 'unknown')
+    with span('serialization'):
+        proof_node_str = etree.tostring(proof_node)
+    return proof_node_str, errors
+
+def print_proof_result(doc, proof_node):
     if ARGS.print == 'status':
         label = proof_node.get('status')
     else:
         label = proof_node.get('inference_result', 'unknown')
-    lock.acquire()
     if ARGS.print_length == 'full':
         pair_id = doc.get('pair_id', '').strip()
         result = '{0} {1}'.format(pair_id, label) if len(pair_id) > 0 else label
         print(result, end='\n', file=sys.stdout)
     elif ARGS.print_length == 'short':
         print(label[0], end='', file=sys.stdout)
-    lock.release()
     sys.stdout.flush()
-    return etree.tostring(proof_node)
 
 if __name__ == '__main__':
     main()
@@ -19,14 +19,36 @@ import unittest
 
 from abduction_tools_test import GetPremisesThatMatchConclusionArgsTestCase
 from abduction_tools_test import GetTreePredArgsTestCase
+from benchmark_test import CompareResultsTestCase
+from benchmark_test import SyntheticTreesTestCase
 from category_test import CategoryTestCase
+from ccg_tree_test import SemanticParserTestCase
 from ccg2lambda_tools_test import AssignSemanticsToCCGTestCase
 from ccg2lambda_tools_test import AssignSemanticsToCCGWithFeatsTestCase
+from ccg2lambda_tools_test import BuildCCGTreeTestCase
+from ccg2lambda_tools_test import ComposeFunctionsTestCase
 from ccg2lambda_tools_test import get_attributes_from_ccg_node_recursivelyTestCase
+from ccg2lambda_tools_test import SubtreeMemoTestCase
 from ccg2lambda_tools_test import TypeRaiseTestCase
+from ccg2lambda_tools_test import UnreadableSemanticsTestCase
+from coqtop_pool_test import CoqtopPoolTestCase
+from etree_utils_test import IncrementalTreeWriterTestCase
+from executor_test import ExecutorTestCase
 from knowledge_test import LexicalRelationsTestCase
+from lambda_reducer_test import DifferentialReducerTestCase
+from lambda_reducer_test import FastReducerTestCase
 from nltk2coq_test import Nltk2coqTestCase
+from normalization_test import NormalizeTokensTestCase
+from normalization_test import NormalizeTokenTestCase
+from profiling_test import ProfilerTestCase
+from profiling_test import ProfilingFunctionsTestCase
+from proof_cache_test import ProofCacheTestCase
+from semantic_cache_test import SemanticCacheTestCase
+from semantic_index_test import GetRelevantRulesTestCase
 from semantic_index_test import GetSemanticRepresentationTestCase
+from semantic_index_test import LexicalCacheTestCase
+from semantic_index_test import RulePatternTestCase
+from semantic_index_test import SemanticBundleTestCase
 from semantic_tools_test import resolve_prefix_to_infix_operationsTestCase
 from semantic_types_test import ArbiAutoTypesTestCase
 from semantic_types_test import build_arbitrary_dynamic_libraryTestCase
@@ -34,6 +56,12 @@ from semantic_types_test import build_dynamic_libraryTestCase
 from semantic_types_test import Coq2NLTKTypesTestCase
 from semantic_types_test import Coq2NLTKSignaturesTestCase
 from semantic_types_test import combine_signatures_or_rename_predsTestCase
+from semparse_server_test import SemanticParsingServiceTestCase
+from semparse_server_test import SentenceJsonTestCase
+from theorem_test import MasterTheoremTestCase
+from theorem_test import ProveConcurrentTestCase
+from theorem_test import ProveSimpleTestCase
+from theorem_test import TryAbductionTestCase
 
 if __name__ == '__main__':
     suite1  = unittest.TestLoader().loadTestsFromTestCase(AssignSemanticsToCCGTestCase)
@@ -53,7 +81,41 @@ if __name__ == '__main__':
     suite15 = unittest.TestLoader().loadTestsFromTestCase(GetPremisesThatMatchConclusionArgsTestCase)
     suite16 = unittest.TestLoader().loadTestsFromTestCase(combine_signatures_or_rename_predsTestCase)
     suite17 = unittest.TestLoader().loadTestsFromTestCase(CategoryTestCase)
+    suite18 = unittest.TestLoader().loadTestsFromTestCase(GetRelevantRulesTestCase)
+    suite19 = unittest.TestLoader().loadTestsFromTestCase(BuildCCGTreeTestCase)
+    suite20 = unittest.TestLoader().loadTestsFromTestCase(LexicalCacheTestCase)
+    suite21 = unittest.TestLoader().loadTestsFromTestCase(ComposeFunctionsTestCase)
+    suite22 = unittest.TestLoader().loadTestsFromTestCase(FastReducerTestCase)
+    suite23 = unittest.TestLoader().loadTestsFromTestCase(DifferentialReducerTestCase)
+    suite24 = unittest.TestLoader().loadTestsFromTestCase(SemanticCacheTestCase)
+    suite25 = unittest.TestLoader().loadTestsFromTestCase(IncrementalTreeWriterTestCase)
+    suite26 = unittest.TestLoader().loadTestsFromTestCase(ExecutorTestCase)
+    suite27 = unittest.TestLoader().loadTestsFromTestCase(SubtreeMemoTestCase)
+    suite28 = unittest.TestLoader().loadTestsFromTestCase(SemanticBundleTestCase)
+    suite29 = unittest.TestLoader().loadTestsFromTestCase(RulePatternTestCase)
+    suite30 = unittest.TestLoader().loadTestsFromTestCase(NormalizeTokenTestCase)
+    suite31 = unittest.TestLoader().loadTestsFromTestCase(NormalizeTokensTestCase)
+    suite32 = unittest.TestLoader().loadTestsFromTestCase(ProfilerTestCase)
+    suite33 = unittest.TestLoader().loadTestsFromTestCase(ProfilingFunctionsTestCase)
+    suite34 = unittest.TestLoader().loadTestsFromTestCase(SyntheticTreesTestCase)
+    suite35 = unittest.TestLoader().loadTestsFromTestCase(CompareResultsTestCase)
+    suite36 = unittest.TestLoader().loadTestsFromTestCase(SemanticParsingServiceTestCase)
+    suite37 = unittest.TestLoader().loadTestsFromTestCase(SentenceJsonTestCase)
+    suite38 = unittest.TestLoader().loadTestsFromTestCase(SemanticParserTestCase)
+    suite39 = unittest.TestLoader().loadTestsFromTestCase(CoqtopPoolTestCase)
+    suite40 = unittest.TestLoader().loadTestsFromTestCase(ProofCacheTestCase)
+    suite41 = unittest.TestLoader().loadTestsFromTestCase(ProveSimpleTestCase)
+    suite42 = unittest.TestLoader().loadTestsFromTestCase(TryAbductionTestCase)
+    suite43 = unittest.TestLoader().loadTestsFromTestCase(MasterTheoremTestCase)
+    suite44 = unittest.TestLoader().loadTestsFromTestCase(UnreadableSemanticsTestCase)
+    suite45 = unittest.TestLoader().loadTestsFromTestCase(ProveConcurrentTestCase)
     suites  = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6,
                                   suite7, suite8, suite9, suite10, suite11, suite12,
-                                  suite13, suite14, suite15, suite16, suite17])
+                                  suite13, suite14, suite15, suite16, suite17,
+                                  suite18, suite19, suite20, suite21, suite22,
+                                  suite23, suite24, suite25, suite26, suite27,
+                                  suite28, suite29, suite30, suite31, suite32,
+                                  suite33, suite34, suite35, suite36, suite37,
+                                  suite38, suite39, suite40, suite41,
+                                  suite42, suite43, suite44, suite45])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import os
+import sqlite3
+
+from lxml import etree
+import simplejson
+
+# Increase it when changes in the code produce different semantics,
+# so that results cached by previous versions are not used.
+kCacheVersion = 1
+kCacheFilename = 'semantics.sqlite'
+# Default maximum size (in bytes) of the cached results.
+kDefaultCacheSize = 1024 * 1024 * 1024
+
+class SemanticCache(object):
+    """
+    Persistent store of the <semantics> nodes produced for each sentence,
+    in a sqlite database inside a directory. Results are keyed on a hash of
+    the <tokens> and <ccg> nodes of the sentence and of the settings (e.g.
+    contents of the semantic templates and command line options).
+    When the total size of the results exceeds max_size bytes, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, directory, settings, max_size=kDefaultCacheSize):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.max_size = max_size
+        settings_hash = hashlib.sha1(str(kCacheVersion).encode('utf-8'))
+        settings_hash.update(settings)
+        self.settings_digest = settings_hash.digest()
+        self.connection = sqlite3.connect(os.path.join(directory, kCacheFilename))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS semantics ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'size INTEGER NOT NULL, last_used INTEGER NOT NULL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS semantics_last_used '
+            'ON semantics (last_used)')
+        self.connection.commit()
+        self.clock = self.connection.execute(
+            'SELECT COALESCE(MAX(last_used), 0) FROM semantics').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'SemanticCache(hits={0}, misses={1})'.format(self.hits, self.misses)
+
+    def get_key(self, sentence):
+        """
+        Returns the key of an lxml <sentence> node.
+        """
+        key = hashlib.sha1(self.settings_digest)
+        key.update(sentence.get('gold_tree', '0').encode('utf-8'))
+        for node in sentence:
+            if node.tag in ('tokens', 'ccg'):
+                key.update(etree.tostring(node, encoding='utf-8', with_tail=False))
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the list of serialized <semantics> nodes stored under key,
+        or None if there is no such entry.
+        """
+        row = self.connection.execute(
+            'SELECT value FROM semantics WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        self.connection.execute(
+            'UPDATE semantics SET last_used = ? WHERE key = ?', (self.clock, key))
+        return load_sem_nodes(row[0])
+
+    def put(self, key, sem_nodes):
+        """
+        Stores a list of serialized <semantics> nodes under key.
+        """
+        value = dump_sem_nodes(sem_nodes)
+        self.clock += 1
+        self.connection.execute(
+            'INSERT OR REPLACE INTO semantics (key, value, size, last_used) '
+            'VALUES (?, ?, ?, ?)', (key, value, len(value), self.clock))
+
+    def commit(self):
+        """
+        Evicts the least recently used entries if the cache is too large,
+        and writes changes to disk.
+        """
+        total_size = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM semantics').fetchone()[0]
+        if total_size > self.max_size:
+            evicted_keys = []
+            for key, size in self.connection.execute(
+                'SELECT key, size FROM semantics ORDER BY last_used'):
+                if total_size <= self.max_size:
+                    break
+                evicted_keys.append((key,))
+                total_size -= size
+            self.connection.executemany(
+                'DELETE FROM semantics WHERE key = ?', evicted_keys)
+        self.connection.commit()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+def dump_sem_nodes(sem_nodes):
+    return simplejson.dumps([s.decode('utf-8') for s in sem_nodes])
+
+def load_sem_nodes(value):
+    return [s.encode('utf-8') for s in simplejson.loads(value)]
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from semantic_cache import dump_sem_nodes
+from semantic_cache import SemanticCache
+
+class SemanticCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sentence_str = r"""
+      <sentence id="s0">
+        <tokens>
+          <token base="dog" pos="NN" surf="dog" id="t0_0"/>
+        </tokens>
+        <ccg root="sp0-1">
+          <span terminal="t0_0" category="N" end="1" begin="0" id="sp0-1"/>
+        </ccg>
+      </sentence>
+    """
+        parser = etree.XMLParser(remove_blank_text=True)
+        self.sentence = etree.fromstring(sentence_str, parser)
+        self.sem_nodes = [b'<semantics status="success"><span id="sp0-1" sem="_dog"/></semantics>']
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        cache = SemanticCache(self.directory, b'settings')
+        key = cache.get_key(self.sentence)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, self.sem_nodes)
+        self.assertEqual(self.sem_nodes, cache.get(key))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+        cache.close()
+
+    def test_persistent(self):
+        cache = SemanticCache(self.directory, b'settings')
+        cache.put(cache.get_key(self.sentence), self.sem_nodes)
+        cache.close()
+        cache = SemanticCache(self.directory, b'settings')
+        self.assertEqual(self.sem_nodes, cache.get(cache.get_key(self.sentence)))
+        cache.close()
+
+    def test_key_depends_on_settings(self):
+        cache1 = SemanticCache(self.directory, b'settings1')
+        cache2 = SemanticCache(self.directory, b'settings2')
+        self.assertNotEqual(
+            cache1.get_key(self.sentence), cache2.get_key(self.sentence))
+        cache1.close()
+        cache2.close()
+
+    def test_key_depends_on_ccg(self):
+        cache = SemanticCache(self.directory, b'settings')
+        key1 = cache.get_key(self.sentence)
+        self.sentence.find('.//span').set('category', 'NP')
+        key2 = cache.get_key(self.sentence)
+        self.assertNotEqual(key1, key2)
+        cache.close()
+
+    def test_key_ignores_semantics(self):
+        cache = SemanticCache(self.directory, b'settings')
+        key1 = cache.get_key(self.sentence)
+        self.sentence.append(etree.fromstring(self.sem_nodes[0]))
+        key2 = cache.get_key(self.sentence)
+        self.assertEqual(key1, key2)
+        cache.close()
+
+    def test_evict_least_recently_used(self):
+        value_size = len(dump_sem_nodes(self.sem_nodes))
+        cache = SemanticCache(self.directory, b'settings', max_size=2 * value_size)
+        for key in ['a', 'b']:
+            cache.put(key, self.sem_nodes)
+        cache.commit()
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', self.sem_nodes)
+        cache.commit()
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        cache.close()
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(SemanticCacheTestCase)
+    suites = unittest.TestSuite([suite1])
+    unittest.TextTestRunner(verbosity=2).run(suites)
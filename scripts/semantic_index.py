@@ -15,42 +15,115 @@
 #  limitations under the License.
 
 import codecs
+import hashlib
+import itertools
 from lxml import etree
+import nltk
+import os
+import pickle
+import re
 import simplejson
 import yaml
 
-from category import Category
+from category import get_category
 from etree_utils import get_node_at_path
+from lambda_reducer import NLTKReducer
 from logic_parser import lexpr
 from normalization import normalize_token
+from profiling import span
+from semantic_rule import RulePattern
 from semantic_rule import SemanticRule
+from utils import LRUCache
+
+# Maximum number of (rule, predicate, coq_type) entries whose
+# semantics are memoized for terminal nodes.
+kLexicalCacheSize = 65536
+
+# Increase it when changes in the code (e.g. of SemanticRule or RuleIndex)
+# make previously compiled template bundles invalid.
+kBundleVersion = 2
+kBundleSuffix = '.bundle'
+
+# Default templates, used when no semantic rule matches a CCG node.
+kIdentityTemplate = lexpr(r'\P.P')
+kConstantTemplate = lexpr(r'\E O.O')
 
 class SemanticIndex(object):
     def __init__(self, contents):
+        # Semantics of terminal nodes, as they are pure functions of the
+        # semantic rule, the predicate and the coq_type.
+        self.lexical_cache = LRUCache(kLexicalCacheSize)
+        # Semantics are composed by this reducer (see lambda_reducer.py).
+        self.reducer = NLTKReducer()
         # Input might be a string containing a filename, or a list of rules.
         if isinstance(contents, str) and contents != '':
-            self.rules = load_semantic_rules(contents)
+            self.load_rules(contents)
         elif isinstance(contents, list):
             self.rules = contents
         else:
             self.rules = []
 
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules):
+        # The index is rebuilt whenever the list of rules is replaced.
+        self._rules = rules
+        self._rule_index = RuleIndex(rules)
+        self.lexical_cache.clear()
+
+    def load_rules(self, fn):
+        """
+        Loads the semantic rules of the YAML file fn, from its compiled
+        bundle (see compile_semantic_rules) if there is an up-to-date one.
+        """
+        bundle = load_semantic_bundle(fn)
+        if bundle is None:
+            self.rules = load_semantic_rules(fn)
+        else:
+            self._rules, self._rule_index = bundle
+            self.lexical_cache.clear()
+
+    @property
+    def reducer(self):
+        return self._reducer
+
+    @reducer.setter
+    def reducer(self, reducer):
+        # Memoized semantics are terms of the previous reducer.
+        self._reducer = reducer
+        self.lexical_cache.clear()
+
     def get_relevant_rules(self, rule_pattern):
         """
         Given a rule pattern (that is, a SemanticRule with several features
         specified, but no semantics associated), it searches for relevant
         rules with the same features but with associated semantics.
+        Relevant rules are returned in the same order as they were loaded.
         """
         relevant_rules = []
-        for rule in self.rules:
+        for rule in self._rule_index.get_candidate_rules(rule_pattern):
             if rule.match(rule_pattern):
                 relevant_rules.append(rule)
         return relevant_rules
 
-    def get_semantic_representation(self, ccg_tree, tokens):
-        rule_pattern = make_rule_pattern_from_ccg_node(ccg_tree, tokens)
-        # Obtain the semantic template.
-        relevant_rules = self.get_relevant_rules(rule_pattern)
+    def get_semantic_representation(self, ccg_tree, tokens, node_semantics=None,
+                                    node_attributes=None):
+        """
+        Returns the semantics of ccg_tree, obtained by applying the relevant
+        semantic template to the semantics of its children. If given,
+        node_semantics maps CCG nodes to their (already composed) terms of
+        self.reducer. Otherwise, children semantics are parsed from their
+        'sem' attribute. node_attributes is the side table of attributes
+        used by get_attributes_from_ccg_node_recursively.
+        """
+        with span('rule_matching'):
+            rule_pattern = make_rule_pattern_from_ccg_node(
+                ccg_tree, tokens, node_attributes)
+            # Obtain the semantic template.
+            relevant_rules = self.get_relevant_rules(rule_pattern)
         if not relevant_rules and len(ccg_tree) == 2:
             return None
         elif not relevant_rules:
@@ -59,6 +132,7 @@ class SemanticIndex(object):
         else:
             semantic_rule = relevant_rules.pop()
             semantic_template = semantic_rule.semantics
+        reducer = self.reducer
         # Apply template to relevant (current, child or children) CCG node(s).
         if len(ccg_tree) == 0:
             base = rule_pattern.attributes.get('base')
@@ -68,28 +142,26 @@ class SemanticIndex(object):
               .format(etree.tostring(ccg_tree, pretty_print=True),
                       rule_pattern.attributes)
             predicate_string = base if base != '*' else surf
-            predicate = lexpr(predicate_string)
-            semantics = semantic_template(predicate).simplify()
-            # Assign coq types.
-            if semantic_rule != None and 'coq_type' in semantic_rule.attributes:
-                coq_types = semantic_rule.attributes['coq_type']
-                ccg_tree.set('coq_type',
-                  'Parameter {0} : {1}.'.format(predicate_string, coq_types))
-            else:
-                ccg_tree.set('coq_type', "")
+            semantics, coq_type = self.get_lexical_semantics(
+                semantic_rule, semantic_template, predicate_string)
+            ccg_tree.set('coq_type', coq_type)
         elif len(ccg_tree) == 1:
-            predicate = lexpr(ccg_tree[0].get('sem'))
-            semantics = semantic_template(predicate).simplify()
+            predicate = get_node_semantics(ccg_tree[0], node_semantics, reducer)
+            with span('beta_reduction'):
+                semantics = reducer.apply(
+                    reducer.from_expression(semantic_template), predicate)
             # Assign coq types.
             ccg_tree.set('coq_type', ccg_tree[0].attrib.get('coq_type', ""))
         else:
             var_paths = semantic_rule.attributes.get('var_paths', [[0], [1]])
-            semantics = semantic_template
+            semantics = reducer.from_expression(semantic_template)
             coq_types_list = []
             for path in var_paths:
                 child_node = get_node_at_path(ccg_tree, path)
-                child_semantics = lexpr(child_node.get('sem'))
-                semantics = semantics(child_semantics).simplify()
+                child_semantics = get_node_semantics(
+                    child_node, node_semantics, reducer)
+                with span('beta_reduction'):
+                    semantics = reducer.apply(semantics, child_semantics)
                 child_coq_types = child_node.get('coq_type', None)
                 if child_coq_types is not None and child_coq_types != "":
                     coq_types_list.append(child_coq_types)
@@ -97,34 +169,174 @@ class SemanticIndex(object):
                 ccg_tree.set('coq_type', ' ||| '.join(coq_types_list))
         return semantics
 
-def get_attributes_from_ccg_node_recursively(ccg_tree, tokens):
+    def get_lexical_semantics(self, semantic_rule, semantic_template, predicate_string):
+        """
+        Returns the semantics and the coq type of a terminal node, obtained by
+        applying semantic_template (of semantic_rule, if any) to predicate_string.
+        Results are memoized in self.lexical_cache.
+        """
+        if semantic_rule != None and 'coq_type' in semantic_rule.attributes:
+            coq_types = semantic_rule.attributes['coq_type']
+        else:
+            coq_types = None
+        # Default templates do not have a rule; they are identified by their string.
+        rule_key = semantic_rule if semantic_rule != None else str(semantic_template)
+        key = (rule_key, predicate_string, coq_types)
+        lexical_semantics = self.lexical_cache.get(key)
+        if lexical_semantics is None:
+            reducer = self.reducer
+            predicate = reducer.from_expression(lexpr(predicate_string))
+            with span('beta_reduction'):
+                semantics = reducer.apply(
+                    reducer.from_expression(semantic_template), predicate)
+            # Assign coq types.
+            if coq_types is not None:
+                coq_type = 'Parameter {0} : {1}.'.format(predicate_string, coq_types)
+            else:
+                coq_type = ""
+            lexical_semantics = (semantics, coq_type)
+            self.lexical_cache.put(key, lexical_semantics)
+        return lexical_semantics
+
+def get_node_semantics(ccg_tree, node_semantics=None, reducer=None):
+    """
+    Returns the semantics of a CCG node, either from the node_semantics
+    side table or by parsing its 'sem' attribute. Parsed semantics are
+    converted into a term of reducer, if given.
     """
-    Copies attributes from children node into the current node,
-    to make them accessible in constant time.
+    if node_semantics is not None and ccg_tree in node_semantics:
+        return node_semantics[ccg_tree]
+    semantics = lexpr(ccg_tree.get('sem'))
+    if reducer is not None:
+        semantics = reducer.from_expression(semantics)
+    return semantics
+
+# Attributes whose values are used as (lowercased) keys of the rule index.
+kIndexedAttributes = ('rule', 'base', 'surf')
+# Characters of a feature-less category that are interpreted by the regular
+# expression that Category.match builds from the rule category, other than
+# slashes and parentheses.
+kCategoryRegexChars = re.compile(r'[.^$*+?{}\[\]]')
+
+class RuleIndex(object):
     """
+    Buckets semantic rules by the skeleton of their category (without features
+    and with directionality of slashes removed), whether they are terminal
+    rules, and the values of the attributes in kIndexedAttributes.
+    It only pre-selects candidate rules; these candidates still need to be
+    checked with SemanticRule.match.
+    """
+
+    def __init__(self, rules):
+        self.buckets = {}
+        # Rules that cannot be indexed (e.g. their category contains regular
+        # expression symbols) are always candidates.
+        self.unindexed = []
+        for position, rule in enumerate(rules):
+            key = self.get_rule_key(rule)
+            if key is None:
+                self.unindexed.append((position, rule))
+            else:
+                self.buckets.setdefault(key, []).append((position, rule))
+
+    def get_rule_key(self, rule):
+        types = rule.category.types
+        if kCategoryRegexChars.search(types):
+            return None
+        values = []
+        for attribute_name in kIndexedAttributes:
+            value = rule.attributes.get(attribute_name)
+            if value is not None and not isinstance(value, str):
+                return None
+            values.append(None if value is None else value.lower())
+        return (get_category_skeleton(types), rule.is_terminal_rule()) \
+               + tuple(values)
+
+    def get_candidate_rules(self, rule_pattern):
+        """
+        Returns the rules that might match rule_pattern, in their original order.
+        """
+        prefix = (get_category_skeleton(rule_pattern.category.types),
+                  rule_pattern.is_terminal_rule())
+        # A rule that does not specify an indexed attribute matches any value,
+        # whereas a rule that specifies it requires the same value.
+        value_options = []
+        for attribute_name in kIndexedAttributes:
+            value = rule_pattern.attributes.get(attribute_name)
+            if value is None:
+                value_options.append((None,))
+            else:
+                value_options.append((None, value.lower()))
+        candidates = list(self.unindexed)
+        for values in itertools.product(*value_options):
+            candidates.extend(self.buckets.get(prefix + values, []))
+        if len(candidates) > 1:
+            candidates.sort(key=lambda position_rule: position_rule[0])
+        return [rule for _, rule in candidates]
+
+def get_category_skeleton(types):
+    r"""
+    Returns a category without features where slashes (and the wildcard "|")
+    are indistinguishable, e.g. "(S\NP)/NP" --> "(S|NP)|NP".
+    """
+    return types.replace('/', '|').replace('\\', '|')
+
+def get_attributes_from_ccg_node_recursively(ccg_tree, tokens, node_attributes=None):
+    """
+    Returns the attributes of the current node together with the attributes
+    of its children (prefixed by "childN_", recursively) and, for terminal
+    nodes, the attributes of their token, to make them accessible in constant
+    time. CCG nodes are not modified.
+    "tokens" is either the <tokens> XML node or a dictionary that maps token
+    IDs to token nodes (see get_nodes_by_id).
+    If given, node_attributes is a side table that keeps, for every visited
+    node, the attributes that were obtained from its descendants or token,
+    so that they are computed only once per node.
+    """
+    if node_attributes is None:
+        node_attributes = {}
+    derived_attributes = node_attributes.get(ccg_tree)
+    if derived_attributes is None:
+        derived_attributes = get_derived_attributes(
+            ccg_tree, tokens, node_attributes)
+        node_attributes[ccg_tree] = derived_attributes
+    attributes = dict(ccg_tree.attrib)
+    attributes.update(derived_attributes)
+    return attributes
+
+def get_derived_attributes(ccg_tree, tokens, node_attributes):
+    """
+    Returns the attributes that a CCG node inherits from its
+    children (non-terminal nodes) or from its token (terminal nodes).
+    """
+    derived_attributes = {}
     if 'child' in ccg_tree.attrib:
-        attributes = ccg_tree.attrib
         for i, child in enumerate(ccg_tree):
-            child_attributes = get_attributes_from_ccg_node_recursively(child, tokens)
+            child_attributes = get_attributes_from_ccg_node_recursively(
+                child, tokens, node_attributes)
+            prefix = 'child' + str(i) + '_'
             for name, value in child_attributes.items():
-                attributes['child' + str(i) + '_' + name] = value
+                derived_attributes[prefix + name] = value
     else:
-        attributes = ccg_tree.attrib
         token_id = ccg_tree.get('terminal')
-        token_node = find_node_by_id(token_id, tokens)
-        node_id = attributes.get('id')
-        attributes.update(token_node.attrib)
-        # Restore the node ID, that has been overwritten by the previous update.
-        attributes['id'] = node_id
-    return attributes
+        if isinstance(tokens, dict):
+            token_node = tokens.get(token_id)
+            if token_node is None:
+                raise(ValueError('It should have found a span for id {0}'.format(token_id)))
+        else:
+            token_node = find_node_by_id(token_id, tokens)
+        derived_attributes.update(token_node.attrib)
+        # Keep the node ID, that would be overwritten by the token ID.
+        derived_attributes['id'] = ccg_tree.get('id')
+    return derived_attributes
 
-def make_rule_pattern_from_ccg_node(ccg_tree, tokens):
-    attributes = get_attributes_from_ccg_node_recursively(ccg_tree, tokens)
+def make_rule_pattern_from_ccg_node(ccg_tree, tokens, node_attributes=None):
+    attributes = get_attributes_from_ccg_node_recursively(
+        ccg_tree, tokens, node_attributes)
     category = ccg_tree.get('category')
     assert category, 'There should be a non-empty category attribute in {0}'\
       .format(etree.tostring(ccg_tree, pretty_print=True))
-    semantics = None
-    rule_pattern = SemanticRule(category, semantics, attributes)
+    rule_pattern = RulePattern(category, attributes)
     return rule_pattern
 
 def find_node_by_id(node_id, xml_tree):
@@ -133,11 +345,23 @@ def find_node_by_id(node_id, xml_tree):
         raise(ValueError('It should have found a span for id {0}'.format(node_id)))
     return nodes[0]
 
+def get_nodes_by_id(xml_tree):
+    """
+    Returns a dictionary that maps node IDs to the (first) node of xml_tree
+    with that ID, as find_node_by_id would find them.
+    """
+    nodes_by_id = {}
+    for node in xml_tree.iter(tag=etree.Element):
+        node_id = node.get('id')
+        if node_id is not None and node_id not in nodes_by_id:
+            nodes_by_id[node_id] = node
+    return nodes_by_id
+
 def load_semantic_rules(fn):
     semantic_rules = []
     loaded = None
     with codecs.open(fn, 'r', 'utf-8') as infile:
-        loaded = yaml.load(infile)
+        loaded = yaml.load(infile, Loader=yaml.SafeLoader)
     if not loaded: raise ValueError("couldn't load file: " + fn)
 
     for attributes in loaded:
@@ -158,12 +382,63 @@ def build_default_template(rule_pattern, ccg_tree):
     if len(ccg_tree) == 0:
         num_arguments = category.get_num_args()
     elif len(ccg_tree) == 1:
-        category2 = Category(ccg_tree.get('category'))
+        category2 = get_category(ccg_tree.get('category'))
         num_arguments = category.get_num_args() - category2.get_num_args()
     variable_names = ['x' + str(i) for i in range(num_arguments)]
     if not variable_names:
-        template_string = r'\P.P'
+        template = kIdentityTemplate
     else:
-        template_string = r'\E O.O'
-    template = lexpr(template_string)
+        template = kConstantTemplate
     return template
+
+def get_bundle_filename(fn):
+    return fn + kBundleSuffix
+
+def get_bundle_header(fn):
+    """
+    Returns the header that identifies a bundle compiled from the YAML
+    file fn with the current code.
+    """
+    with open(fn, 'rb') as infile:
+        source_hash = hashlib.sha1(infile.read()).hexdigest()
+    return {'version' : kBundleVersion,
+            'nltk_version' : nltk.__version__,
+            'source_hash' : source_hash}
+
+def compile_semantic_rules(fn, bundle_fn=None):
+    """
+    Compiles the semantic rules of the YAML file fn into a bundle with
+    the parsed rules and their index, so that they can be loaded without
+    parsing YAML nor lambda expressions. The bundle is written to bundle_fn
+    (by default, fn + kBundleSuffix), whose name is returned.
+    """
+    if bundle_fn is None:
+        bundle_fn = get_bundle_filename(fn)
+    header = get_bundle_header(fn)
+    rules = load_semantic_rules(fn)
+    # Write the bundle under a temporary name, so that concurrent readers
+    # do not see a partial bundle.
+    tmp_fn = '{0}.{1}.tmp'.format(bundle_fn, os.getpid())
+    with open(tmp_fn, 'wb') as outfile:
+        pickle.dump(header, outfile, pickle.HIGHEST_PROTOCOL)
+        pickle.dump((rules, RuleIndex(rules)), outfile, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fn, bundle_fn)
+    return bundle_fn
+
+def load_semantic_bundle(fn, bundle_fn=None):
+    """
+    Returns the pair (rules, rule index) of the bundle compiled from the YAML
+    file fn, or None if there is no bundle or if it is outdated (i.e. it was
+    compiled from a different fn, or by a different version of the code).
+    """
+    if bundle_fn is None:
+        bundle_fn = get_bundle_filename(fn)
+    if not os.path.exists(bundle_fn):
+        return None
+    try:
+        with open(bundle_fn, 'rb') as infile:
+            if pickle.load(infile) != get_bundle_header(fn):
+                return None
+            return pickle.load(infile)
+    except Exception:
+        return None
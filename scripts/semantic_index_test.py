@@ -15,6 +15,9 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from lxml import etree
@@ -23,8 +26,12 @@ from nltk.sem.logic import LogicalExpressionException
 
 from ccg2lambda_tools import assign_semantics_to_ccg
 from logic_parser import lexpr
+from semantic_index import compile_semantic_rules
+from semantic_index import load_semantic_bundle
+from semantic_index import load_semantic_rules
 from semantic_index import SemanticIndex
 from semantic_index import SemanticRule
+from semantic_rule import RulePattern
 
 # TODO: ensure that 'var_paths' is not matching attributes in CCG XML trees.
 class GetSemanticRepresentationTestCase(unittest.TestCase):
@@ -187,7 +194,191 @@ class GetSemanticRepresentationTestCase(unittest.TestCase):
         expected_semantics = lexpr(r'(_base1 -> _base2)')
         self.assertEqual(expected_semantics, semantics)
 
+class LexicalCacheTestCase(unittest.TestCase):
+    def test_repeated_lemma_hits(self):
+        sentence_str = r"""
+      <sentence id="s1">
+        <tokens>
+          <token base="dog" pos="pos1" surf="dogs" id="t1_1"/>
+          <token base="dog" pos="pos2" surf="dog" id="t1_2"/>
+        </tokens>
+        <ccg root="sp1-3">
+          <span terminal="t1_1" category="N" end="2" begin="1" id="sp1-1"/>
+          <span terminal="t1_2" category="N" end="3" begin="2" id="sp1-2"/>
+          <span child="sp1-1 sp1-2" category="NP" rule=">" end="3" begin="1" id="sp1-3"/>
+        </ccg>
+      </sentence>
+    """
+        sentence = etree.fromstring(sentence_str)
+        semantic_index = SemanticIndex(None)
+        semantic_index.rules = [
+            SemanticRule(r'N', r'\P x.P(x)', {'coq_type' : 'Entity -> Prop'}),
+            SemanticRule(r'NP', r'\F1 F2 x.(F1(x) & F2(x))', {'rule' : '>'})]
+        ccg_tree = assign_semantics_to_ccg(sentence, semantic_index)
+        self.assertEqual(lexpr(r'\x.(_dog(x) & _dog(x))'),
+                         lexpr(ccg_tree.get('sem')))
+        self.assertEqual('Parameter _dog : Entity -> Prop.',
+                         ccg_tree[1].get('coq_type'))
+        self.assertEqual(1, semantic_index.lexical_cache.misses)
+        self.assertEqual(1, semantic_index.lexical_cache.hits)
+
+class GetRelevantRulesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.semantic_index = SemanticIndex(None)
+        self.semantic_index.rules = [
+            SemanticRule(r'NP', r'\P.P', {'base' : 'dog'}),
+            SemanticRule(r'NP|NP', r'\P.P'),
+            SemanticRule(r'NP', r'\P.P'),
+            SemanticRule(r'NP/NP', r'\P.P', {'rule' : '>'}),
+            SemanticRule(r'NP\NP', r'\P.P', {'rule' : '<'}),
+            SemanticRule(r'NP', r'\P.P', {'surf' : 'Dog'}),
+            SemanticRule(r'NP[case=ga]', r'\P.P', {'rule' : 'lex'})]
+
+    def test_terminal_keeps_order(self):
+        rule_pattern = SemanticRule(r'NP', None,
+                                    {'base' : 'dog', 'surf' : 'dog'})
+        relevant_rules = self.semantic_index.get_relevant_rules(rule_pattern)
+        expected_rules = [self.semantic_index.rules[i] for i in [0, 2, 5]]
+        self.assertEqual(expected_rules, relevant_rules)
+
+    def test_terminal_other_base(self):
+        rule_pattern = SemanticRule(r'NP', None,
+                                    {'base' : 'cat', 'surf' : 'cat'})
+        relevant_rules = self.semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([self.semantic_index.rules[2]], relevant_rules)
+
+    def test_nonterminal_slash_wildcard(self):
+        rule_pattern = SemanticRule(r'NP/NP', None,
+                                    {'rule' : '>', 'child' : 'sp1 sp2'})
+        relevant_rules = self.semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([self.semantic_index.rules[3]], relevant_rules)
+
+    def test_nonterminal_no_rule(self):
+        rule_pattern = SemanticRule(r'NP[case=ga]', None,
+                                    {'rule' : 'LEX', 'child' : 'sp1'})
+        relevant_rules = self.semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([self.semantic_index.rules[6]], relevant_rules)
+
+    def test_rules_replaced(self):
+        rule = SemanticRule(r'NP', r'\P.P', {'base' : 'cat'})
+        self.semantic_index.rules = [rule]
+        rule_pattern = SemanticRule(r'NP', None,
+                                    {'base' : 'cat', 'surf' : 'cat'})
+        relevant_rules = self.semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual([rule], relevant_rules)
+
+class RulePatternTestCase(unittest.TestCase):
+    def test_lowercase_match(self):
+        rule = SemanticRule(r'NP', r'\P.P', {'surf' : 'Dog', 'pos' : 'NN'})
+        self.assertTrue(rule.match(RulePattern(r'NP', {'surf' : 'dog', 'pos' : 'nn'})))
+        self.assertFalse(rule.match(RulePattern(r'NP', {'surf' : 'cat', 'pos' : 'nn'})))
+
+    def test_missing_attribute(self):
+        rule = SemanticRule(r'NP', r'\P.P', {'pos' : 'NN'})
+        self.assertFalse(rule.match(RulePattern(r'NP', {'surf' : 'dog'})))
+
+    def test_control_and_type_attributes_ignored(self):
+        rule = SemanticRule(r'NP', r'\P.P', {'coq_type' : 'Entity', 'var_paths' : [[0]]})
+        self.assertTrue(rule.match(RulePattern(r'NP', {'surf' : 'dog'})))
+
+    def test_category_attribute(self):
+        rule = SemanticRule(r'S', r'\P.P',
+                            {'rule' : '<', 'child0_category' : 'NP'})
+        pattern = RulePattern(r'S', {'rule' : '<', 'child0_category' : 'NP[case=ga]'})
+        self.assertTrue(rule.match(pattern))
+        pattern = RulePattern(r'S', {'rule' : '<', 'child0_category' : 'N'})
+        self.assertFalse(rule.match(pattern))
+
+    def test_wildcard(self):
+        rule = SemanticRule(r'S', r'\P.P', {'rule' : '<', 'child_any_surf' : 'Not'})
+        pattern = RulePattern(r'S', {'rule' : '<', 'child0_surf' : 'dog',
+                                     'child1_child0_surf' : 'not'})
+        self.assertTrue(rule.match(pattern))
+        pattern = RulePattern(r'S', {'rule' : '<', 'child0_surf' : 'dog',
+                                     'child1_base' : 'not'})
+        self.assertFalse(rule.match(pattern))
+
+    def test_category_wildcard(self):
+        rule = SemanticRule(r'S', r'\P.P', {'rule' : '<', 'child_any_category' : 'NP'})
+        pattern = RulePattern(r'S', {'rule' : '<', 'child1_category' : 'NP[case=o]'})
+        self.assertTrue(rule.match(pattern))
+
+    def test_terminal_mismatch(self):
+        rule = SemanticRule(r'NP', r'\P.P')
+        self.assertFalse(rule.match(RulePattern(r'NP', {'rule' : 'lex'})))
+
+    def test_pattern_normalizes_attributes_in_place(self):
+        attributes = {'surf' : '(', 'base' : '('}
+        pattern = RulePattern(r'NP', attributes)
+        self.assertIs(attributes, pattern.attributes)
+        rule = SemanticRule(r'NP', r'\P.P', {'surf' : '('})
+        self.assertEqual(rule.attributes['surf'], attributes['surf'])
+        self.assertTrue(rule.match(pattern))
+
+class SemanticBundleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.templates_fn = os.path.join(self.directory, 'templates.yaml')
+        self.write_templates(r"""
+- semantics: \E.E
+  category: N
+- semantics: \E F x.(F(x) & E(x))
+  category: NP/N
+  base: big
+  coq_type: Entity -> Prop
+""")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_templates(self, templates_str):
+        with open(self.templates_fn, 'w') as outfile:
+            outfile.write(templates_str)
+
+    def test_bundle_same_rules(self):
+        compile_semantic_rules(self.templates_fn)
+        rules, _ = load_semantic_bundle(self.templates_fn)
+        expected_rules = load_semantic_rules(self.templates_fn)
+        self.assertEqual(len(expected_rules), len(rules))
+        for expected_rule, rule in zip(expected_rules, rules):
+            self.assertIs(expected_rule.category, rule.category)
+            self.assertEqual(expected_rule.semantics, rule.semantics)
+            self.assertEqual(expected_rule.attributes, rule.attributes)
+
+    def test_index_from_bundle(self):
+        compile_semantic_rules(self.templates_fn)
+        semantic_index = SemanticIndex(self.templates_fn)
+        rule_pattern = SemanticRule(r'NP/N', None, {'base' : 'big', 'surf' : 'big'})
+        relevant_rules = semantic_index.get_relevant_rules(rule_pattern)
+        self.assertEqual(1, len(relevant_rules))
+        self.assertEqual(lexpr(r'\E F x.(F(x) & E(x))'), relevant_rules[0].semantics)
+
+    def test_no_bundle(self):
+        self.assertIsNone(load_semantic_bundle(self.templates_fn))
+        semantic_index = SemanticIndex(self.templates_fn)
+        self.assertEqual(2, len(semantic_index.rules))
+
+    def test_outdated_bundle(self):
+        compile_semantic_rules(self.templates_fn)
+        self.write_templates(r"""
+- semantics: \E.E
+  category: N
+""")
+        self.assertIsNone(load_semantic_bundle(self.templates_fn))
+        semantic_index = SemanticIndex(self.templates_fn)
+        self.assertEqual(1, len(semantic_index.rules))
+
+    def test_corrupt_bundle(self):
+        bundle_fn = compile_semantic_rules(self.templates_fn)
+        with open(bundle_fn, 'wb') as outfile:
+            outfile.write(b'corrupt')
+        self.assertIsNone(load_semantic_bundle(self.templates_fn))
+
 if __name__ == '__main__':
     suite1  = unittest.TestLoader().loadTestsFromTestCase(GetSemanticRepresentationTestCase)
-    suites  = unittest.TestSuite([suite1])
+    suite2  = unittest.TestLoader().loadTestsFromTestCase(GetRelevantRulesTestCase)
+    suite3  = unittest.TestLoader().loadTestsFromTestCase(LexicalCacheTestCase)
+    suite4  = unittest.TestLoader().loadTestsFromTestCase(SemanticBundleTestCase)
+    suite5  = unittest.TestLoader().loadTestsFromTestCase(RulePatternTestCase)
+    suites  = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5])
     unittest.TextTestRunner(verbosity=2).run(suites)
@@ -19,16 +19,18 @@ import re
 
 from nltk.sem.logic import Expression
 
-from category import Category
+from category import get_category
+from category import match_categories
 from logic_parser import lexpr
 from normalization import normalize_token
 
+# Attributes of semantic rules that control how templates are applied,
+# and that are not matched against attributes of CCG nodes.
+kControlAttributes = ('var_paths',)
+
 class SemanticRule(object):
     def __init__(self, category, semantics, attributes = {}):
-        if not isinstance(category, Category):
-            self.category = Category(category)
-        else:
-            self.category = category
+        self.category = get_category(category)
         if semantics and not isinstance(semantics, Expression):
             self.semantics = lexpr(semantics)
         else:
@@ -38,92 +40,130 @@ class SemanticRule(object):
           self.attributes['surf'] = normalize_token(self.attributes['surf'])
         if 'base' in self.attributes:
           self.attributes['base'] = normalize_token(self.attributes['base'])
+        self.terminal = is_terminal_attributes(self.attributes)
+        self._lowered_attributes = None
+        self._suffix_values = {}
+        # Constraints are precomputed, since rules are matched over and over.
+        self._constraints = None
+        self.get_constraints()
+
+    def get_constraints(self):
+        """
+        Returns the pair (constraints, wildcards) that the attributes of this
+        rule impose on the attributes of the rules that it matches.
+        constraints is a list of (name, value, lowercased value, is_category),
+        and wildcards a list of (suffix, value, lowercased value, is_category),
+        where suffix is the name of the attribute that the wildcard targets
+        (e.g. "surf" for "child_any_surf").
+        """
+        if self._constraints is None:
+            constraints, wildcards = [], []
+            for name, value in self.attributes.items():
+                if name in kControlAttributes or 'coq_type' in name:
+                    continue
+                if '_any_' in name:
+                    suffix = re.findall(r'_any_(.*)', name)[0]
+                    wildcards.append(
+                        (suffix, value, lower(value), suffix == 'category'))
+                elif value is not None:
+                    constraints.append(
+                        (name, value, lower(value), 'category' in name))
+            self._constraints = (constraints, wildcards)
+        return self._constraints
+
+    def get_lowered_attributes(self):
+        """
+        Returns the attributes of this rule with lowercased values.
+        They are computed only once.
+        """
+        if self._lowered_attributes is None:
+            self._lowered_attributes = {
+                name : lower(value) for name, value in self.attributes.items()}
+        return self._lowered_attributes
+
+    def get_suffix_values(self, suffix):
+        """
+        Returns the list of pairs (value, lowercased value) of the attributes
+        whose name ends with suffix, that wildcards with that suffix target.
+        """
+        suffix_values = self._suffix_values.get(suffix)
+        if suffix_values is None:
+            lowered_attributes = self.get_lowered_attributes()
+            suffix_values = [(value, lowered_attributes[name])
+                             for name, value in self.attributes.items()
+                             if name.endswith(suffix)]
+            self._suffix_values[suffix] = suffix_values
+        return suffix_values
 
     def match(self, other):
         # Check class membership and special attribute matches.
-        if not isinstance(other, self.__class__) \
+        if not isinstance(other, SemanticRule) \
            or not isinstance(other.category, self.category.__class__) \
            or not self.category.match(other.category):
             return False
         # If one rule is terminal but not the other, then they do not match.
-        if self.is_terminal_rule() != other.is_terminal_rule():
+        if self.terminal != other.terminal:
             return False
-        # Obtain generic list of attributes from both semantic rules,
-        # and check whether they match each other (or are underspecified).
-        self_attr_names = set(self.attributes.keys())
-        other_attr_names = set(other.attributes.keys())
-        attribute_names = self_attr_names.union(other_attr_names)
-        attribute_names = self.remove_control_attribute_names(attribute_names)
-        for attribute_name in attribute_names:
-            self_attr_value = self.attributes.get(attribute_name)
-            other_attr_value = other.attributes.get(attribute_name)
-            if not attributes_match(attribute_name, self_attr_value, other_attr_value):
+        # Attributes specified by this rule should be present in other and
+        # match (attributes that are only specified by other always match).
+        constraints, wildcards = self.get_constraints()
+        other_attributes = other.attributes
+        other_lowered_attributes = other.get_lowered_attributes()
+        for name, value, lowered_value, is_category in constraints:
+            other_value = other_attributes.get(name)
+            if other_value is None:
+                return False
+            # Comparing categories needs feature unification.
+            if is_category:
+                if not match_categories(value, other_value):
+                    return False
+            elif lowered_value != other_lowered_attributes[name]:
+                return False
+        # Wildcards match if any attribute of other with the same suffix matches.
+        for suffix, value, lowered_value, is_category in wildcards:
+            assert value, 'Wildcard attribute with suffix {0} has no value'\
+              .format(suffix)
+            for other_value, other_lowered_value in other.get_suffix_values(suffix):
+                if is_category:
+                    if match_categories(value, other_value):
+                        break
+                elif lowered_value == other_lowered_value:
+                    break
+            else:
                 return False
-        if not wildcard_match(attribute_names, self.attributes, other.attributes):
-            return False
         return True
 
-    def remove_control_attribute_names(self, attribute_names):
-        control_attrs = ['var_paths']
-        return [a for a in attribute_names if a not in control_attrs]
-
     def is_terminal_rule(self):
-        if 'rule' in self.attributes:
-            return False
-        for attribute_name in self.attributes:
-            if attribute_name.startswith('child'):
-                return False
-        return True
+        return self.terminal
 
-def attributes_match(attribute_name, src_attr_value, trg_attr_value):
-    # If this attribute is an arbitrary type specification, it doesn't count
-    # as a rule attribute to match against the CCG tree. Thus, return True.
-    if 'coq_type' in attribute_name:
-        return True
-    # If the attribute is a wildcard, we do not check for match here. return True.
-    if '_any_' in attribute_name:
-        return True
-    if src_attr_value is not None and trg_attr_value is None:
-        return False
-    if src_attr_value is None and trg_attr_value is not None:
-        return True
-    if src_attr_value is None and trg_attr_value is None:
-        return True
-    # Case: src_attr_value is not None and trg_attr_value is not None
-    if not 'category' in attribute_name:
-        return src_attr_value.lower() == trg_attr_value.lower()
-    # Comparing categories needs feature unification:
-    src_category = Category(src_attr_value)
-    trg_category = Category(trg_attr_value)
-    return src_category.match(trg_category)
+class RulePattern(SemanticRule):
+    """
+    Semantic rule without semantics, built from the attributes of a CCG node
+    to find the semantic rules that match it. Unlike SemanticRule, attributes
+    are not copied, and the lowercased view of the attributes and the
+    constraints are only computed if they are needed.
+    """
 
-def any_attribute_matches(attribute_name, src_attributes, trg_attributes):
-    wildcard_names = re.findall(r'_any_(.*)', attribute_name)
-    assert wildcard_names, 'Attribute name invalid: {0}'.format(attribute_name)
-    wildcard_name = wildcard_names[0]
-    src_attr_value = src_attributes.get(attribute_name, None)
-    assert src_attr_value
-    trg_attr_values = [value for key, value in trg_attributes.items() \
-                       if key.endswith(wildcard_name)]
-    for trg_attr_value in trg_attr_values:
-        if wildcard_name == 'category':
-            src_category = Category(src_attr_value)
-            trg_category = Category(trg_attr_value)
-            if src_category.match(trg_category):
-                return True
-        else:
-            if src_attr_value.lower() == trg_attr_value.lower():
-                return True
-    return False
+    def __init__(self, category, attributes):
+        self.category = get_category(category)
+        self.semantics = None
+        self.attributes = attributes
+        if 'surf' in attributes:
+          attributes['surf'] = normalize_token(attributes['surf'])
+        if 'base' in attributes:
+          attributes['base'] = normalize_token(attributes['base'])
+        self.terminal = is_terminal_attributes(attributes)
+        self._lowered_attributes = None
+        self._suffix_values = {}
+        self._constraints = None
 
-def wildcard_match(attribute_names, src_attributes, trg_attributes):
-    wildcard_attributes = []
-    # Obtain attributes specified as a wildcard "any"
-    for attribute_name in src_attributes.keys():
-        if re.findall(r'_any_', attribute_name):
-            wildcard_attributes.append(attribute_name)
-    # match of attributes specified by wildcards.
-    for attribute_name in wildcard_attributes:
-        if not any_attribute_matches(attribute_name, src_attributes, trg_attributes):
+def is_terminal_attributes(attributes):
+    if 'rule' in attributes:
+        return False
+    for attribute_name in attributes:
+        if attribute_name.startswith('child'):
             return False
     return True
+
+def lower(value):
+    return value.lower() if isinstance(value, str) else value
@@ -21,8 +21,7 @@ import argparse
 import codecs
 import logging
 from lxml import etree
-from multiprocessing import Pool
-from multiprocessing import Lock
+from collections import deque
 import os
 import sys
 import textwrap
@@ -30,18 +29,28 @@ import textwrap
 from nltk.sem.logic import LogicalExpressionException
 
 from ccg2lambda_tools import assign_semantics_to_ccg
+from ccg2lambda_tools import SubtreeMemo
+from ccg_tree import get_sem_type
+from etree_utils import IncrementalTreeWriter
+from executor import Completed
+from executor import Executor
+from executor import TaskError
+from lambda_reducer import get_reducer
+from lambda_reducer import kReducers
+from profiling import PROFILER
+from profiling import span
+from profiling import summarize_records
+from semantic_cache import SemanticCache
 from semantic_index import SemanticIndex
 
 SEMANTIC_INDEX=None
 ARGS=None
-SENTENCES=None
+CACHE=None
 kMaxTasksPerChild=None
-lock = Lock()
 
 def main(args = None):
-    global SEMANTIC_INDEX
     global ARGS
-    global SENTENCES
+    global CACHE
     DESCRIPTION=textwrap.dedent("""\
             categories_template.yaml should contain the semantic templates
               in YAML format.
@@ -68,6 +77,24 @@ def main(args = None):
     parser.add_argument("--nbest", nargs='?', type=int, default="0")
     parser.add_argument("--ncores", nargs='?', type=int, default="3",
         help="Number of cores for multiprocessing.")
+    parser.add_argument("--reducer", default="nltk", choices=sorted(kReducers),
+        help="Beta-reduction engine used to compose semantics (default: nltk). " +
+             "\"fast\" uses de Bruijn-indexed terms, and \"check\" runs both " +
+             "and reports formulas in which they disagree.")
+    parser.add_argument("--cache", nargs='?', type=str, default="",
+        help="Directory where semantics of sentences are cached, so that " +
+             "they are only recomputed if their CCG trees or the templates change.")
+    parser.add_argument("--cache-size", nargs='?', type=int, default="1024",
+        help="Maximum size of the cache in MB (default: 1024).")
+    parser.add_argument("--stream", action="store_true", default=False,
+        help="Read sentences and write their semantics incrementally, so that " +
+             "memory does not grow with the size of the input.")
+    parser.add_argument("--profile", nargs='?', type=str, default="",
+        help="JSON file where the time spent in each stage (count, total, " +
+             "mean and percentiles) is written.")
+    parser.add_argument("--profile-attributes", action="store_true", default=False,
+        help="Add to each <sentence> a \"profile\" attribute with the time " +
+             "spent in each stage.")
     ARGS = parser.parse_args()
       
     if not os.path.exists(ARGS.templates):
@@ -79,58 +106,168 @@ def main(args = None):
     
     logging.basicConfig(level=logging.WARNING)
 
-    SEMANTIC_INDEX = SemanticIndex(ARGS.templates)
+    PROFILER.enable(bool(ARGS.profile or ARGS.profile_attributes))
+    if ARGS.ncores <= 1:
+        initialize(ARGS)
+    CACHE = None
+    if ARGS.cache:
+        CACHE = SemanticCache(
+            ARGS.cache, get_cache_settings(ARGS), ARGS.cache_size * 1024 * 1024)
+
+    if ARGS.stream:
+        semantic_parse_stream(ARGS.ccg, ARGS.sem, ARGS.ncores)
+        close_cache()
+        write_profile()
+        return
 
     parser = etree.XMLParser(remove_blank_text=True)
     root = etree.parse(ARGS.ccg, parser)
 
-    SENTENCES = root.findall('.//sentence')
-    # print('Found {0} sentences'.format(len(SENTENCES)))
+    sentences = root.findall('.//sentence')
     # from pudb import set_trace; set_trace()
-    sentence_inds = range(len(SENTENCES))
-    sem_nodes_lists = semantic_parse_sentences(sentence_inds, ARGS.ncores)
-    assert len(sem_nodes_lists) == len(SENTENCES), \
-        'Element mismatch: {0} vs {1}'.format(len(sem_nodes_lists), len(SENTENCES))
-    logging.info('Adding XML semantic nodes to sentences...')
-    for sentence, sem_nodes in zip(SENTENCES, sem_nodes_lists):
+    for sentence, sem_nodes in semantic_parse_sentences(sentences, ARGS.ncores):
         sentence.extend(sem_nodes)
-    logging.info('Finished adding XML semantic nodes to sentences.')
+    close_cache()
+
+    with span('serialization'):
+        root_xml_str = serialize_tree(root)
+        with codecs.open(ARGS.sem, 'wb') as fout:
+            fout.write(root_xml_str)
+    write_profile()
 
-    root_xml_str = serialize_tree(root)
-    with codecs.open(ARGS.sem, 'wb') as fout:
-        fout.write(root_xml_str)
+def write_profile():
+    if ARGS.profile:
+        PROFILER.write_report(ARGS.profile)
 
-def semantic_parse_sentences(sentence_inds, ncores=1):
-    if ncores <= 1:
-        sem_nodes_lists = semantic_parse_sentences_seq(sentence_inds)
+def close_cache():
+    if CACHE is not None:
+        logging.info(CACHE)
+        CACHE.close()
+
+def get_cache_settings(args):
+    """
+    Returns the settings (as bytes) that semantics of sentences depend on,
+    other than their CCG trees.
+    """
+    with open(args.templates, 'rb') as fin:
+        templates = fin.read()
+    options = 'arbi_types={0} gold_trees={1} nbest={2} reducer={3}\n'.format(
+        args.arbi_types, args.gold_trees, args.nbest, args.reducer)
+    return options.encode('utf-8') + templates
+
+def initialize(args):
+    """
+    Loads the semantic templates and the command line arguments.
+    It is called once in each worker process.
+    """
+    global ARGS
+    global SEMANTIC_INDEX
+    ARGS = args
+    PROFILER.enable(bool(args.profile or args.profile_attributes))
+    SEMANTIC_INDEX = SemanticIndex(args.templates)
+    SEMANTIC_INDEX.reducer = get_reducer(args.reducer)
+
+def semantic_parse_sentences(sentences, ncores=1, executor=None,
+                             error_handler=None):
+    """
+    Yields pairs (sentence, semantics nodes) in the same order as sentences,
+    which is an iterable of lxml <sentence> nodes that may be read lazily.
+    Semantics nodes are lxml <semantics> nodes, one per CCG tree.
+    Sentences are parsed by executor (or by a new one with ncores), and
+    error messages are passed to error_handler (by default, logged).
+    """
+    if executor is None:
+        with Executor(ncores, initialize, (ARGS,),
+                      maxtasksperchild=kMaxTasksPerChild) as executor:
+            for item in semantic_parse_sentences(
+                sentences, ncores, executor, error_handler):
+                yield item
+        return
+    if error_handler is None:
+        error_handler = logging.error
+    # Sentences that are sent to the executor, with their cache key.
+    pending = deque()
+    def get_tasks():
+        for sentence in sentences:
+            key = CACHE.get_key(sentence) if CACHE is not None else None
+            sem_nodes = CACHE.get(key) if CACHE is not None else None
+            pending.append((sentence, key))
+            if sem_nodes is not None:
+                yield Completed((sem_nodes, None, None, None))
+            elif executor.ncores <= 1:
+                yield sentence
+            else:
+                yield etree.tostring(sentence)
+    if executor.ncores <= 1:
+        parse_function = semantic_parse_sentence_node
     else:
-        sem_nodes_lists = semantic_parse_sentences_par(sentence_inds, ncores)
-    sem_nodes_lists = [
-        [etree.fromstring(s) for s in sem_nodes] for sem_nodes in sem_nodes_lists]
-    return sem_nodes_lists
-
-def semantic_parse_sentences_par(sentence_inds, ncores=3):
-    pool = Pool(processes=ncores, maxtasksperchild=kMaxTasksPerChild)
-    sem_nodes = pool.map(semantic_parse_sentence, sentence_inds)
-    pool.close()
-    pool.join()
-    return sem_nodes
-
-def semantic_parse_sentences_seq(sentence_inds):
-    sem_nodes = []
-    for sentence_ind in sentence_inds:
-        sem_node = semantic_parse_sentence(sentence_ind)
-        sem_nodes.append(sem_node)
-    return sem_nodes
+        parse_function = semantic_parse_sentence_str
+    for result in executor.imap(parse_function, get_tasks()):
+        sentence, key = pending.popleft()
+        if isinstance(result, TaskError):
+            error_handler('An error occurred: {0}\nSentence ID: {1}'.format(
+                result.message, sentence.get('id', '(unspecified)')))
+            sem_node = etree.Element('semantics', status='failed')
+            yield sentence, [sem_node]
+            continue
+        sem_nodes, errors, records, counters = result
+        if records is not None:
+            PROFILER.merge(records, counters)
+            if ARGS.profile_attributes:
+                sentence.set('profile', summarize_records(records))
+        # Errors are None for results that come from the cache. Failed
+        # semantic parses are also cached, and their errors are only
+        # logged when they are computed.
+        if errors is not None:
+            for error in errors:
+                error_handler(error)
+            if CACHE is not None:
+                CACHE.put(key, sem_nodes)
+        yield sentence, [etree.fromstring(s) for s in sem_nodes]
 
-def semantic_parse_sentence(sentence_ind):
+def semantic_parse_stream(ccg_fn, sem_fn, ncores=1):
+    """
+    Semantic parsing of sentences as they are read from ccg_fn. Each sentence
+    is written to sem_fn together with its semantics as soon as all previous
+    sentences are written. Only the sentences that are in flight in the
+    executor are kept in memory.
+    """
+    sentences = etree.iterparse(
+        ccg_fn, events=('end',), tag='sentence', remove_blank_text=True)
+    with etree.xmlfile(sem_fn, encoding='utf-8') as xml_file:
+        xml_file.write_declaration()
+        writer = IncrementalTreeWriter(xml_file)
+        for sentence, sem_nodes in semantic_parse_sentences(
+            (sentence for _, sentence in sentences), ncores):
+            sentence.extend(sem_nodes)
+            with span('serialization'):
+                writer.write(sentence)
+        writer.close(sentences.root)
+
+def semantic_parse_sentence_str(sentence_str):
+    return semantic_parse_sentence_node(etree.fromstring(sentence_str))
+
+def semantic_parse_sentence_node(sentence):
     """
     `sentence` is an lxml tree with tokens and ccg nodes.
-    It returns an lxml semantics node.
+    It returns a list of serialized lxml semantics nodes, a list
+    of error messages, which are logged by the caller, and the
+    profiling records and counters of the sentence (None if profiling
+    is disabled). Counters have the hits and misses of the lexical cache
+    of the semantic index, which are summed over workers by the caller.
     """
-    global lock
-    sentence = SENTENCES[sentence_ind]
+    lexical_cache = SEMANTIC_INDEX.lexical_cache
+    hits, misses = lexical_cache.hits, lexical_cache.misses
+    with PROFILER.task() as task:
+        with span('sentence'):
+            sem_nodes, errors = semantic_parse_sentence(sentence)
+        PROFILER.count('lexical_cache/hits', lexical_cache.hits - hits)
+        PROFILER.count('lexical_cache/misses', lexical_cache.misses - misses)
+    return sem_nodes, errors, task.records, task.counters
+
+def semantic_parse_sentence(sentence):
     sem_nodes = []
+    errors = []
     # TODO: try to prevent semantic parsing for fragmented CCG trees.
     # Otherwise, produce fragmented semantics.
     if ARGS.gold_trees:
@@ -140,13 +277,17 @@ def semantic_parse_sentence(sentence_ind):
         tree_indices = [int(sentence.get('gold_tree', '0')) + 1]
     if ARGS.nbest != 1:
         tree_indices = get_tree_indices(sentence, ARGS.nbest)
+    # N-best CCG trees share most of their subtrees, whose semantics
+    # are composed only once.
+    subtree_memo = SubtreeMemo() if len(tree_indices) > 1 else None
     for tree_index in tree_indices: 
         sem_node = etree.Element('semantics')
         try:
             sem_tree = assign_semantics_to_ccg(
-                sentence, SEMANTIC_INDEX, tree_index)
-            filter_attributes(sem_tree)
-            sem_node.extend(sem_tree.xpath('.//descendant-or-self::span'))
+                sentence, SEMANTIC_INDEX, tree_index, subtree_memo)
+            with span('attribute_filtering'):
+                filter_attributes(sem_tree)
+                sem_node.extend(sem_tree.xpath('.//descendant-or-self::span'))
             sem_node.set('status', 'success')
             sem_node.set('ccg_id',
                 sentence.xpath('./ccg[{0}]/@id'.format(tree_index))[0])
@@ -158,15 +299,15 @@ def semantic_parse_sentence(sentence_ind):
             sem_node.set('status', 'failed')
             # from pudb import set_trace; set_trace()
             sentence_surf = ' '.join(sentence.xpath('tokens/token/@surf'))
-            lock.acquire()
-            logging.error('An error occurred: {0}\nSentence: {1}\nTree XML:\n{2}'.format(
+            errors.append('An error occurred: {0}\nSentence: {1}\nTree XML:\n{2}'.format(
                 e, sentence_surf,
                 etree.tostring(sentence, encoding='utf-8', pretty_print=True).decode('utf-8')))
-            lock.release()
             # print('x', end='', file=sys.stdout)
             sys.stdout.flush()
         sem_nodes.append(sem_node)
-    return [etree.tostring(sem_node) for sem_node in sem_nodes]
+    with span('serialization'):
+        sem_nodes = [etree.tostring(sem_node) for sem_node in sem_nodes]
+    return sem_nodes, errors
 
 def get_tree_indices(sentence, nbest):
     num_ccg_trees = int(sentence.xpath('count(./ccg)'))
@@ -177,8 +318,7 @@ def get_tree_indices(sentence, nbest):
 keep_attributes = set(['id', 'child', 'sem', 'type'])
 def filter_attributes(tree):
     if 'coq_type' in tree.attrib and 'child' not in tree.attrib:
-        sem_type = \
-            tree.attrib['coq_type'].lstrip('["Parameter ').rstrip('."]')
+        sem_type = get_sem_type(tree.attrib['coq_type'])
         if sem_type:
             tree.attrib['type'] = sem_type
     attrib_to_delete = [a for a in tree.attrib.keys() if a not in keep_attributes]
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# This module is imported by the client, which should start fast.
+# Do not import nltk nor modules of ccg2lambda that import it.
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import sys
+import textwrap
+
+kSocketEnvironmentVariable = 'SEMPARSE_SOCKET'
+kSemparseScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'semparse.py')
+
+class ServiceError(Exception):
+    """
+    The service could not answer a request.
+    """
+    pass
+
+def get_service_settings(templates, arbi_types=False, gold_trees=True, nbest=0,
+                         reducer='nltk'):
+    """
+    Returns the settings that semantics depend on, other than CCG trees.
+    Clients send them with each request, and the service only answers those
+    that match its own.
+    """
+    with open(templates, 'rb') as fin:
+        templates_hash = hashlib.sha1(fin.read()).hexdigest()
+    return {'templates' : templates_hash,
+            'arbi_types' : arbi_types,
+            'gold_trees' : gold_trees,
+            'nbest' : nbest,
+            'reducer' : reducer}
+
+def send_request(socket_path, request):
+    """
+    Sends a request (a dictionary) to the service listening on the Unix
+    domain socket socket_path, and returns its response. Raises
+    ServiceError if the service answers with an error.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as infile:
+            line = infile.readline()
+    finally:
+        connection.close()
+    if not line:
+        raise ServiceError('The service closed the connection')
+    response = json.loads(line.decode('utf-8'))
+    if 'error' in response:
+        raise ServiceError(response['error'])
+    return response
+
+def run_semparse(argv):
+    """
+    Replaces this process by semparse.py with the arguments argv.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv(sys.executable, [sys.executable, kSemparseScript] + argv)
+
+def main(args = None):
+    DESCRIPTION=textwrap.dedent("""\
+            Drop-in replacement for semparse.py that sends the CCG trees
+            to a semantic parsing service (see semparse_server.py), which
+            keeps the semantic templates loaded. Arguments are those of
+            semparse.py. If no service is running, it was started with
+            other templates or options, or options that it does not support
+            are given, semparse.py is run instead.
+      """)
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=DESCRIPTION)
+    parser.add_argument("ccg")
+    parser.add_argument("templates")
+    parser.add_argument("sem")
+    parser.add_argument("--arbi-types", action="store_true", default=False)
+    parser.add_argument("--gold_trees", action="store_true", default=True)
+    parser.add_argument("--nbest", nargs='?', type=int, default="0")
+    parser.add_argument("--ncores", nargs='?', type=int, default="3",
+        help="Ignored: the number of cores is that of the service.")
+    parser.add_argument("--reducer", default="nltk")
+    parser.add_argument("--socket", nargs='?', type=str,
+        default=os.environ.get(kSocketEnvironmentVariable, ""),
+        help="Unix domain socket of the service (default: the value of the " +
+             "environment variable {0}).".format(kSocketEnvironmentVariable))
+    argv = sys.argv[1:] if args is None else args
+    options, unsupported_args = parser.parse_known_args(argv)
+    semparse_argv = [
+        arg for i, arg in enumerate(argv)
+        if arg != '--socket' and not (i > 0 and argv[i - 1] == '--socket')
+           and not arg.startswith('--socket=')]
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if unsupported_args or not options.socket:
+        run_semparse(semparse_argv)
+    for filename in (options.ccg, options.templates):
+        if not os.path.exists(filename):
+            print('File does not exist: {0}'.format(filename))
+            sys.exit(1)
+
+    with open(options.ccg, 'rb') as fin:
+        ccg_xml = fin.read().decode('utf-8')
+    request = {
+        'settings' : get_service_settings(
+            options.templates, options.arbi_types, options.gold_trees,
+            options.nbest, options.reducer),
+        'ccg' : ccg_xml}
+    try:
+        response = send_request(options.socket, request)
+    except (socket.error, ServiceError) as e:
+        logging.warning('Running semparse.py. The semantic parsing service ' +
+                        'at {0} did not answer: {1}'.format(options.socket, e))
+        run_semparse(semparse_argv)
+    for error in response.get('errors', []):
+        logging.error(error)
+    with open(options.sem, 'wb') as fout:
+        fout.write(response['sem'].encode('utf-8'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import textwrap
+import threading
+
+from lxml import etree
+
+from executor import Executor
+from lambda_reducer import kReducers
+import semparse
+from semparse_client import get_service_settings
+
+class SemanticParsingService(object):
+    """
+    Semantic parser that keeps the semantic templates loaded and a pool of
+    ncores worker processes, and answers requests (dictionaries decoded
+    from JSON) with the semantics of their sentences. Requests contain:
+
+      "id": (optional) any value, which is copied into the response.
+      "settings": (optional) the result of get_service_settings for the
+          templates and options that the client expects.
+      "ccg": a string with the XML of CCG trees, as read by semparse.py.
+          The response has the same XML with semantics in "sem".
+      "sentences": instead of "ccg", a list of sentences encoded as
+          dictionaries (see sentence_from_json). The response has the
+          sentences with their semantics in "sentences".
+
+    Errors of semantic parsing are returned in "errors". If the request
+    cannot be answered, the response only has "id" and "error".
+    Requests can be handled concurrently from several threads.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.settings = get_service_settings(
+            args.templates, args.arbi_types, args.gold_trees, args.nbest,
+            args.reducer)
+        semparse.initialize(args)
+        self.executor = Executor(
+            args.ncores, semparse.initialize, (args,),
+            maxtasksperchild=semparse.kMaxTasksPerChild)
+        # Semantic parsing in this process is not thread safe.
+        self.lock = threading.Lock() if args.ncores <= 1 else None
+
+    def close(self):
+        self.executor.close()
+
+    def handle(self, request):
+        response = {'id' : request.get('id')}
+        try:
+            settings = request.get('settings')
+            if settings is not None and settings != self.settings:
+                raise ValueError(
+                    'The service runs with other templates or options: {0}'.format(
+                    json.dumps(self.settings, sort_keys=True)))
+            if 'ccg' in request:
+                root = etree.fromstring(
+                    request['ccg'].encode('utf-8'),
+                    etree.XMLParser(remove_blank_text=True))
+                errors = self.parse_sentences(root.findall('.//sentence'))
+                response['sem'] = semparse.serialize_tree(root).decode('utf-8')
+            elif 'sentences' in request:
+                sentences = [sentence_from_json(s) for s in request['sentences']]
+                errors = self.parse_sentences(sentences)
+                response['sentences'] = [sentence_to_json(s) for s in sentences]
+            else:
+                raise ValueError('Requests should have "ccg" or "sentences"')
+        except Exception as e:
+            return {'id' : request.get('id'), 'error' : str(e)}
+        response['errors'] = errors
+        return response
+
+    def handle_line(self, line):
+        """
+        Returns the response to a request encoded as a line of JSON,
+        also encoded as a line of JSON.
+        """
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError('Requests should be JSON objects')
+        except ValueError as e:
+            response = {'id' : None, 'error' : 'Invalid request: {0}'.format(e)}
+        else:
+            response = self.handle(request)
+        return json.dumps(response).encode('utf-8') + b'\n'
+
+    def parse_sentences(self, sentences):
+        """
+        Adds the semantics nodes of lxml sentences to them, and returns
+        the list of error messages.
+        """
+        errors = []
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            for sentence, sem_nodes in semparse.semantic_parse_sentences(
+                sentences, executor=self.executor, error_handler=errors.append):
+                sentence.extend(sem_nodes)
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+        return errors
+
+def sentence_from_json(sentence_json):
+    """
+    Returns an lxml <sentence> node from a dictionary of the form:
+
+      {"id": "s0",
+       "tokens": [{"id": "t0_0", "surf": "A", "base": "a", "pos": "DT"}, ...],
+       "ccg": [{"id": "s0_ccg0", "root": "s0_sp0",
+                "spans": [{"id": "s0_sp0", "category": "S[dcl=true]",
+                           "rule": "ba", "child": "s0_sp1 s0_sp2"}, ...]},
+               ...]}
+
+    Other keys of the sentence (e.g. "gold_tree") are XML attributes.
+    """
+    sentence = etree.Element('sentence')
+    for name, value in sentence_json.items():
+        if name not in ('tokens', 'ccg'):
+            sentence.set(name, str(value))
+    tokens = etree.SubElement(sentence, 'tokens')
+    for token in sentence_json.get('tokens', []):
+        etree.SubElement(tokens, 'token', get_xml_attributes(token))
+    for ccg_json in sentence_json.get('ccg', []):
+        ccg = etree.SubElement(sentence, 'ccg', get_xml_attributes(
+            dict((k, v) for k, v in ccg_json.items() if k != 'spans')))
+        for span in ccg_json.get('spans', []):
+            etree.SubElement(ccg, 'span', get_xml_attributes(span))
+    return sentence
+
+def sentence_to_json(sentence):
+    """
+    Returns a dictionary with the attributes of an lxml <sentence> node and
+    its semantics, of the form:
+
+      {"id": "s0",
+       "semantics": [{"status": "success", "ccg_id": "s0_ccg0",
+                      "root": "s0_sp0",
+                      "spans": [{"id": "s0_sp0", "sem": "...", ...}, ...]},
+                     ...]}
+    """
+    sentence_json = dict(sentence.attrib)
+    sentence_json['semantics'] = []
+    for sem_node in sentence.iterfind('./semantics'):
+        sem_json = dict(sem_node.attrib)
+        sem_json['spans'] = [dict(span.attrib) for span in sem_node]
+        sentence_json['semantics'].append(sem_json)
+    return sentence_json
+
+def get_xml_attributes(dictionary):
+    return dict((name, str(value)) for name, value in dictionary.items())
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers the requests of a connection, one per line.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(self.server.service.handle_line(line))
+            self.wfile.flush()
+
+class SemanticParsingServer(socketserver.ThreadingMixIn,
+                            socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, service):
+        self.service = service
+        remove_stale_socket(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+
+def remove_stale_socket(socket_path):
+    """
+    Removes the file socket_path if no service is listening on it.
+    """
+    if not os.path.exists(socket_path):
+        return
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except socket.error:
+        os.remove(socket_path)
+    else:
+        raise ValueError('A service is already listening on {0}'.format(socket_path))
+    finally:
+        connection.close()
+
+def serve_stdio(service, infile, outfile):
+    """
+    Answers the requests read from infile, one per line, in outfile.
+    """
+    for line in infile:
+        if not line.strip():
+            continue
+        outfile.write(service.handle_line(line))
+        outfile.flush()
+
+def main(args = None):
+    DESCRIPTION=textwrap.dedent("""\
+            Semantic parsing service, which loads the semantic templates once
+            and answers requests with CCG trees (in XML or JSON) over a Unix
+            domain socket, or over stdin/stdout if --stdio is given.
+            Requests and responses are JSON objects, one per line.
+            semparse_client.py is a drop-in replacement for semparse.py
+            that uses the service:
+
+              python scripts/semparse_server.py templates.yaml --socket /tmp/semparse.sock &
+              python scripts/semparse_client.py sentences.xml templates.yaml \\
+                sentences.sem.xml --socket /tmp/semparse.sock
+      """)
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=DESCRIPTION)
+    parser.add_argument("templates")
+    parser.add_argument("--socket", nargs='?', type=str, default="",
+        help="Unix domain socket where requests are received.")
+    parser.add_argument("--stdio", action="store_true", default=False,
+        help="Receive requests from stdin and write responses to stdout.")
+    parser.add_argument("--arbi-types", action="store_true", default=False)
+    parser.add_argument("--gold_trees", action="store_true", default=True)
+    parser.add_argument("--nbest", nargs='?', type=int, default="0")
+    parser.add_argument("--ncores", nargs='?', type=int, default="3",
+        help="Number of cores for multiprocessing.")
+    parser.add_argument("--reducer", default="nltk", choices=sorted(kReducers),
+        help="Implementation of beta reduction.")
+    parser.set_defaults(profile="", profile_attributes=False)
+    ARGS = parser.parse_args(args)
+
+    if not os.path.exists(ARGS.templates):
+        print('File does not exist: {0}'.format(ARGS.templates))
+        sys.exit(1)
+    if bool(ARGS.socket) == ARGS.stdio:
+        print('Specify either --socket or --stdio')
+        parser.print_help(file=sys.stderr)
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    service = SemanticParsingService(ARGS)
+    try:
+        if ARGS.stdio:
+            serve_stdio(service, sys.stdin.buffer, sys.stdout.buffer)
+        else:
+            server = SemanticParsingServer(ARGS.socket, service)
+            # Remove the socket also when the service is terminated.
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                os.remove(ARGS.socket)
+    finally:
+        service.close()
+
+if __name__ == '__main__':
+    main()
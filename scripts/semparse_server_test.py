@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2015 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lxml import etree
+
+from logic_parser import lexpr
+from semparse_client import get_service_settings
+from semparse_client import send_request
+from semparse_client import ServiceError
+from semparse_server import SemanticParsingServer
+from semparse_server import SemanticParsingService
+from semparse_server import sentence_from_json
+from semparse_server import sentence_to_json
+
+class SemanticParsingServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        templates_str = r"""
+- category: NP
+  semantics: \E F.exists x.(E(x) & F(x))
+- category: S\NP
+  semantics: \E Q.Q(E)
+"""
+        self.templates = os.path.join(self.directory, 'templates.yaml')
+        with open(self.templates, 'w') as fout:
+            fout.write(templates_str)
+        self.ccg_str = r"""<root><document><sentences>
+      <sentence id="s0">
+        <tokens>
+          <token base="dog" pos="NNS" surf="dogs" id="t0_0"/>
+          <token base="walk" pos="VBP" surf="walk" id="t0_1"/>
+        </tokens>
+        <ccg root="sp0" id="s0_ccg0">
+          <span category="S" rule="ba" child="sp1 sp2" id="sp0"/>
+          <span terminal="t0_0" category="NP" id="sp1"/>
+          <span terminal="t0_1" category="S\NP" id="sp2"/>
+        </ccg>
+      </sentence>
+    </sentences></document></root>"""
+        args = argparse.Namespace(
+            templates=self.templates, arbi_types=False, gold_trees=True,
+            nbest=0, ncores=1, reducer='nltk', profile='',
+            profile_attributes=False)
+        self.service = SemanticParsingService(args)
+        self.expected_semantics = lexpr(r'exists x.(_dog(x) & _walk(x))')
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def test_ccg_xml(self):
+        response = self.service.handle({'id' : 3, 'ccg' : self.ccg_str})
+        self.assertEqual(3, response['id'])
+        self.assertEqual([], response['errors'])
+        root = etree.fromstring(response['sem'].encode('utf-8'))
+        semantics = root.xpath('.//semantics')
+        self.assertEqual(1, len(semantics))
+        self.assertEqual('success', semantics[0].get('status'))
+        self.assertEqual(
+            self.expected_semantics, lexpr(semantics[0][0].get('sem')))
+
+    def test_json_sentences(self):
+        sentence = etree.fromstring(self.ccg_str).find('.//sentence')
+        sentence_json = {
+            'id' : 's0',
+            'tokens' : [dict(t.attrib) for t in sentence.find('./tokens')],
+            'ccg' : [{'id' : 's0_ccg0', 'root' : 'sp0',
+                      'spans' : [dict(s.attrib) for s in sentence.find('./ccg')]}]}
+        response = self.service.handle({'sentences' : [sentence_json]})
+        sentences = response['sentences']
+        self.assertEqual(1, len(sentences))
+        self.assertEqual('s0', sentences[0]['id'])
+        semantics = sentences[0]['semantics'][0]
+        self.assertEqual('success', semantics['status'])
+        self.assertEqual('sp0', semantics['spans'][0]['id'])
+        self.assertEqual(
+            self.expected_semantics, lexpr(semantics['spans'][0]['sem']))
+
+    def test_settings_mismatch(self):
+        settings = get_service_settings(self.templates, nbest=1)
+        response = self.service.handle(
+            {'id' : 1, 'settings' : settings, 'ccg' : self.ccg_str})
+        self.assertIn('error', response)
+        self.assertNotIn('sem', response)
+        settings = get_service_settings(self.templates)
+        response = self.service.handle(
+            {'id' : 1, 'settings' : settings, 'ccg' : self.ccg_str})
+        self.assertNotIn('error', response)
+
+    def test_invalid_requests(self):
+        for line in [b'not json\n', b'[1, 2]\n', b'{"id": 1}\n']:
+            response = json.loads(self.service.handle_line(line).decode('utf-8'))
+            self.assertIn('error', response)
+
+    def test_socket(self):
+        socket_path = os.path.join(self.directory, 'semparse.sock')
+        server = SemanticParsingServer(socket_path, self.service)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            response = send_request(socket_path, {'ccg' : self.ccg_str})
+            self.assertIn(b'_walk', response['sem'].encode('utf-8'))
+            with self.assertRaises(ServiceError):
+                send_request(socket_path, {'id' : 1})
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+class SentenceJsonTestCase(unittest.TestCase):
+    def test_from_json(self):
+        sentence = sentence_from_json(
+            {'id' : 's0', 'gold_tree' : 1,
+             'tokens' : [{'id' : 't0_0', 'surf' : 'Dogs', 'base' : 'dog'}],
+             'ccg' : [{'id' : 'c0', 'root' : 'sp0',
+                       'spans' : [{'id' : 'sp0', 'category' : 'NP',
+                                   'terminal' : 't0_0'}]}]})
+        self.assertEqual('1', sentence.get('gold_tree'))
+        self.assertEqual(['Dogs'], sentence.xpath('./tokens/token/@surf'))
+        self.assertEqual(['sp0'], sentence.xpath('./ccg[@root="sp0"]/span/@id'))
+
+    def test_to_json(self):
+        sentence = etree.fromstring(
+            '<sentence id="s0"><tokens/><ccg/>'
+            '<semantics status="success" root="sp0">'
+            '<span id="sp0" sem="_dog"/></semantics></sentence>')
+        self.assertEqual(
+            {'id' : 's0',
+             'semantics' : [{'status' : 'success', 'root' : 'sp0',
+                             'spans' : [{'id' : 'sp0', 'sem' : '_dog'}]}]},
+            sentence_to_json(sentence))
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(SemanticParsingServiceTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(SentenceJsonTestCase)
+    suites = unittest.TestSuite([suite1, suite2])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -20,13 +20,35 @@ from collections import OrderedDict
 import itertools
 import logging
 from lxml import etree
+import os
+import signal
 import subprocess
+import threading
+import time
 
 from coq_analyzer import analyze_coq_output
+from coqtop_pool import CoqtopCancelled
+from coqtop_pool import CoqtopError
+from coqtop_pool import kCancelInterval
 from nltk2coq import normalize_interpretation
+from proof_cache import ProofResult
 from semantic_types import get_dynamic_library_from_doc
 from tactics import get_tactics
 from normalization import substitute_invalid_chars
+from profiling import PROFILER
+from profiling import span
+
+# Tactics with which the failure log of a theorem is obtained.
+kDebugTactics = 'repeat nltac_base. try substitution. Qed'
+# Parameters declared before the theorem and the debug theorem of combined
+# scripts, whose output lines separate the output of each of them.
+kVerdictMarker = 'ccg2lambda_verdict_marker'
+kDebugMarker = 'ccg2lambda_debug_marker'
+
+# Pool of coqtop sessions used by run_coq_script (see use_coqtop_pool).
+COQTOP_POOL = None
+# Cache of results of Coq scripts (see use_proof_cache).
+PROOF_CACHE = None
 
 class Theorem(object):
     """
@@ -46,6 +68,10 @@ class Theorem(object):
         self.doc = None
         self.failure_log = None
         self.timeout = 100
+        # Whether prove runs the theorem and its negation at the same time.
+        self.concurrent = False
+        # Cancellation that stops the Coq runs of the theorem (see prove_simple).
+        self.cancel = None
         self.labels = []
 
     def __repr__(self):
@@ -62,10 +88,12 @@ class Theorem(object):
         """
         Build a theorem from an XML document produced by semparse.py script.
         """
-        formulas = get_formulas_from_doc(doc)
+        with span('formula_extraction'):
+            formulas = get_formulas_from_doc(doc)
         if not formulas or len(formulas) < 2:
             return Theorem([], '', set(), '')
-        dynamic_library_str, formulas = get_dynamic_library_from_doc(doc, formulas)
+        with span('dynamic_library'):
+            dynamic_library_str, formulas = get_dynamic_library_from_doc(doc, formulas)
         premises, conclusion = formulas[:-1], formulas[-1]
         theorem = Theorem(premises, conclusion, set(), dynamic_library_str)
         theorem.doc = doc
@@ -85,6 +113,8 @@ class Theorem(object):
             self.dynamic_library_str, is_negated=is_negated)
         theorem.doc = self.doc
         theorem.timeout = self.timeout
+        theorem.concurrent = self.concurrent
+        theorem.cancel = self.cancel
         self.variations.append(theorem)
         return theorem
 
@@ -118,10 +148,8 @@ class Theorem(object):
             self.conclusion,
             self.dynamic_library_str,
             axioms=axioms)
-        current_tactics = get_tactics()
-        debug_tactics = 'repeat nltac_base. try substitution. Qed'
-        coq_script = coq_script.replace(current_tactics, debug_tactics)
-        output_lines = run_coq_script(coq_script, self.timeout)
+        coq_script = coq_script.replace(get_tactics(), kDebugTactics)
+        output_lines = run_coq_script(coq_script, self.timeout, self.cancel)
 
         if is_theorem_defined(output_lines):
             if axioms == self.axioms:
@@ -130,29 +158,74 @@ class Theorem(object):
                 self.failure_log = failure_log
             return True, failure_log
 
-        failure_log = analyze_coq_output(output_lines)
+        failure_log = get_failure_log(output_lines)
         return False, failure_log
 
-    def prove_simple(self):
-        # from pudb import set_trace; set_trace()
+    def prove_simple(self, cancel=None):
+        """
+        Runs Coq for the theorem. If cancel (or self.cancel, if cancel is
+        None) is set while Coq runs, CoqtopCancelled is raised, and the
+        inference result is None and the failure log is empty.
+        """
+        if cancel is None:
+            cancel = self.cancel
         self.coq_script = make_coq_script(
             self.premises,
             self.conclusion,
             self.dynamic_library_str,
             self.axioms)
-        self.inference_result = prove_script(self.coq_script, self.timeout)
+        # The same coqtop run decides the inference result and produces
+        # the output of the debug tactics, from which the failure log is
+        # obtained (as in prove_debug), so that to_xml does not run Coq again.
+        try:
+            output_lines = run_coq_script(
+                make_combined_coq_script(self.coq_script), self.timeout, cancel)
+        except CoqtopCancelled:
+            self.inference_result = None
+            self.failure_log = OrderedDict()
+            raise
+        except subprocess.TimeoutExpired as e:
+            # If only the debug tactics ran out of time, the inference result
+            # is kept and the failure log is empty.
+            if find_line_index(e.output or [], kDebugMarker) is None:
+                raise
+            verdict_lines, _ = split_combined_output(e.output)
+            self.inference_result = is_theorem_defined(verdict_lines)
+            self.failure_log = OrderedDict()
+            return
+        verdict_lines, debug_lines = split_combined_output(output_lines)
+        self.inference_result = is_theorem_defined(verdict_lines)
+        self.failure_log = get_failure_log(debug_lines)
         return
 
     def prove(self, abduction=None):
-        self.prove_simple()
-        self.variations.append(self)
-        if self.inference_result is False:
-            neg_theorem = self.negate()
-            neg_theorem.prove_simple()
+        if self.concurrent:
+            self.prove_concurrent()
+        else:
+            self.prove_simple()
+            self.variations.append(self)
+            if self.inference_result is False:
+                neg_theorem = self.negate()
+                neg_theorem.prove_simple()
         if abduction and self.result == 'unknown' and self.doc is not None:
             abduction.attempt(self)
         return
 
+    def prove_concurrent(self):
+        """
+        Proves the theorem and its negation at the same time, and stops the
+        negation as soon as the theorem is proved. If the negation is proved
+        first, the theorem is still proved (e.g. both are proved when the
+        premises are inconsistent), so that the result is the same as when
+        they are proved one after the other. If the theorem is proved, its
+        negation is not kept in the variations.
+        """
+        self.variations.append(self)
+        neg_theorem = self.negate()
+        prove_concurrently([self, neg_theorem])
+        if self.inference_result is True:
+            self.variations.remove(neg_theorem)
+
     def reverse(self):
         if len(self.premises) != 1:
             return None
@@ -200,7 +273,11 @@ class Theorem(object):
         for theorem in self.variations:
             t_node = etree.Element('theorem')
             ts_node.append(t_node)
-            if theorem.failure_log is None:
+            failure_log = theorem.failure_log
+            if failure_log is None:
+                # The Coq runs to obtain the failure log are not stopped by
+                # the cancellation of the proof.
+                theorem.cancel = None
                 _, failure_log = theorem.prove_debug()
             t_node.set('inference_result', theorem.result_simple)
             t_node.set('is_negated', str(theorem.is_negated))
@@ -212,6 +289,57 @@ class Theorem(object):
         return ts_node
 
 
+class Cancellation(object):
+    """
+    Signal to stop running Coq scripts (see run_coq_script), which is set
+    when set is called or when its parent Cancellation is set.
+    """
+
+    def __init__(self, parent=None):
+        self.event = threading.Event()
+        self.parent = parent
+
+    def set(self):
+        self.event.set()
+
+    def is_set(self):
+        return self.event.is_set() or \
+            (self.parent is not None and self.parent.is_set())
+
+def prove_concurrently(theorems):
+    """
+    Runs prove_simple for all theorems at the same time, each in a thread.
+    As soon as a theorem that is not negated is proved, Coq is stopped for
+    the others, whose inference_result is None and failure_log is empty.
+    Negated theorems that are proved do not stop the others. If no theorem
+    that is not negated is proved and some raised an exception (e.g.
+    subprocess.TimeoutExpired), the first one is raised. The Coq runs are also stopped when the cancel
+    attribute of the first theorem is set, in which case CoqtopCancelled
+    is raised.
+    """
+    cancel = Cancellation(theorems[0].cancel)
+    errors = []
+    def prove(theorem):
+        try:
+            theorem.prove_simple(cancel)
+        except CoqtopCancelled:
+            pass
+        except Exception as e:
+            errors.append(e)
+        else:
+            if theorem.inference_result is True and not theorem.is_negated:
+                cancel.set()
+    threads = [threading.Thread(target=PROFILER.in_current_path(prove),
+                                args=(theorem,)) for theorem in theorems]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if cancel.parent is not None and cancel.parent.is_set():
+        raise CoqtopCancelled()
+    if errors and not cancel.is_set():
+        raise errors[0]
+
 def make_parser_labels_node(labels):
     ls_node = etree.Element('parser_labels')
     for label in labels:
@@ -286,49 +414,197 @@ def make_coq_formulae(premise_interpretations, conclusion, reverse=False):
     return coq_formulae
 
 def make_coq_script(premise_interpretations, conclusion, dynamic_library = '', axioms=None):
-    # Transform these interpretations into coq format:
-    #   interpretation1 -> interpretation2 -> ... -> conclusion
-    coq_formulae = make_coq_formulae(premise_interpretations, conclusion)
-    # Input these formulae to coq and retrieve the results.
-    tactics = get_tactics()
-    coq_script = "Require Export coqlib.\n{0}\nTheorem t1: {1}. {2}.".format(
-        dynamic_library, coq_formulae, tactics)
-    if axioms is not None and len(axioms) > 0:
-        coq_script = insert_axioms_in_coq_script(axioms, coq_script)
-    coq_script = substitute_invalid_chars(coq_script, 'replacement.txt')
+    with span('coq_script'):
+        # Transform these interpretations into coq format:
+        #   interpretation1 -> interpretation2 -> ... -> conclusion
+        coq_formulae = make_coq_formulae(premise_interpretations, conclusion)
+        # Input these formulae to coq and retrieve the results.
+        tactics = get_tactics()
+        coq_script = "Require Export coqlib.\n{0}\nTheorem t1: {1}. {2}.".format(
+            dynamic_library, coq_formulae, tactics)
+        if axioms is not None and len(axioms) > 0:
+            coq_script = insert_axioms_in_coq_script(axioms, coq_script)
+        coq_script = substitute_invalid_chars(coq_script, 'replacement.txt')
     return coq_script
 
+def make_combined_coq_script(coq_script):
+    """
+    Returns a script that runs the theorem of coq_script and then, from
+    the same environment, the theorem with the debug tactics of prove_debug.
+    The output of each part follows the line where kVerdictMarker or
+    kDebugMarker is declared (see split_combined_output).
+    """
+    coq_script_lines = coq_script.split('\n')
+    theorem_line = get_theorem_line(coq_script_lines)
+    theorem = '\n'.join(coq_script_lines[theorem_line:])
+    return '\n'.join(coq_script_lines[:theorem_line] + [
+        'Parameter {0} : Prop.'.format(kVerdictMarker),
+        theorem,
+        'Abort All.',
+        'Reset {0}.'.format(kVerdictMarker),
+        'Parameter {0} : Prop.'.format(kDebugMarker),
+        theorem.replace(get_tactics(), kDebugTactics)])
+
+def split_combined_output(output_lines):
+    """
+    Returns the output lines of the theorem and the output lines of the
+    debug theorem of a script made by make_combined_coq_script, as if they
+    were run separately. If the markers are missing (e.g. coqtop failed),
+    both are output_lines.
+    """
+    verdict_index = find_line_index(output_lines, kVerdictMarker)
+    debug_index = find_line_index(output_lines, kDebugMarker)
+    if verdict_index is None or debug_index is None:
+        return output_lines, output_lines
+    verdict_lines = output_lines[:verdict_index] + \
+        output_lines[verdict_index + 1:debug_index]
+    debug_lines = output_lines[:verdict_index] + output_lines[debug_index + 1:]
+    return verdict_lines, debug_lines
+
+def find_line_index(lines, text):
+    for i, line in enumerate(lines):
+        if text in line:
+            return i
+    return None
+
+def get_failure_log(output_lines):
+    """
+    Returns the failure log of the output of the debug tactics, which is
+    empty if they proved the theorem.
+    """
+    if is_theorem_defined(output_lines):
+        return OrderedDict()
+    with span('failure_analysis'):
+        return analyze_coq_output(output_lines)
+
 def prove_script(coq_script, timeout=100):
     output_lines = run_coq_script(coq_script, timeout)
     return is_theorem_defined(output_lines)
 
-def run_coq_script(coq_script, timeout=100):
+def run_coq_script(coq_script, timeout=100, cancel=None):
     """
     Receives coq script of the form:
       Require Export coqlib.
       Parameter ...
       Parameter ...
       Theorem t1 ... <tactics>. Qed.
-    Returns the output lines.
+    Returns the output lines. If cancel (e.g. a threading.Event or a
+    Cancellation) is set while Coq runs, coqtop is killed and
+    CoqtopCancelled is raised. If Coq does not finish within timeout
+    seconds, subprocess.TimeoutExpired is raised, with the output lines
+    printed until then as its output attribute.
     """
     coq_script = substitute_invalid_chars(coq_script, 'replacement.txt')
+    if PROOF_CACHE is not None:
+        result = PROOF_CACHE.get(coq_script, timeout)
+        if result is not None:
+            if result.timed_out:
+                raise subprocess.TimeoutExpired(
+                    ('coqtop',), timeout, result.output_lines)
+            return result.output_lines
+    start = time.time()
     try:
-        ps = subprocess.Popen(('echo', coq_script), stdout=subprocess.PIPE)
-        output = subprocess.check_output(
-            ('coqtop',),
-            stdin=ps.stdout,
-            stderr=subprocess.STDOUT,
-            timeout=timeout)
-        ps.wait()
-    except subprocess.CalledProcessError as e:
+        with span('coqtop'):
+            output_lines = run_coqtop(coq_script, timeout, cancel)
+    except subprocess.TimeoutExpired as e:
+        output_lines = get_output_lines(e.output)
+        if PROOF_CACHE is not None:
+            PROOF_CACHE.put(coq_script, ProofResult(
+                False, output_lines, time.time() - start, timeout))
+        raise subprocess.TimeoutExpired(('coqtop',), timeout, output_lines)
+    except (subprocess.CalledProcessError, CoqtopError) as e:
         logging.error(
             'Error when running the following script:\n{0}\nMessage was: {1}'.format(
             coq_script, e))
         return []
+    if PROOF_CACHE is not None:
+        # The verdict of combined scripts is the one of the theorem, not of
+        # the debug theorem.
+        verdict_lines, _ = split_combined_output(output_lines)
+        PROOF_CACHE.put(coq_script, ProofResult(
+            is_theorem_defined(verdict_lines), output_lines, time.time() - start))
+    return output_lines
+
+def run_coqtop(coq_script, timeout=100, cancel=None):
+    """
+    Runs coq_script in a session of the coqtop pool, if any, or in a new
+    coqtop process, and returns the output lines.
+    """
+    if COQTOP_POOL is not None:
+        return COQTOP_POOL.run(coq_script, timeout, cancel)
+    # coqtop runs in its own process group so that it can be killed
+    # together with any process it starts.
+    process = subprocess.Popen(
+        ('coqtop',), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, start_new_session=True)
+    deadline = time.time() + timeout
+    script = (coq_script + '\n').encode('utf-8')
+    while True:
+        remaining = deadline - time.time()
+        if cancel is not None:
+            remaining = min(remaining, kCancelInterval)
+        try:
+            output, _ = process.communicate(script, timeout=max(remaining, 0))
+            break
+        except subprocess.TimeoutExpired:
+            # The script is only sent in the first call.
+            script = None
+            if cancel is not None and cancel.is_set():
+                kill_process_group(process)
+                raise CoqtopCancelled()
+            if time.time() >= deadline:
+                output = kill_process_group(process)
+                raise subprocess.TimeoutExpired(('coqtop',), timeout, output)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, ('coqtop',), output)
     output_lines = [
         str(line).strip() for line in output.decode('utf-8').split('\n')]
     return output_lines
 
+def get_output_lines(output):
+    """
+    Returns the lines of output (bytes printed by coqtop before it was
+    stopped, or None).
+    """
+    if output is None:
+        return []
+    return [line.strip() for line in output.decode('utf-8', 'replace').split('\n')]
+
+def kill_process_group(process):
+    """
+    Kills the process group of process and returns what it printed.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    output, _ = process.communicate()
+    return output
+
+def use_coqtop_pool(pool):
+    """
+    Makes run_coq_script run scripts in the long-lived coqtop sessions of
+    pool (a CoqtopPool), instead of starting a coqtop process per script.
+    If pool is None, a coqtop process is started per script.
+    The sessions of the pool that was used before are stopped.
+    """
+    global COQTOP_POOL
+    if COQTOP_POOL is not None and COQTOP_POOL is not pool:
+        COQTOP_POOL.close()
+    COQTOP_POOL = pool
+
+def use_proof_cache(cache):
+    """
+    Makes run_coq_script look up the results of scripts in cache (a
+    ProofCache) before running Coq, and store them there afterwards.
+    If cache is None, no cache is used. The cache that was used before
+    is closed.
+    """
+    global PROOF_CACHE
+    if PROOF_CACHE is not None and PROOF_CACHE is not cache:
+        PROOF_CACHE.close()
+    PROOF_CACHE = cache
+
 # Given a string reprsenting the logical interpretation of the conclusion,
 # it returns a string with the negated conclusion.
 def negate_conclusion(conclusion):
@@ -376,12 +652,20 @@ class MasterTheorem(Theorem):
     theorems and build an ensemble of judgements.
     """
 
-    def __init__(self, theorems=None):
+    def __init__(self, theorems=None, candidates=None):
+        # Theorems that were built (and possibly proved), in order.
         self.theorems = [] if theorems is None else theorems
+        # Iterator of the theorems that are not built yet.
+        self.candidates = iter(()) if candidates is None else candidates
         self.doc = None
         self.inference_result = None
         self.failure_log = None
         self.timeout = 100
+        # Maximum number of theorems that are proved at the same time.
+        self.max_in_flight = 1
+        # Maximum time (in seconds) to prove all theorems, if any.
+        self.deadline = None
+        self.lock = threading.Lock()
 
     def __repr__(self):
         return '\n'.join(t.coq_script for t in self.theorems)
@@ -396,32 +680,90 @@ class MasterTheorem(Theorem):
     def from_doc(doc, args=None):
         """
         Build multiple theorems from an XML document produced by semparse.py script.
+        Theorems are built lazily, when they are going to be proved.
         """
         use_gold_trees = False if args is None else args.gold_trees
         timeout = 100 if args is None else args.timeout
-        theorems = []
-        for semantics in generate_semantics_from_doc(doc, 100, use_gold_trees):
-            formulas = [sem.xpath('./span[1]/@sem')[0] for sem in semantics]
-            assert formulas and len(formulas) > 1
-            dynamic_library_str, formulas = get_dynamic_library_from_doc(doc, semantics)
-            premises, conclusion = formulas[:-1], formulas[-1]
-            theorem = Theorem(premises, conclusion, set(), dynamic_library_str)
-            labels = [(s.get('ccg_id', None), s.get('ccg_parser', None)) for s in semantics]
-            theorem.labels = labels
-            theorem.doc = doc
-            theorem.timeout = timeout
-            theorems.append(theorem)
-        master_theorem = MasterTheorem(theorems)
+        concurrent = False if args is None else args.concurrent_negation
+        semantics_lists = generate_semantics_from_doc(doc, 100, use_gold_trees)
+        master_theorem = MasterTheorem(candidates=make_theorems(
+            doc, semantics_lists, timeout, concurrent))
         master_theorem.timeout = timeout
+        if args is not None:
+            master_theorem.max_in_flight = args.theorems_in_flight
+            master_theorem.deadline = args.doc_timeout or None
         return master_theorem
 
+    def next_theorem(self):
+        """
+        Builds the next candidate theorem and adds it to self.theorems.
+        Returns None if there are no more candidates.
+        """
+        with self.lock:
+            theorem = next(self.candidates, None)
+            if theorem is not None:
+                self.theorems.append(theorem)
+            return theorem
+
     def prove(self, abduction=None):
-        for theorem in self.theorems:
+        if self.max_in_flight > 1 or self.deadline is not None:
+            self.prove_concurrent(abduction)
+            return
+        while True:
+            theorem = self.next_theorem()
+            if theorem is None:
+                break
             theorem.prove(abduction)
             if theorem.result != 'unknown':
                 break
         return
 
+    def prove_concurrent(self, abduction=None):
+        """
+        Proves up to max_in_flight theorems at the same time, each in a
+        thread. As soon as one of them has a result other than "unknown",
+        or the deadline is reached, no more theorems are built and Coq is
+        stopped for those that are being proved. If no theorem has a result
+        and some raised an exception, the first one is raised, and
+        subprocess.TimeoutExpired is raised if the deadline was reached.
+        """
+        cancel = Cancellation()
+        errors = []
+        def prove():
+            while not cancel.is_set() and not errors:
+                theorem = self.next_theorem()
+                if theorem is None:
+                    return
+                theorem.cancel = cancel
+                try:
+                    theorem.prove(abduction)
+                except CoqtopCancelled:
+                    continue
+                except Exception as e:
+                    # Theorems that are being proved still finish.
+                    errors.append(e)
+                    return
+                if theorem.result != 'unknown':
+                    cancel.set()
+        timer = None
+        if self.deadline is not None:
+            timer = threading.Timer(self.deadline, cancel.set)
+            timer.start()
+        threads = [threading.Thread(target=PROFILER.in_current_path(prove))
+                   for _ in range(max(1, self.max_in_flight))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if timer is not None:
+            timer.cancel()
+        if self.result != 'unknown':
+            return
+        if errors:
+            raise errors[0]
+        if cancel.is_set():
+            raise subprocess.TimeoutExpired(('coqtop',), self.deadline)
+
     @property
     def result(self):
         for theorem in self.theorems:
@@ -452,6 +794,27 @@ class MasterTheorem(Theorem):
         return mt_node
 
 
+def make_theorems(doc, semantics_lists, timeout=100, concurrent=False):
+    """
+    Yields a theorem for each list of <semantics> nodes (one per sentence)
+    of doc, whose dynamic library is only computed when it is needed.
+    """
+    for semantics in semantics_lists:
+        with span('formula_extraction'):
+            formulas = [sem.xpath('./span[1]/@sem')[0] for sem in semantics]
+        assert formulas and len(formulas) > 1
+        with span('dynamic_library'):
+            dynamic_library_str, formulas = \
+                get_dynamic_library_from_doc(doc, semantics)
+        premises, conclusion = formulas[:-1], formulas[-1]
+        theorem = Theorem(premises, conclusion, set(), dynamic_library_str)
+        labels = [(s.get('ccg_id', None), s.get('ccg_parser', None)) for s in semantics]
+        theorem.labels = labels
+        theorem.doc = doc
+        theorem.timeout = timeout
+        theorem.concurrent = concurrent
+        yield theorem
+
 def generate_semantics_from_doc(doc, max_gen=1, use_gold_trees=False):
     """
     Returns string representations of logical formulas,
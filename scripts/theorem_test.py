@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Pascual Martinez-Gomez
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import OrderedDict
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from abduction_tools import try_abduction
+from coqtop_pool import CoqtopPool
+from logic_parser import lexpr
+from proof_cache import ProofCache
+from theorem import make_combined_coq_script
+from theorem import MasterTheorem
+from theorem import Theorem
+from theorem import use_coqtop_pool
+from theorem import use_proof_cache
+
+# Imitates coqtop for theorems whose conclusion names what happens to them:
+# "proved" conclusions are proved (but not their negation), the debug
+# tactics run for a long time on "hang" conclusions, the negation of
+# "slow_negation" conclusions runs for a long time, "late" conclusions
+# take one second (only the theorem and not its negation, for "late_theorem")
+# both "inconsistent" conclusions and their negation are proved, and
+# "debug_only" conclusions are only proved by the debug tactics.
+kFakeCoqtop = r"""
+import sys
+import time
+for line in sys.stdin:
+    line = line.strip()
+    if line.startswith('Fail Check '):
+        print('The command has indeed failed with message:')
+        print('=> Error: The reference {0} was not found'.format(line[11:-1]))
+    elif line.startswith('Parameter '):
+        print('{0} is declared'.format(line.split()[1]))
+    elif line.startswith('Theorem '):
+        is_debug = 'repeat nltac_base' in line
+        is_negated = '(not ' in line
+        if 'late' in line and not (is_negated and 'late_theorem' in line):
+            time.sleep(1)
+        if is_debug and 'hang' in line:
+            time.sleep(10)
+        elif is_debug and 'debug_only' in line:
+            print('t1 is defined')
+        elif is_negated and 'slow_negation' in line:
+            time.sleep(10)
+        elif ('proved' in line and not is_negated) or 'inconsistent' in line:
+            print('t1 is defined')
+    sys.stdout.flush()
+"""
+
+class FakeCoqtopTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        coqtop = os.path.join(self.directory, 'coqtop.py')
+        with open(coqtop, 'w') as fout:
+            fout.write(kFakeCoqtop)
+        use_coqtop_pool(CoqtopPool(1, (sys.executable, coqtop)))
+
+    def tearDown(self):
+        use_proof_cache(None)
+        use_coqtop_pool(None)
+        shutil.rmtree(self.directory)
+
+    def make_theorem(self, conclusion, timeout=1):
+        theorem = Theorem([lexpr('_dog')], lexpr(conclusion))
+        theorem.timeout = timeout
+        return theorem
+
+class ProveSimpleTestCase(FakeCoqtopTestCase):
+    def test_proved(self):
+        theorem = self.make_theorem('_proved')
+        theorem.prove_simple()
+        self.assertTrue(theorem.inference_result)
+        self.assertEqual(OrderedDict(), theorem.failure_log)
+
+    def test_debug_timeout(self):
+        # The theorem is proved, but the debug tactics run out of time.
+        theorem = self.make_theorem('_proved_hang')
+        start = time.time()
+        theorem.prove_simple()
+        self.assertLess(time.time() - start, 5)
+        self.assertTrue(theorem.inference_result)
+        self.assertEqual(OrderedDict(), theorem.failure_log)
+        self.assertEqual('yes', theorem.result_simple)
+
+    def test_debug_timeout_cached(self):
+        use_proof_cache(ProofCache(os.path.join(self.directory, 'cache'), b''))
+        self.make_theorem('_proved_hang').prove_simple()
+        theorem = self.make_theorem('_proved_hang')
+        start = time.time()
+        theorem.prove_simple()
+        self.assertLess(time.time() - start, 0.5)
+        self.assertTrue(theorem.inference_result)
+        self.assertEqual(OrderedDict(), theorem.failure_log)
+
+    def test_cached_verdict(self):
+        cache = ProofCache(os.path.join(self.directory, 'cache'), b'')
+        use_proof_cache(cache)
+        theorem = self.make_theorem('_debug_only')
+        theorem.prove_simple()
+        self.assertFalse(theorem.inference_result)
+        self.assertEqual(OrderedDict(), theorem.failure_log)
+        result = cache.get(make_combined_coq_script(theorem.coq_script), 1)
+        self.assertFalse(result.verdict)
+
+class ProveConcurrentTestCase(FakeCoqtopTestCase):
+    def test_proved(self):
+        theorem = self.make_theorem('_proved', 20)
+        theorem.concurrent = True
+        theorem.prove()
+        self.assertEqual('yes', theorem.result)
+        self.assertEqual([theorem], theorem.variations)
+
+    def test_unknown(self):
+        theorem = self.make_theorem('_cat_late_theorem', 20)
+        theorem.concurrent = True
+        theorem.prove()
+        self.assertEqual('unknown', theorem.result)
+        self.assertFalse(theorem.inference_result)
+        self.assertEqual(2, len(theorem.variations))
+
+    def test_inconsistent_premises(self):
+        # The negation is proved first, but the result is the one of the
+        # theorem, as when they are proved one after the other.
+        theorem = self.make_theorem('_inconsistent_late_theorem', 20)
+        theorem.concurrent = True
+        theorem.prove()
+        self.assertEqual('yes', theorem.result)
+        self.assertEqual([theorem], theorem.variations)
+        self.assertEqual(OrderedDict(), theorem.failure_log)
+
+class MasterTheoremTestCase(FakeCoqtopTestCase):
+    def test_cancelled_negation(self):
+        # The negation of the first theorem is stopped when the second
+        # theorem is proved.
+        theorems = [self.make_theorem('_slow_negation', 20),
+                    self.make_theorem('_proved_late', 20)]
+        master_theorem = MasterTheorem(candidates=iter(theorems))
+        master_theorem.max_in_flight = 2
+        start = time.time()
+        master_theorem.prove()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual('yes', master_theorem.result)
+        negated_theorem = theorems[0].variations[1]
+        self.assertTrue(negated_theorem.is_negated)
+        self.assertIsNone(negated_theorem.inference_result)
+        self.assertEqual(OrderedDict(), negated_theorem.failure_log)
+        theorem_nodes = master_theorem.to_xml().findall('./theorems/theorem')
+        self.assertEqual(['unknown', 'unknown', 'yes'],
+                         [t.get('inference_result') for t in theorem_nodes])
+        self.assertLess(time.time() - start, 5)
+
+class TryAbductionTestCase(FakeCoqtopTestCase):
+    def test_failure_log_reused(self):
+        cache = ProofCache(os.path.join(self.directory, 'cache'), b'')
+        use_proof_cache(cache)
+        theorem = self.make_theorem('_cat')
+        theorem.prove_simple()
+        self.assertFalse(theorem.inference_result)
+        self.assertEqual(1, cache.misses)
+        # The debug tactics do not run again, and the abduction theorem
+        # (without new axioms) is the same as the theorem.
+        abduction_theorem = try_abduction(theorem)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(theorem.failure_log, abduction_theorem.failure_log)
+
+if __name__ == '__main__':
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(ProveSimpleTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(ProveConcurrentTestCase)
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(MasterTheoremTestCase)
+    suite4 = unittest.TestLoader().loadTestsFromTestCase(TryAbductionTestCase)
+    suites = unittest.TestSuite([suite1, suite2, suite3, suite4])
+    unittest.TextTestRunner(verbosity=2).run(suites)
@@ -15,15 +15,60 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+from collections import OrderedDict
 import logging
 import time
 
+from profiling import span
+
 def time_count(fn):
-  # Funtion wrapper used to measure time consumption
+  # Funtion wrapper used to measure time consumption.
+  # Calls are also recorded as profiling spans (see profiling.py).
   def _wrapper(*args, **kwargs):
-    start = time.clock()
-    returns = fn(*args, **kwargs)
-    logging.debug("[time_count]: %s took %fs" % (fn.__name__, time.clock() - start))
+    start = time.perf_counter()
+    with span(fn.__name__):
+      returns = fn(*args, **kwargs)
+    logging.debug("[time_count]: %s took %fs" % (fn.__name__, time.perf_counter() - start))
     return returns
   return _wrapper
 
+
+class LRUCache(object):
+  """
+  Dictionary bounded to maxsize entries, that evicts the least recently
+  used entry when full. It counts hits and misses to help sizing it.
+  """
+
+  def __init__(self, maxsize=65536):
+    self.maxsize = maxsize
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __repr__(self):
+    return 'LRUCache(hits={0}, misses={1}, size={2}, maxsize={3})'.format(
+      self.hits, self.misses, len(self.entries), self.maxsize)
+
+  def get(self, key, default=None):
+    try:
+      value = self.entries[key]
+    except KeyError:
+      self.misses += 1
+      return default
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    self.entries[key] = value
+    self.entries.move_to_end(key)
+    if len(self.entries) > self.maxsize:
+      self.entries.popitem(last=False)
+
+  def clear(self):
+    self.entries.clear()
+    self.hits = 0
+    self.misses = 0